@@ -0,0 +1,857 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Performance benchmarks for Contemply.
+
+Usage:
+
+    python benchmark.py [benchmark ...]
+
+Runs all benchmarks if no name is given.
+"""
+
+import contextlib
+import glob
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+
+root = os.path.dirname(os.path.abspath(__file__))
+
+try:
+    import contemply
+except ModuleNotFoundError:
+    sys.path.insert(0, (os.path.join(root, 'src')))
+
+    import contemply
+
+import contemply.cli as cli
+import contemply.functions
+from contemply.budget import Budget
+from contemply.cache import CompileCache
+from contemply.checker import check_files
+from contemply.compiler import BACKENDS, Compiler
+from contemply.frontend import TemplateParser
+from contemply.incremental import IncrementalParser
+from contemply.inference import infer_types
+from contemply.interpreter import Interpreter
+from contemply.optimizer import Optimizer, merge_content_lines
+from contemply.parallel import parse_parallel
+from contemply.parser import TemplateContext, Parser
+from contemply.partial import specialize
+from contemply.scanner import scan_stream
+from contemply.tokenizer import ENGINES
+from contemply.util import check_function_args, pure
+
+
+def measure(func, repeat=5):
+    """
+    Runs func repeat times and returns the best wall time in seconds.
+    """
+    best = None
+    for i in range(0, repeat):
+        start = time.perf_counter()
+        func()
+        duration = time.perf_counter() - start
+
+        if best is None or duration < best:
+            best = duration
+
+    return best
+
+
+def load_samples():
+    samples = {}
+    for path in sorted(glob.glob(os.path.join(root, 'src', 'contemply', 'samples', '*.pytpl'))):
+        with open(path, 'r') as f:
+            samples[os.path.basename(path)] = f.read()
+
+    return samples
+
+
+def parse_only(text, engine):
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    parser = Parser(ENGINES[engine](ctx), ctx)
+    return parser.parse()
+
+
+def bench_tokenizer():
+    print('Tokenizer engines (parse only, best of 5):')
+
+    samples = load_samples()
+    # a large scaffold: all samples repeated 100 times, each one closing an open command block
+    samples['all samples x100'] = '\n'.join(
+        (text + '\n#::' if text.count('#::') % 2 else text) for text in list(samples.values()) * 100)
+
+    for name, text in samples.items():
+        timings = {}
+        for engine in ENGINES:
+            timings[engine] = measure(lambda: parse_only(text, engine))
+
+        size = len(text.encode('utf-8')) / 1024 / 1024
+        print('  {0:<20}'.format(name) + ''.join(
+            '  {0}: {1:8.2f} MB/s'.format(engine, size / t) for engine, t in timings.items()) +
+              '  (x{0:.1f})'.format(timings['classic'] / timings['regex']))
+
+
+def bench_content_lines():
+    print('Mostly static template, 50k lines (parse only, best of 5):')
+
+    lines = []
+    for i in range(0, 5000):
+        lines += ['    def method_{0}(self, value):'.format(i)] + ['        # boilerplate line'] * 8
+        lines.append('#: counter = {0}'.format(i))
+
+    text = '\n'.join(lines)
+
+    print('  str.split:    {0:8.2f} ms'.format(measure(lambda: text.split('\n')) * 1000))
+    for engine in ENGINES:
+        print('  {0:<12}  {1:8.2f} ms'.format(engine + ':', measure(lambda: parse_only(text, engine)) * 1000))
+
+
+def measure_memory(func):
+    """
+    Runs func and returns the peak of memory allocated in the meantime in bytes.
+    """
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return peak
+
+
+def bench_streaming():
+    print('Peak memory while parsing a template file (parse only):')
+
+    def parse_text(path):
+        ctx = TemplateContext()
+        with open(path, 'r') as f:
+            ctx.set_text(f.read())
+
+        Parser(ENGINES['regex'](ctx), ctx).parse()
+
+    def parse_stream(path):
+        ctx = TemplateContext()
+        with open(path, 'r') as f:
+            Parser(ENGINES['regex'](ctx), ctx).parse(scan_stream(f, ctx))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'big.pytpl')
+
+        for lines in (100000, 400000):
+            with open(path, 'w') as f:
+                for i in range(0, lines // 10):
+                    f.write('#: counter = {0}\n'.format(i))
+                    f.write('    "value_{0}": "a data heavy line of generated content",\n'.format(i) * 9)
+
+            size = os.path.getsize(path)
+            text_peak = measure_memory(lambda: parse_text(path))
+            stream_peak = measure_memory(lambda: parse_stream(path))
+
+            print('  {0:>7} lines ({1:6.1f} MB):  full text: {2:6.1f} MB   streaming: {3:6.1f} MB'.format(
+                lines, size / 1024 / 1024, text_peak / 1024 / 1024, stream_peak / 1024 / 1024))
+
+
+def synthetic_template(lines):
+    """
+    Returns a template with the given number of lines that mixes content lines, conditionals and loops.
+    """
+    text = []
+    for i in range(0, lines // 20):
+        text += [
+            '#: value_{0} = "item {0}"'.format(i),
+            '#: if value_{0} != ""'.format(i),
+            'Value: $value_{0}'.format(i),
+            '#: for item in items',
+            '    - $item (loop {0})'.format(i),
+            '#: endfor',
+            '#: endif',
+        ]
+        text += ['static content line number {0}'.format(n) for n in range(0, 13)]
+
+    return '\n'.join(text)
+
+
+def bench_ast_memory():
+    print('AST size for a synthetic 100k-line template:')
+
+    text = synthetic_template(100000)
+    ctx = TemplateContext()
+    ctx.set_text(text)
+
+    tracemalloc.start()
+    tree = Parser(ENGINES['regex'](ctx), ctx).parse()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print('  retained: {0:6.1f} MB'.format(size / 1024 / 1024))
+    print('  parse:    {0:6.1f} ms'.format(measure(lambda: parse_only(text, 'regex')) * 1000))
+
+
+def bench_cache():
+    print('Compile cache for a synthetic 20k-line template (best of 5):')
+
+    text = synthetic_template(20000)
+
+    def compile_cached(cache):
+        key = cache.make_key(text, ('regex',))
+        if cache.get(key) is None:
+            cache.put(key, parse_only(text, 'regex'))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        memory = CompileCache()
+        compile_cached(memory)
+        disk = CompileCache(directory=tmp)
+        compile_cached(disk)
+
+        print('  no cache:     {0:8.2f} ms'.format(measure(lambda: parse_only(text, 'regex')) * 1000))
+        print('  memory hit:   {0:8.2f} ms'.format(measure(lambda: compile_cached(memory)) * 1000))
+        print('  disk hit:     {0:8.2f} ms'.format(
+            measure(lambda: compile_cached(CompileCache(directory=tmp))) * 1000))
+
+
+def bench_parallel():
+    print('Scaffold with 500 top-level file blocks, 20k lines (parse only, best of 3):')
+
+    text = []
+    for i in range(0, 500):
+        text.append('#: >> "module_{0}.py"'.format(i))
+        text += synthetic_template(40).split('\n')
+        text.append('#: <<')
+
+    ctx = TemplateContext()
+    ctx.set_text('\n'.join(text))
+
+    for engine in ENGINES:
+        sequential = measure(lambda: Parser(ENGINES[engine](ctx), ctx).parse(), 3)
+        print('  {0:<8} sequential: {1:8.2f} ms'.format(engine, sequential * 1000))
+
+        for workers in sorted({2, 4, os.cpu_count()}):
+            parallel = measure(lambda: parse_parallel(ctx, engine, workers), 3)
+            print('  {0:<8} {1:>2} workers: {2:8.2f} ms  (x{3:.1f})'.format(
+                engine, workers, parallel * 1000, sequential / parallel))
+
+
+def bench_incremental():
+    print('Diagnostics after a single-line edit of a 20k-line template (best of 5):')
+
+    text = synthetic_template(20000)
+    lines = text.split('\n')
+    lines[10000] = lines[10000] + ' edited'
+    edited = '\n'.join(lines)
+
+    parser = IncrementalParser()
+    parser.update(text)
+
+    def edit():
+        parser.update(edited)
+        parser.update(text)
+
+    print('  full parse:   {0:8.2f} ms'.format(measure(lambda: parse_only(text, 'classic')) * 1000))
+    print('  incremental:  {0:8.2f} ms'.format(measure(edit) / 2 * 1000))
+
+
+def bench_check():
+    print('Checking a catalogue of 1000 templates (best of 3):')
+
+    samples = list(load_samples().values())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(0, 1000):
+            paths.append(os.path.join(tmp, 'template_{0}.pytpl'.format(i)))
+            with open(paths[-1], 'w') as f:
+                f.write(samples[i % len(samples)])
+
+        for workers in sorted({1, os.cpu_count()}):
+            duration = measure(lambda: list(check_files(paths, max_workers=workers)), 3)
+            print('  {0:>2} workers: {1:8.2f} ms'.format(workers, duration * 1000))
+
+
+def loop_template(items):
+    """
+    Returns a template that loops over a list with the given number of items.
+    """
+    return '\n'.join([
+        '#: items = []',
+        '#: i = 0',
+        '#: while i < {0}'.format(items),
+        '#: items += i',
+        '#: i = i + 1',
+        '#: endwhile',
+        '#: total = 0',
+        '#: for item in items',
+        '#: if item > 10',
+        '#: total = total + item',
+        '#: elseif item == 5',
+        '#: total = total - 1',
+        '#: else',
+        '#: total = total + 1',
+        '#: endif',
+        '#: endfor',
+        'Total: $total',
+    ])
+
+
+def bench_backends():
+    print('Running a template that loops over 9000 items (best of 5):')
+
+    ctx = TemplateContext()
+    ctx.set_text(loop_template(9000))
+    tree = Parser(ENGINES['classic'](ctx), ctx).parse()
+
+    def run(backend):
+        interpreter = BACKENDS[backend](ctx)
+        interpreter.interpret(tree)
+        return interpreter
+
+    timings = {}
+    for backend in BACKENDS:
+        timings[backend] = measure(lambda: run(backend))
+        print('  {0:<12} {1:8.2f} ms'.format(backend + ':', timings[backend] * 1000))
+
+    print('  speedup:     x{0:.1f}'.format(timings['interpreter'] / timings['compiler']))
+    print('  compiling:   {0:8.2f} ms'.format(measure(lambda: Compiler(['True', 'False', 'None']).compile(tree)) * 1000))
+
+
+def bench_optimizer():
+    print('Running a loop over 3000 items with constant conditions and empty command lines (best of 5):')
+
+    text = '\n'.join([
+        '#: items = []',
+        '#: i = 0',
+        '#: while i < 3000',
+        '#: items += i',
+        '#: i = i + 1',
+        '#: endwhile',
+        '#: for item in items',
+        '#::',
+        '',
+        'if False',
+        '    debug = item',
+        'endif',
+        '',
+        'seconds = 60 * 60',
+        'if 2 > 1',
+        '    if True',
+        '        label = "item" + "-"',
+        '    endif',
+        'endif',
+        '',
+        '#::',
+        '$label$item $seconds',
+        '#: endfor',
+    ])
+
+    def run(backend, optimize):
+        ctx = TemplateContext()
+        ctx.set_text(text)
+        tree = Parser(ENGINES['classic'](ctx), ctx).parse()
+
+        if optimize:
+            Optimizer().optimize(tree)
+
+        interpreter = BACKENDS[backend](ctx)
+        interpreter.interpret(tree)
+
+    for backend in BACKENDS:
+        plain = measure(lambda: run(backend, False))
+        optimized = measure(lambda: run(backend, True))
+        print('  {0:<12} {1:8.2f} ms, optimized {2:8.2f} ms (x{3:.2f})'.format(
+            backend + ':', plain * 1000, optimized * 1000, plain / optimized))
+
+
+def bench_loops():
+    print('Running while loops with 10000 iterations (best of 5):')
+
+    templates = {
+        'counter': [
+            '#: i = 0',
+            '#: while i < 10000',
+            '#: i = i + 1',
+            '#: endwhile',
+        ],
+        'size bound': [
+            '#: items = []',
+            '#: i = 0',
+            '#: while i < 10000',
+            '#: items += i',
+            '#: i = i + 1',
+            '#: endwhile',
+            '#: i = 0',
+            '#: while i < size(items)',
+            '#: i = i + 1',
+            '#: endwhile',
+        ],
+        'invariant': [
+            '#: name = "contemply"',
+            '#: total = 0',
+            '#: i = 0',
+            '#: while i < 10000',
+            '#: label = uppercase(name)',
+            '#: total = total + size(name)',
+            '#: i = i + 1',
+            '#: endwhile',
+        ],
+    }
+
+    for name, lines in templates.items():
+        ctx = TemplateContext()
+        ctx.set_text('\n'.join(lines))
+        plain = Parser(ENGINES['classic'](ctx), ctx).parse()
+        optimized = Optimizer().optimize(Parser(ENGINES['classic'](ctx), ctx).parse())
+
+        for backend in BACKENDS:
+            before = measure(lambda: BACKENDS[backend](ctx).interpret(plain))
+            after = measure(lambda: BACKENDS[backend](ctx).interpret(optimized))
+            print('  {0:<12} {1:<12} {2:8.2f} ms, optimized {3:8.2f} ms (x{4:.2f})'.format(
+                name + ':', backend, before * 1000, after * 1000, before / after))
+
+
+def bench_partial():
+    print('Running a scaffold with 2000 content lines, specialized for known answers (best of 5):')
+
+    lines = [
+        '#: author = ask("Author?")',
+        '#: license = choose("License?", ["MIT", "GPL"])',
+        '#: year = 2019',
+        '#: title = uppercase(license)',
+    ]
+
+    for i in range(0, 500):
+        lines += [
+            '#: if license == "MIT"',
+            'Copyright $year $author, $title',
+            '#: else',
+            'GPL $author',
+            '#: endif',
+        ]
+
+    text = '\n'.join(lines)
+    bindings = {'author': 'Jane', 'license': 'MIT'}
+
+    def run(backend, tree):
+        ctx = TemplateContext()
+        ctx.set_text(text)
+        interpreter = BACKENDS[backend](ctx)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            interpreter.interpret(tree)
+
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    plain = Parser(ENGINES['classic'](ctx), ctx).parse()
+    optimized = Optimizer().optimize(Parser(ENGINES['classic'](ctx), ctx).parse())
+    specialized = specialize(Parser(ENGINES['classic'](ctx), ctx).parse(), bindings)
+
+    # the answers of the unspecialized templates
+    cli.user_input = lambda prompt: 'Jane' if 'Author' in prompt else '1'
+
+    for backend in BACKENDS:
+        before = measure(lambda: run(backend, plain))
+        after_optimize = measure(lambda: run(backend, optimized))
+        after = measure(lambda: run(backend, specialized))
+        print('  {0:<12} {1:8.2f} ms, optimized {2:8.2f} ms, specialized {3:8.2f} ms (x{4:.2f})'.format(
+            backend + ':', before * 1000, after_optimize * 1000, after * 1000, before / after))
+
+
+def bench_inference():
+    print('Calling string functions 3 x 3000 times, with and without inferred argument types (best of 5):')
+
+    text = '\n'.join([
+        '#: name = "contemply"',
+        '#: length = 0',
+        '#: i = 0',
+        '#: while i < 3000',
+        '#: label = uppercase(name)',
+        '#: found = contains(label, "PLY")',
+        '#: length = size(label)',
+        '#: i = i + 1',
+        '#: endwhile',
+    ])
+
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    plain = Parser(ENGINES['classic'](ctx), ctx).parse()
+    inferred = infer_types(Parser(ENGINES['classic'](ctx), ctx).parse())
+
+    for backend in BACKENDS:
+        before = measure(lambda: BACKENDS[backend](ctx).interpret(plain))
+        after = measure(lambda: BACKENDS[backend](ctx).interpret(inferred))
+        print('  {0:<12} {1:8.2f} ms, inferred {2:8.2f} ms (x{3:.2f})'.format(
+            backend + ':', before * 1000, after * 1000, before / after))
+
+
+def bench_signatures():
+    print('Calling template functions 100000 times (best of 5):')
+
+    args = ['contemply', ['a', 'b'], '-']
+    definition = ['replace', 'str', 'str, list', 'str']
+    calls = {
+        'check_function_args': lambda: check_function_args(definition, args),
+        'uppercase()': lambda: contemply.functions.uppercase(args[0:1], None),
+        'replace()': lambda: contemply.functions.replace(args, None),
+        'yesno() check': lambda: check_function_args(['yesno', 'str', '*str'], args[0:1]),
+    }
+
+    for name, call in calls.items():
+        duration = measure(lambda: [call() for i in range(0, 100000)])
+        print('  {0:<20} {1:8.2f} ms ({2:.2f} us per call)'.format(name + ':', duration * 1000, duration * 10))
+
+
+def bench_dispatch():
+    print('Interpreting a loop with 3000 iterations of expressions and function calls (best of 5):')
+
+    text = '\n'.join([
+        '#: items = []',
+        '#: total = 0',
+        '#: i = 0',
+        '#: while i < 3000',
+        '#: double = i * 2',
+        '#: total = total + double',
+        '#: if total >= 100',
+        '#: items += i',
+        '#: endif',
+        '#: output("line")',
+        '#: i = i + 1',
+        '#: endwhile',
+    ])
+
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    tree = Parser(ENGINES['classic'](ctx), ctx).parse()
+
+    duration = measure(lambda: Interpreter(ctx).interpret(tree))
+    print('  interpreter: {0:8.2f} ms'.format(duration * 1000))
+
+
+def bench_symbols():
+    print('Calling functions 3 x 3000 times with 8 extension modules registered (best of 5):')
+
+    text = '\n'.join([
+        '#: i = 0',
+        '#: while i < 3000',
+        '#: a = uppercase("x")',
+        '#: b = ext_function()',
+        '#: c = size("abc")',
+        '#: i = i + 1',
+        '#: endwhile',
+    ])
+
+    for backend in BACKENDS:
+        parser = TemplateParser()
+        parser.set_output_mode(TemplateParser.OUTPUTMODE_CONSOLE)
+        parser.set_backend(backend)
+
+        for i in range(0, 8):
+            module = types.ModuleType('extension{0}'.format(i))
+            module.ext_function = lambda args, ctx: 'ext'
+
+            for j in range(0, 20):
+                setattr(module, 'helper{0}'.format(j), lambda args, ctx: None)
+
+            parser.register_lookup_module(module)
+
+        duration = measure(lambda: parser.parse(text))
+        print('  {0:<12} {1:8.2f} ms'.format(backend + ':', duration * 1000))
+
+
+def bench_memo():
+    print('Calling an expensive pure extension function 3000 times with 3 distinct arguments (best of 5):')
+
+    module = types.ModuleType('licenses')
+
+    @pure
+    def license_text(args, ctx):
+        # stands in for reading and normalizing a license file
+        words = ' '.join([args[0]] * 2000).split()
+        return ' '.join(word.capitalize() for word in words)[0:80]
+
+    module.license_text = license_text
+
+    text = '\n'.join([
+        '#: licenses = ["MIT", "GPL", "BSD"]',
+        '#: i = 0',
+        '#: while i < 1000',
+        '#: for license in licenses',
+        '#: text = license_text(license)',
+        '#: endfor',
+        '#: i = i + 1',
+        '#: endwhile',
+    ])
+
+    for backend in BACKENDS:
+        results = []
+
+        for size in (0, 1024):
+            parser = TemplateParser()
+            parser.set_output_mode(TemplateParser.OUTPUTMODE_CONSOLE)
+            parser.set_backend(backend)
+            parser.register_lookup_module(module)
+            parser.set_call_cache_size(size)
+
+            results.append(measure(lambda: parser.parse(text)))
+
+        print('  {0:<12} {1:8.2f} ms, memoized {2:8.2f} ms (x{3:.2f})'.format(
+            backend + ':', results[0] * 1000, results[1] * 1000, results[0] / results[1]))
+
+
+def bench_frames():
+    print('Reading and writing variables in loops with 3000 iterations (best of 5):')
+
+    text = '\n'.join([
+        '#: items = []',
+        '#: i = 0',
+        '#: while i < 3000',
+        '#: items += i',
+        '#: i = i + 1',
+        '#: endwhile',
+        '#: total = 0',
+        '#: for item in items',
+        '#: a = item + total',
+        '#: b = a - item',
+        '#: total = b + 1',
+        '#: endfor',
+    ])
+
+    for backend in BACKENDS:
+        parser = TemplateParser()
+        parser.set_output_mode(TemplateParser.OUTPUTMODE_CONSOLE)
+        parser.set_backend(backend)
+
+        duration = measure(lambda: parser.parse(text))
+        print('  {0:<12} {1:8.2f} ms'.format(backend + ':', duration * 1000))
+
+
+def bench_interpolation():
+    print('Rendering 4 content lines with variables in a loop with 3000 iterations (best of 5):')
+
+    text = '\n'.join([
+        '#: names = ["id", "name", "email"]',
+        '#: i = 0',
+        '#: while i < 1000',
+        '#: for field in names',
+        '    def get_$field(self):',
+        '        return self._$field  # $i of $names[2]',
+        '',
+        '    def set_$field(self, value):',
+        '#: endfor',
+        '#: i = i + 1',
+        '#: endwhile',
+    ])
+
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    tree = Parser(ENGINES['classic'](ctx), ctx).parse()
+
+    for backend, interpreter_class in BACKENDS.items():
+        duration = measure(lambda: interpreter_class(ctx).interpret(tree))
+        print('  {0:<12} {1:8.2f} ms'.format(backend + ':', duration * 1000))
+
+
+def bench_static():
+    print('Running a mostly static template, 50k lines (best of 5):')
+
+    lines = []
+    for i in range(0, 1000):
+        lines += ['#: name = "method_{0}"'.format(i), '    def $name(self, value):']
+        lines += ['        # boilerplate line {0}'.format(n) for n in range(0, 48)]
+
+    text = '\n'.join(lines)
+
+    for backend, interpreter_class in BACKENDS.items():
+        results = []
+
+        for merge in (False, True):
+            ctx = TemplateContext()
+            ctx.set_text(text)
+            tree = Parser(ENGINES['regex'](ctx), ctx).parse()
+
+            if merge:
+                merge_content_lines(tree)
+
+            results.append(measure(lambda: interpreter_class(ctx).interpret(tree)))
+
+        print('  {0:<12} {1:8.2f} ms, merged {2:8.2f} ms (x{3:.2f})'.format(
+            backend + ':', results[0] * 1000, results[1] * 1000, results[0] / results[1]))
+
+
+def bench_budget():
+    print('Running loops with 3000 iterations and output, without and with a budget (best of 5):')
+
+    text = '\n'.join([
+        '#: items = []',
+        '#: i = 0',
+        '#: while i < 3000',
+        '#: items += i',
+        '#: i = i + 1',
+        '#: endwhile',
+        '#: total = 0',
+        '#: for item in items',
+        '#: total = total + item',
+        'item $item: $total',
+        '#: endfor',
+    ])
+
+    limited = Budget(max_steps=10 ** 9, max_time=3600, max_output=10 ** 9, max_targets=100, max_value_size=10 ** 6,
+                     max_loop_runs=10 ** 6)
+
+    for backend, interpreter_class in BACKENDS.items():
+        ctx = TemplateContext()
+        ctx.set_text(text)
+        tree = Parser(ENGINES['regex'](ctx), ctx).parse()
+        results = []
+
+        for budget in (None, limited):
+            def run():
+                interpreter = interpreter_class(ctx)
+
+                if budget is not None:
+                    interpreter.set_budget(budget)
+
+                interpreter.interpret(tree)
+
+            results.append(measure(run))
+
+        print('  {0:<12} {1:8.2f} ms, all limits {2:8.2f} ms (x{3:.2f})'.format(
+            backend + ':', results[0] * 1000, results[1] * 1000, results[1] / results[0]))
+
+
+def bench_lazy():
+    print('Running a scaffold asking 40 questions, 8 of the answers are used (best of 5):')
+
+    lines = ['#: feature_{0} = yesno("Enable feature {0}?")'.format(i) for i in range(0, 8)]
+    lines += ['#: option_{0} = ask("Option {0}?")'.format(i) for i in range(0, 32)]
+
+    for i in range(0, 8):
+        lines += [
+            '#: if feature_{0}'.format(i),
+            'option $option_{0}'.format(i * 4),
+            '#: endif',
+        ]
+
+    text = '\n'.join(lines)
+    questions = []
+
+    def user_input(prompt):
+        questions.append(prompt)
+        return 'answer'
+
+    def prompt(question, default='Yes'):
+        questions.append(question)
+        return question.endswith('0?')
+
+    cli.user_input, cli.prompt = user_input, prompt
+
+    for backend in BACKENDS:
+        results = []
+
+        for lazy in (False, True):
+            parser = TemplateParser()
+            parser.set_output_mode(TemplateParser.OUTPUTMODE_CONSOLE)
+            parser.set_backend(backend)
+            parser.set_lazy(lazy)
+
+            del questions[:]
+            with contextlib.redirect_stdout(io.StringIO()):
+                duration = measure(lambda: parser.parse(text))
+
+            results.append((duration, len(questions) // 5))
+
+        print('  {0:<12} {1:8.2f} ms, {2} questions, lazy {3:8.2f} ms, {4} questions'.format(
+            backend + ':', results[0][0] * 1000, results[0][1], results[1][0] * 1000, results[1][1]))
+
+
+def bench_fragments():
+    print('Rendering 500 rows of 10 distinct kinds with a cache block (best of 5):')
+
+    text = '\n'.join([
+        '#: kinds = ["kind{0}"]'.format('", "kind'.join(str(i % 10) for i in range(0, 500))),
+        '#: fields = ["id", "name", "created", "updated", "owner", "state", "size", "parent"]',
+        '#: for kind in kinds',
+        '#: cache "row"',
+        'class $kind:',
+        '#: for field in fields',
+        '#: -> "    $field = Column(\'$kind\')"',
+        '#: if size(field) > 4',
+        '    $field.index(\'$kind\')',
+        '#: endif',
+        '#: endfor',
+        '#: endcache',
+        '#: endfor',
+    ])
+
+    def create(backend, cached):
+        parser = TemplateParser()
+        parser.set_output_mode(TemplateParser.OUTPUTMODE_CONSOLE)
+        parser.set_backend(backend)
+
+        if not cached:
+            parser.set_fragment_cache(None)
+
+        return parser
+
+    for backend in BACKENDS:
+        uncached, warm = create(backend, False), create(backend, True)
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = [measure(lambda: uncached.parse(text)),
+                       # a new cache for every run, only the first row of every kind is rendered
+                       measure(lambda: create(backend, True).parse(text)),
+                       # the cache of the previous runs is used
+                       measure(lambda: warm.parse(text))]
+
+            cold = create(backend, True)
+            cold.parse(text)
+
+        print('  {0:<12} {1:8.2f} ms, cached {2:8.2f} ms ({3:.0%} hits), cached by earlier runs {4:8.2f} ms'.format(
+            backend + ':', results[0] * 1000, results[1] * 1000, cold.get_fragment_cache().get_stats()['hit_rate'],
+            results[2] * 1000))
+
+
+BENCHMARKS = {
+    'tokenizer': bench_tokenizer,
+    'content': bench_content_lines,
+    'streaming': bench_streaming,
+    'ast-memory': bench_ast_memory,
+    'cache': bench_cache,
+    'parallel': bench_parallel,
+    'incremental': bench_incremental,
+    'check': bench_check,
+    'backends': bench_backends,
+    'optimizer': bench_optimizer,
+    'loops': bench_loops,
+    'partial': bench_partial,
+    'inference': bench_inference,
+    'signatures': bench_signatures,
+    'dispatch': bench_dispatch,
+    'symbols': bench_symbols,
+    'memo': bench_memo,
+    'frames': bench_frames,
+    'interpolation': bench_interpolation,
+    'static': bench_static,
+    'budget': bench_budget,
+    'lazy': bench_lazy,
+    'fragments': bench_fragments,
+}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(BENCHMARKS.keys())
+
+    for name in names:
+        if name not in BENCHMARKS:
+            print('Unknown benchmark: {0}'.format(name))
+            sys.exit(1)
+
+        BENCHMARKS[name]()
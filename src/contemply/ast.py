@@ -4,23 +4,32 @@
 # Copyright (C) 2019  Sean Mertiens
 # For more information on licensing see LICENSE file
 #
+from contemply.interpolation import split_variables
+
 
 class AST:
-    pass
+    # All nodes use __slots__ to keep large trees (and cached templates) small and quick to allocate
+    __slots__ = ()
 
 
 class Template(AST):
+    __slots__ = ('main_block', 'children', 'scope')
 
     def __init__(self):
         self.main_block = None
         self.children = []
+        # the variable slots, set by contemply.frames.resolve_slots
+        self.scope = None
 
 
 class Variable(AST):
+    __slots__ = ('name', 'index', 'slot')
 
     def __init__(self, name, index=None):
         self.name = name
         self.index = index
+        # the index of the variable in the frame, None for builtins and unresolved templates
+        self.slot = None
 
     def __str__(self):
         return '{0}'.format(self.name)
@@ -29,13 +38,43 @@ class Variable(AST):
         return self.__str__()
 
 
+class Constant(AST):
+    # A value computed before the template runs (e.g. by the optimizer)
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return '{0!r}'.format(self.value)
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class Invariant(AST):
+    # An expression whose value does not change while the loop it was hoisted to runs
+    __slots__ = ('expr',)
+
+    def __init__(self, expr):
+        self.expr = expr
+
+    def __str__(self):
+        return '{0}'.format(self.expr)
+
+    def __repr__(self):
+        return self.__str__()
+
+
 class String(AST):
+    __slots__ = ('value',)
 
     def __init__(self, value):
         self.value = value
 
 
 class Num(AST):
+    __slots__ = ('value',)
 
     def __init__(self, value):
         self.value = value
@@ -48,27 +87,36 @@ class Num(AST):
 
 
 class Function(AST):
+    __slots__ = ('name', 'args', 'checked')
 
-    def __init__(self, name, args):
+    def __init__(self, name, args, checked=False):
         self.name = name
         self.args = args
+        # the argument types are known to be correct, so the function is called without checking them
+        self.checked = checked
 
 
 class Assignment(AST):
+    __slots__ = ('variable', 'value', 'type', 'slot', 'lazy')
 
-    def __init__(self, variable, value, assign_type='ASSIGN'):
+    def __init__(self, variable, value, assign_type='ASSIGN', lazy=False):
         self.variable = variable
         self.value = value
         self.type = assign_type
+        self.slot = None
+        # the value is computed when the variable is read for the first time
+        self.lazy = lazy
 
 
 class ArgumentList(AST):
+    __slots__ = ('children',)
 
     def __init__(self):
         self.children = []
 
 
 class SimpleExpression(AST):
+    __slots__ = ('lval', 'op', 'rval')
 
     def __init__(self, lval, op, rval):
         self.lval = lval
@@ -83,23 +131,47 @@ class SimpleExpression(AST):
 
 
 class ContentLine(AST):
+    __slots__ = ('_content', 'segments')
 
     def __init__(self, content):
-        self.content = content
+        self._content = content
+        self.segments = split_variables(content)
+
+    @property
+    def content(self):
+        return self._content
+
+    @content.setter
+    def content(self, content):
+        # the variables are found once, when the content is set
+        self._content = content
+        self.segments = split_variables(content)
+
+
+class TextRun(AST):
+    # Consecutive content lines without variables, see contemply.optimizer.ContentMerging
+    __slots__ = ('lines',)
+
+    def __init__(self, lines):
+        self.lines = lines
 
 
 class CommandLine(AST):
+    __slots__ = ('statement',)
 
     def __init__(self, statement):
         self.statement = statement
 
 
 class Block(AST):
+    __slots__ = ('children',)
+
     def __init__(self):
         self.children = []
 
 
 class IFBlock(AST):
+    __slots__ = ('_if', '_else')
 
     def __init__(self):
         self._if = []
@@ -107,6 +179,7 @@ class IFBlock(AST):
 
 
 class If(AST):
+    __slots__ = ('condition', 'block')
 
     def __init__(self, condition, block):
         self.condition = condition
@@ -114,6 +187,7 @@ class If(AST):
 
 
 class Else(AST):
+    __slots__ = ('condition', 'lines')
 
     def __init__(self, condition):
         self.condition = condition
@@ -121,47 +195,79 @@ class Else(AST):
 
 
 class List(AST):
+    __slots__ = ('children',)
 
     def __init__(self):
         self.children = []
 
 
 class NoOp(AST):
-    pass
+    __slots__ = ()
 
 
 class Endif(AST):
-    pass
+    __slots__ = ()
 
 
 class Break(AST):
-    pass
+    __slots__ = ()
 
 
 class While(AST):
+    __slots__ = ('expr', 'block', 'invariants')
 
     def __init__(self, expr, block):
         self.expr = expr
         self.block = block
+        self.invariants = []
+
+
+class CountingWhile(While):
+    # A while loop that counts an integer variable up or down to a bound, see contemply.optimizer
+    __slots__ = ('counter', 'op', 'bound', 'step', 'slot')
+
+    def __init__(self, expr, block, counter, op, bound, step):
+        super().__init__(expr, block)
+        self.counter = counter
+        self.op = op
+        self.bound = bound
+        self.step = step
+        self.slot = None
 
 
 class Endwhile(AST):
-    pass
+    __slots__ = ()
 
 
 class For(AST):
+    __slots__ = ('listvar', 'itemvar', 'block', 'invariants')
 
     def __init__(self, listvar, itemvar, block):
         self.listvar = listvar
         self.itemvar = itemvar
         self.block = block
+        self.invariants = []
 
 
 class Endfor(AST):
-    pass
+    __slots__ = ()
+
+
+class CacheBlock(AST):
+    # A block whose output is reused for the same key and values of the variables it reads, see contemply.fragments
+    __slots__ = ('key', 'block', 'reads', 'calls', 'fingerprint')
+
+    def __init__(self, key, block):
+        self.key = key
+        self.block = block
+        # the names of the variables the block reads, the functions it calls and the hash of its statements
+        self.reads = ()
+        self.calls = ()
+        self.fingerprint = None
 
 
 class FileBlockStart(AST):
+    __slots__ = ('filename', 'create_missing_folders')
 
     def __init__(self, filename, create_missing_folders=False):
         self.filename = filename
@@ -169,10 +275,8 @@ class FileBlockStart(AST):
 
 
 class FileBlockEnd(AST):
-    pass
+    __slots__ = ()
 
 
-class OutputExpression(AST):
-
-    def __init__(self, content):
-        self.content = content
+class OutputExpression(ContentLine):
+    __slots__ = ()
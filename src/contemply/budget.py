@@ -0,0 +1,190 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Resource limits for running templates.
+
+A Budget sets the limits, a Meter measures what a running template uses and raises a ParserError as soon as a
+limit is exceeded:
+
+- steps: every block that runs counts its statements, so a loop counts the statements of its body in every
+  iteration. A run of merged static lines is a single statement.
+- time: the wall time since the template started, checked in every loop iteration. Waiting for user input counts
+  as well.
+- output: the number of characters (line breaks included) written to a single target
+- targets: the number of files a template writes, the default output is not counted
+- value size: the length of a string or list assigned to a variable, checked on every assignment
+- loop runs: the number of iterations of a single run of a loop. While loops are limited to DEFAULT_LOOP_RUNS
+  iterations by default, so an endless loop stops, for loops end with their list and are not limited by default.
+"""
+
+import sys
+import time
+
+from contemply.exceptions import ParserError
+
+# the default limit of the iterations of a while loop
+DEFAULT_LOOP_RUNS = 10000
+
+# the value of limits that are disabled, so checks are a single comparison
+UNLIMITED = sys.maxsize
+
+
+class Budget:
+    """
+    The resources a template may use while it runs. A limit of None disables the limit.
+    """
+
+    def __init__(self, max_steps=None, max_time=None, max_output=None, max_targets=None, max_value_size=None,
+                 max_loop_runs=None, max_while_runs=DEFAULT_LOOP_RUNS):
+        """
+        :param int max_steps: The maximum number of statements executed
+        :param float max_time: The maximum run time in seconds
+        :param int max_output: The maximum number of characters written to a single target
+        :param int max_targets: The maximum number of files written
+        :param int max_value_size: The maximum length of a string or list assigned to a variable
+        :param int max_loop_runs: The maximum number of iterations of a loop (for and while)
+        :param int max_while_runs: The maximum number of iterations of a while loop
+        """
+        self.max_steps = max_steps
+        self.max_time = max_time
+        self.max_output = max_output
+        self.max_targets = max_targets
+        self.max_value_size = max_value_size
+        self.max_loop_runs = max_loop_runs
+        self.max_while_runs = max_while_runs
+
+    def start(self, ctx=None):
+        """
+        Returns a new meter for a template that starts running.
+
+        :param TemplateContext ctx: The template context used for error messages
+        :rtype: Meter
+        """
+        return Meter(self, ctx)
+
+    def __repr__(self):
+        return 'Budget(max_steps={0}, max_time={1}, max_output={2}, max_targets={3}, max_value_size={4}, ' \
+               'max_loop_runs={5}, max_while_runs={6})'.format(self.max_steps, self.max_time, self.max_output,
+                                                               self.max_targets, self.max_value_size,
+                                                               self.max_loop_runs, self.max_while_runs)
+
+
+def _limit(value):
+    return UNLIMITED if value is None else value
+
+
+class Meter:
+    """
+    Measures the resources a running template uses. The interpreter and the compiled code update the counters
+    directly and call the check methods where a limit may have been exceeded.
+    """
+
+    __slots__ = ('budget', 'steps', 'max_steps', 'started', 'deadline', 'output', 'max_output', 'targets',
+                 'max_targets', 'max_value_size', 'max_loop_runs', 'max_while_runs', '_ctx')
+
+    def __init__(self, budget, ctx=None):
+        """
+        :param Budget budget: The limits
+        :param TemplateContext ctx: The template context used for error messages
+        """
+        self.budget = budget
+        self._ctx = ctx
+
+        self.steps = 0
+        self.max_steps = _limit(budget.max_steps)
+
+        self.started = time.monotonic()
+        self.deadline = self.started + budget.max_time if budget.max_time is not None else None
+
+        # characters written per target, only counted if the output is limited
+        self.output = {}
+        self.max_output = budget.max_output
+
+        self.targets = 0
+        self.max_targets = _limit(budget.max_targets)
+
+        self.max_value_size = budget.max_value_size
+        self.max_loop_runs = _limit(budget.max_loop_runs)
+        self.max_while_runs = min(self.max_loop_runs, _limit(budget.max_while_runs))
+
+    def exceeded_steps(self):
+        """
+        Raises the error for a template that executed too many statements.
+
+        :raises: ParserError
+        """
+        raise ParserError('Maximum number of steps of {0} reached.'.format(self.budget.max_steps), self._ctx)
+
+    def exceeded_loop_runs(self, limit):
+        """
+        Raises the error for a loop that ran too often.
+
+        :param int limit: The limit of the loop (max_loop_runs or max_while_runs)
+        :raises: ParserError
+        """
+        raise ParserError('Maximum loop iterations of {0} reached.'.format(limit))
+
+    def check_time(self):
+        """
+        Checks whether the template ran longer than allowed.
+
+        :raises: ParserError
+        """
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise ParserError('Maximum run time of {0} seconds reached.'.format(self.budget.max_time), self._ctx)
+
+    def add_output(self, target, size):
+        """
+        Counts characters written to a target.
+
+        :param str target: The name of the target
+        :param int size: The number of characters
+        :raises: ParserError
+        """
+        total = self.output.get(target, 0) + size
+        self.output[target] = total
+
+        if total > self.max_output:
+            raise ParserError('Maximum output size of {0} characters reached for {1}.'.format(
+                self.max_output, target), self._ctx)
+
+    def add_target(self, target):
+        """
+        Counts a new file that is written.
+
+        :param str target: The name of the target
+        :raises: ParserError
+        """
+        self.targets += 1
+
+        if self.targets > self.max_targets:
+            raise ParserError('Maximum number of output files of {0} reached with {1}.'.format(
+                self.max_targets, target), self._ctx)
+
+    def check_value(self, name, value):
+        """
+        Checks the size of a value assigned to a variable.
+
+        :param str name: The name of the variable
+        :param Any value: The value
+        :return: The value
+        :raises: ParserError
+        """
+        if isinstance(value, (str, list)) and len(value) > self.max_value_size:
+            raise ParserError('Maximum value size of {0} reached for variable {1}.'.format(
+                self.max_value_size, name), self._ctx)
+
+        return value
+
+    def get_usage(self):
+        """
+        Returns the resources used so far as a dictionary with the keys "steps", "time" (in seconds) and "targets".
+
+        :rtype: dict
+        """
+        return {'steps': self.steps, 'time': time.monotonic() - self.started, 'targets': self.targets}
@@ -0,0 +1,234 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import collections
+import contextlib
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+
+import contemply
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+# Bump this whenever the AST classes change in a way that makes older pickles unusable
+CACHE_FORMAT = 8
+
+
+@contextlib.contextmanager
+def file_lock(path, shared=False):
+    """
+    Holds an advisory lock on the given lock file while the context is active.
+    Shared locks are only available on POSIX systems, on Windows every lock is exclusive.
+
+    :param str path: Path to the lock file, it is created if it does not exist
+    :param bool shared: True to acquire a shared (read) lock
+    """
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class CompileCache:
+    """
+    Caches parsed templates (ASTs) so unchanged templates do not have to be tokenized and parsed again.
+
+    The first tier is a bounded in-process LRU. If a directory is given, ASTs are also stored on disk so
+    they can be shared between runs and processes. Disk access is guarded by a lock file, entries are written
+    atomically and unreadable entries are discarded.
+    """
+
+    # the file extension of the entries on disk
+    EXTENSION = '.ast'
+
+    def __init__(self, max_entries=64, directory=None, max_disk_entries=512):
+        """
+        :param int max_entries: Maximum number of templates kept in memory
+        :param str directory: Directory for the on-disk tier, None to disable it
+        :param int max_disk_entries: Maximum number of templates kept on disk
+        """
+        self._entries = collections.OrderedDict()
+        self._max_entries = max_entries
+        self._directory = directory
+        self._max_disk_entries = max_disk_entries
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if directory is not None and not os.path.exists(directory):
+            os.makedirs(directory)
+
+    def get_logger(self):
+        return logging.getLogger(self.__module__)
+
+    def make_key(self, source, options=()):
+        """
+        Creates a cache key for the given template source. The key also covers the Contemply version, the
+        cache format and all options that change the resulting AST (e.g. the tokenizer engine).
+
+        :param source: The template text (str) or raw file content (bytes)
+        :param tuple options: Options that influence parsing
+        :return: The cache key
+        :rtype: str
+        """
+        h = self._new_hash(options)
+        h.update(source.encode('utf-8') if isinstance(source, str) else source)
+
+        return h.hexdigest()
+
+    def make_file_key(self, filename, options=()):
+        """
+        Creates a cache key for a template file without loading the whole file into memory.
+
+        :param str filename: Path to the template file
+        :param tuple options: Options that influence parsing
+        :return: The cache key
+        :rtype: str
+        """
+        h = self._new_hash(('file',) + tuple(options))
+
+        with open(filename, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                h.update(chunk)
+
+        return h.hexdigest()
+
+    def _new_hash(self, options):
+        h = hashlib.sha256()
+        h.update('{0}|{1}|{2}|'.format(contemply.__version__, CACHE_FORMAT, '|'.join(str(o) for o in options))
+                 .encode('utf-8'))
+        return h
+
+    def get(self, key):
+        """
+        Returns the cached AST for the given key or None.
+
+        :param str key: Cache key
+        :rtype: Template
+        """
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        tree = self._load(key)
+        if tree is not None:
+            self.disk_hits += 1
+            self._remember(key, tree)
+            return tree
+
+        self.misses += 1
+        return None
+
+    def put(self, key, tree):
+        """
+        Stores an AST in the cache.
+
+        :param str key: Cache key
+        :param Template tree: The parsed template
+        """
+        self._remember(key, tree)
+        self._store(key, tree)
+
+    def clear(self):
+        """
+        Removes all entries from both tiers.
+        """
+        self._entries.clear()
+
+        if self._directory is None:
+            return
+
+        with file_lock(self._lock_file()):
+            for name in os.listdir(self._directory):
+                if name.endswith(self.EXTENSION):
+                    os.unlink(os.path.join(self._directory, name))
+
+    def _remember(self, key, tree):
+        self._entries[key] = tree
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def _lock_file(self):
+        return os.path.join(self._directory, '.lock')
+
+    def _path(self, key):
+        return os.path.join(self._directory, key + self.EXTENSION)
+
+    def _load(self, key):
+        if self._directory is None:
+            return None
+
+        path = self._path(key)
+
+        with file_lock(self._lock_file(), shared=True):
+            if not os.path.exists(path):
+                return None
+
+            try:
+                with open(path, 'rb') as f:
+                    return pickle.load(f)
+            except Exception as e:
+                self.get_logger().debug('Discarding unreadable cache entry {0}: {1}'.format(path, e))
+
+        # remove the broken entry, so it will be rebuilt
+        with file_lock(self._lock_file()):
+            if os.path.exists(path):
+                os.unlink(path)
+
+        return None
+
+    def _store(self, key, tree):
+        if self._directory is None:
+            return
+
+        try:
+            data = pickle.dumps(tree, pickle.HIGHEST_PROTOCOL)
+        except (RecursionError, pickle.PicklingError) as e:
+            # very deeply nested templates cannot be pickled, they are only cached in memory
+            self.get_logger().debug('Template not cached on disk: {0}'.format(e))
+            return
+
+        with file_lock(self._lock_file()):
+            fd, tmp = tempfile.mkstemp(dir=self._directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+
+            os.replace(tmp, self._path(key))
+            self._prune()
+
+    def _prune(self):
+        entries = [os.path.join(self._directory, name) for name in os.listdir(self._directory)
+                   if name.endswith(self.EXTENSION)]
+
+        if len(entries) <= self._max_disk_entries:
+            return
+
+        entries.sort(key=os.path.getmtime)
+        for path in entries[:len(entries) - self._max_disk_entries]:
+            os.unlink(path)
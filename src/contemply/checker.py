@@ -0,0 +1,102 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Parse-only validation of templates. Templates are never interpreted, so functions like ask() are not
+called. The parser runs in recovering mode and reports every error of a template.
+"""
+
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from contemply.parser import TemplateContext, Parser
+from contemply.tokenizer import ENGINES
+
+TEMPLATE_PATTERN = '*.pytpl'
+
+
+def find_templates(paths):
+    """
+    Returns the template files for the given paths. Directories are searched recursively for .pytpl files.
+
+    :param list paths: Paths to template files or directories
+    :return: List with the paths of all template files
+    :rtype: list
+    """
+    files = []
+
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(glob.glob(os.path.join(path, '**', TEMPLATE_PATTERN), recursive=True))
+        else:
+            files.append(path)
+
+    return files
+
+
+def check_file(path, engine='classic'):
+    """
+    Parses a single template file and returns the result as a dictionary with the keys "file", "errors"
+    and "ok". Every error is a dictionary with the keys "line", "col" (both starting at 1), "type"
+    and "message". Unexpected exceptions of the parser are reported as errors, too.
+
+    :param str path: Path to the template file
+    :param str engine: The name of the tokenizer engine
+    :return: The result of the check
+    :rtype: dict
+    """
+    try:
+        with open(path, 'r') as f:
+            text = f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        return {'file': path, 'ok': False, 'errors': [{'line': 0, 'col': 0, 'type': type(e).__name__,
+                                                       'message': str(e)}]}
+
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    ctx.set_filename(os.path.basename(path))
+
+    parser = Parser(ENGINES[engine](ctx), ctx, recover=True)
+
+    try:
+        parser.parse()
+        failure = None
+    except Exception as e:
+        # a bug in the parser must not stop the check of the other templates, it is reported for this file
+        failure = {'line': ctx.line() + 1, 'col': ctx.line_pos() + 1, 'type': type(e).__name__,
+                   'message': 'Internal error: {0}'.format(e)}
+
+    errors = [{'line': d.line + 1, 'col': d.col + 1, 'type': d.kind, 'message': d.message} for d in parser.errors]
+
+    if failure is not None:
+        errors.append(failure)
+
+    return {'file': path, 'ok': len(errors) == 0, 'errors': errors}
+
+
+def check_files(paths, engine='classic', max_workers=None):
+    """
+    Checks the given template files in a process pool and yields the results in the order of the paths.
+
+    :param list paths: Paths to template files
+    :param str engine: The name of the tokenizer engine
+    :param int max_workers: The number of worker processes, defaults to the number of CPUs. Use 1 to check
+                            all files in the current process.
+    :rtype: generator
+    """
+    workers = max_workers or os.cpu_count() or 1
+
+    if workers == 1 or len(paths) < 2:
+        for path in paths:
+            yield check_file(path, engine)
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        # send the files in batches, so the overhead per file stays small
+        chunksize = max(1, len(paths) // (workers * 8))
+        yield from pool.map(check_file, paths, [engine] * len(paths), chunksize=chunksize)
@@ -0,0 +1,644 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Python code generation backend.
+
+The Compiler turns a parsed Template into the source of a single Python function, which is compiled once
+with compile(). Statements become Python statements, expressions become Python expressions and variables
+are read and written directly in the slots of the template's frame (see contemply.frames), so no visitor has to
+be looked up while the template runs. The generated code produces exactly the same output as the Interpreter,
+including its handling of break.
+
+Node types the compiler does not know are handed to the Interpreter's visitor at run time. Templates that
+cannot be compiled (e.g. because they are nested too deeply for the Python compiler) are interpreted.
+"""
+
+import collections
+import logging
+
+from contemply.ast import *
+from contemply.exceptions import *
+from contemply.frames import UNSET
+from contemply.interpolation import split_variables
+from contemply.interpreter import Interpreter, IMMUTABLE_TYPES
+
+_OPERATORS = ('==', '<', '>', '<=', '>=', '!=', '+', '-', '/', '*')
+
+# names of the arguments of the generated function
+_ARGUMENTS = ('interp', 'ctx', 'frame', 'values', 'builtins', 'resolve', 'visit', 'consts', 'ParserError', 'index',
+              'unknown', 'store', 'meter', 'DEFAULT_TARGET', 'UNSET')
+
+
+def _index(var, name, i, ctx):
+    if isinstance(var, list):
+        return var[i]
+
+    raise ParserError('Variable "{0}" is not a list.'.format(name), ctx)
+
+
+def _unknown_variable(name, ctx):
+    raise ParserError('Unknown variable: "{0}"'.format(name), ctx)
+
+
+def _store_invariant(invariants, key, value):
+    # mutable values are created again every time, just like in the Interpreter
+    if isinstance(value, IMMUTABLE_TYPES):
+        invariants[key] = value
+
+    return value
+
+
+def _may_grow(node):
+    # whether an expression may result in a string or a list, only their size is limited by the budget
+    if type(node) is Num:
+        return False
+    elif type(node) is Constant:
+        return isinstance(node.value, (str, list))
+    elif type(node) is SimpleExpression:
+        return node.op in ('+', '*')
+
+    return True
+
+
+class CompiledTemplate:
+    """
+    A template compiled to a Python function.
+    """
+
+    def __init__(self, source, function, consts):
+        """
+        :param str source: The generated Python source
+        :param function function: The compiled template function
+        :param list consts: Nodes and values referenced by the generated code
+        """
+        self.source = source
+        self._function = function
+        self._consts = consts
+
+    def run(self, interpreter):
+        """
+        Runs the template. The output is stored in the interpreter, just like Interpreter.interpret does.
+
+        :param CompilingInterpreter interpreter: The interpreter providing context, functions and builtins
+        """
+        ctx = interpreter.get_template_context()
+        frame = interpreter.get_frame()
+
+        self._function(interpreter, ctx, frame, frame.values, interpreter.get_builtins(),
+                       interpreter.resolve_function, interpreter.visit, self._consts, ParserError, _index,
+                       _unknown_variable, _store_invariant, interpreter.get_meter(), interpreter.DEFAULT_TARGET,
+                       UNSET)
+
+
+class Compiler:
+    """
+    Generates the Python source for a Template.
+    """
+
+    # Python limits the indentation depth of a code block to 100 levels
+    MAX_INDENT = 90
+
+    def __init__(self, builtins=()):
+        """
+        :param builtins: The names of the builtin values (variables that are resolved from the builtins)
+        """
+        self._builtins = set(builtins)
+
+        self._lines = []
+        self._indent = 0
+        self._loop_depth = 0
+        self._temp = 0
+        self._consts = []
+        self._functions = {}
+        self._builtin_names = {}
+        self._invariants = {}
+        self._loop_slots = frozenset()
+        self._lazy_slots = frozenset()
+
+    def get_logger(self):
+        return logging.getLogger(self.__module__)
+
+    def compile(self, tree, filename='<template>'):
+        """
+        Compiles the given template. The variables of the template have to be resolved for the builtins of
+        the compiler, see contemply.frames.
+
+        :param Template tree: The AST
+        :param str filename: The filename used in tracebacks
+        :return: The compiled template
+        :rtype: CompiledTemplate
+        :raises: CompilerError
+        """
+        source = self.generate(tree)
+
+        try:
+            code = compile(source, filename, 'exec')
+        except (SyntaxError, RecursionError, MemoryError, ValueError) as e:
+            raise CompilerError('Generated code could not be compiled: {0}'.format(e))
+
+        namespace = {}
+        exec(code, namespace)
+
+        return CompiledTemplate(source, namespace['template'], self._consts)
+
+    def generate(self, tree):
+        """
+        Returns the Python source of the template function for the given template.
+
+        :param Template tree: The AST
+        :rtype: str
+        :raises: CompilerError
+        """
+        self._lines = []
+        self._indent = 1
+        self._consts = []
+        self._functions = {}
+        self._builtin_names = {}
+        self._invariants = {}
+
+        if tree.scope is not None:
+            # loop variables are always set inside their loop
+            self._loop_slots = frozenset(range(0, len(tree.scope))) - frozenset(tree.scope.globals.values())
+            # slots that may hold a value that is computed when it is read
+            self._lazy_slots = frozenset(tree.scope.lazy)
+
+        try:
+            self._body(tree.main_block, False)
+        except RecursionError:
+            raise CompilerError('Template is nested too deeply')
+
+        prelude = ['def template({0}):'.format(', '.join(_ARGUMENTS)),
+                   '    add = interp._add_content_line',
+                   '    render = ctx.render',
+                   '    add_lines = interp._add_content_lines',
+                   '    lookup = ctx.lookup',
+                   '    force = frame.force',
+                   '    defer = interp._defer',
+                   '    load_lazy = interp._load_lazy',
+                   '    inv = {}',
+                   '    brk = False',
+                   # the limits are read from the meter, so the code does not depend on the budget
+                   '    max_steps = meter.max_steps',
+                   '    max_runs = meter.max_loop_runs',
+                   '    max_while_runs = meter.max_while_runs',
+                   '    timed = meter.deadline is not None',
+                   '    check_values = meter.max_value_size is not None']
+
+        for name, local in self._builtin_names.items():
+            prelude.append('    {0} = builtins[{1!r}]'.format(local, name))
+
+        for (name, checked), local in self._functions.items():
+            prelude.append('    {0} = resolve({1!r}{2})'.format(local, name, ', True' if checked else ''))
+
+        return '\n'.join(prelude + self._lines) + '\n'
+
+    ##########################
+    # Helpers
+    ##########################
+
+    def _emit(self, line):
+        self._lines.append('    ' * self._indent + line)
+
+    def _new_temp(self):
+        self._temp += 1
+        return '_t{0}'.format(self._temp)
+
+    def _const(self, value):
+        self._consts.append(value)
+        return 'consts[{0}]'.format(len(self._consts) - 1)
+
+    def _open(self, header):
+        self._emit(header)
+        self._indent += 1
+
+        if self._indent > self.MAX_INDENT:
+            raise CompilerError('Template is nested too deeply')
+
+    def _close(self):
+        self._indent -= 1
+
+    def _invariant_key(self, node):
+        if node not in self._invariants:
+            self._invariants[node] = len(self._invariants)
+
+        return self._invariants[node]
+
+    def _reset_invariants(self, loop):
+        for invariant in loop.invariants:
+            self._emit('inv.pop({0}, None)'.format(self._invariant_key(invariant)))
+
+    def _body(self, block, may_break):
+        """
+        Emits an indented block of statements, emits pass if the block is empty.
+        """
+        count = len(self._lines)
+        may_break = self._block(block, may_break)
+
+        if len(self._lines) == count:
+            self._emit('pass')
+
+        return may_break
+
+    ##########################
+    # Statements
+    ##########################
+
+    # Every statement method receives and returns whether the break flag may be set at that point. The
+    # Interpreter checks the flag after every statement of a block and stops processing the block if it is set,
+    # so the remaining statements are only emitted under "if not brk" where the flag may be set.
+
+    def _block(self, block, may_break):
+        opened = []
+        children = block.children
+
+        if children:
+            # the statements of a block are counted when it starts, just like in the Interpreter
+            self._emit('meter.steps += {0}'.format(len(children)))
+            self._open('if meter.steps > max_steps:')
+            self._emit('meter.exceeded_steps()')
+            self._close()
+
+        for i, child in enumerate(children):
+            may_break = self._statement(child.statement if type(child) is CommandLine else child, may_break)
+
+            if may_break and i < len(children) - 1:
+                self._open('if not brk:')
+                opened.append(len(self._lines))
+                may_break = False
+
+        for count in reversed(opened):
+            # the remaining statements may not have emitted any code
+            if len(self._lines) == count:
+                self._emit('pass')
+
+            self._close()
+
+        return may_break or len(opened) > 0
+
+    def _statement(self, node, may_break):
+        node_type = type(node)
+
+        if node_type is ContentLine or node_type is OutputExpression:
+            self._content(node)
+        elif node_type is TextRun:
+            self._emit('add_lines({0})'.format(self._const(node.lines)))
+        elif node_type is Assignment:
+            self._assignment(node)
+        elif node_type is IFBlock:
+            return self._ifblock(node, may_break)
+        elif node_type is While or node_type is CountingWhile:
+            # counting loops are fast enough as plain while loops in Python
+            return self._while(node, may_break)
+        elif node_type is For:
+            return self._for(node, may_break)
+        elif node_type is Block:
+            return self._block(node, may_break)
+        elif node_type is CacheBlock:
+            return self._cacheblock(node, may_break)
+        elif node_type is Break:
+            if self._loop_depth == 0:
+                self._emit('raise ParserError("Unexpected BREAK: no surrounding loop found", ctx)')
+            else:
+                self._emit('brk = True')
+
+            return True
+        elif node_type in (NoOp, Endif, Else):
+            pass
+        elif node_type is FileBlockEnd:
+            self._emit('interp.target = DEFAULT_TARGET')
+        elif node_type is FileBlockStart and not node.create_missing_folders:
+            segments = split_variables(node.filename)
+
+            if segments is None:
+                self._emit('interp.target = {0!r}'.format(node.filename))
+            else:
+                self._emit('interp.target = render({0!r})'.format(segments))
+        elif node_type in (Variable, Function, String, Num, Constant, Invariant, List, SimpleExpression):
+            self._emit(self._expression(node))
+        elif node_type in (Template, CommandLine, If):
+            raise CompilerError('Unexpected node {0}'.format(node_type.__name__))
+        else:
+            # everything else is executed by the interpreter
+            self._emit('visit({0})'.format(self._const(node)))
+
+        return may_break
+
+    def _content(self, node):
+        if node.segments is None:
+            self._emit('add({0!r})'.format(node.content))
+        else:
+            self._emit('add(render({0!r}))'.format(node.segments))
+
+    def _assignment(self, node):
+        if node.type == 'ASSIGN':
+            if node.lazy and node.slot is not None:
+                self._emit('values[{0}] = defer({1})'.format(node.slot, self._const(node)))
+            elif node.slot is not None:
+                self._emit('values[{0}] = {1}'.format(node.slot, self._expression(node.value)))
+
+                if _may_grow(node.value):
+                    self._check_value(node.variable, 'values[{0}]'.format(node.slot))
+            elif _may_grow(node.value):
+                temp = self._new_temp()
+                self._emit('{0} = {1}'.format(temp, self._expression(node.value)))
+                self._check_value(node.variable, temp)
+                self._emit('ctx.set({0!r}, {1})'.format(node.variable, temp))
+            else:
+                self._emit('ctx.set({0!r}, {1})'.format(node.variable, self._expression(node.value)))
+        elif node.type == 'ASSIGN_PLUS':
+            temp = self._new_temp()
+            self._emit('{0} = {1}'.format(temp, self._load(node.slot, node.variable)))
+            self._open('if {0} is UNSET:'.format(temp))
+            self._emit('raise ParserError({0!r}, ctx)'.format('Unknown variable: {0}'.format(node.variable)))
+            self._close()
+            self._open('if not isinstance({0}, list):'.format(temp))
+            self._emit('raise ParserError("Expected variable of type \'list\'.", ctx)')
+            self._close()
+            self._emit('{0}.append({1})'.format(temp, self._expression(node.value)))
+            self._check_value(node.variable, temp)
+
+    def _cacheblock(self, node, may_break):
+        key, position = self._new_temp(), self._new_temp()
+        self._emit('{0} = interp._fragment_key({1})'.format(key, self._const(node)))
+
+        if may_break:
+            # the first statement of a block also runs if the break flag is set, the output is not cached then
+            self._open('if brk:')
+            self._emit('{0} = None'.format(key))
+            self._close()
+
+        # the block only runs if no output is stored for the key
+        self._open('if not interp._load_fragment({0}):'.format(key))
+        self._emit('{0} = interp._output_position()'.format(position))
+        may_break = self._body(node.block, may_break)
+
+        if may_break:
+            self._open('if not brk:')
+            self._emit('interp._store_fragment({0}, {1})'.format(key, position))
+            self._close()
+        else:
+            self._emit('interp._store_fragment({0}, {1})'.format(key, position))
+
+        self._close()
+        return may_break
+
+    def _check_value(self, name, value):
+        self._open('if check_values:')
+        self._emit('meter.check_value({0!r}, {1})'.format(name, value))
+        self._close()
+
+    def _check_loop(self, counter, limit='max_runs'):
+        # emitted at the start of every iteration, limit is the local with the maximum number of iterations
+        self._open('if {0} >= {1}:'.format(counter, limit))
+        self._emit('meter.exceeded_loop_runs({0})'.format(limit))
+        self._close()
+        self._open('if timed:')
+        self._emit('meter.check_time()')
+        self._close()
+
+    def _ifblock(self, node, may_break):
+        result = may_break
+
+        if len(node._if) == 1:
+            # a single condition does not need to remember the results
+            self._open('if {0}:'.format(self._expression(node._if[0].condition)))
+            result = self._body(node._if[0].block, may_break) or result
+            self._close()
+
+            if node._else is not None:
+                self._open('else:')
+                result = self._body(node._else, may_break) or result
+                self._close()
+
+            return result
+
+        # the interpreter evaluates every condition and executes every block whose condition is true
+        matched = self._new_temp() if node._else is not None else None
+        entry = may_break
+
+        if matched is not None:
+            self._emit('{0} = False'.format(matched))
+
+        for item in node._if:
+            self._open('if {0}:'.format(self._expression(item.condition)))
+
+            if matched is not None:
+                self._emit('{0} = True'.format(matched))
+
+            block_may_break = self._body(item.block, entry)
+            result = result or block_may_break
+            entry = entry or block_may_break
+            self._close()
+
+        if matched is not None:
+            self._open('if not {0}:'.format(matched))
+            result = self._body(node._else, may_break) or result
+            self._close()
+
+        return result
+
+    def _while(self, node, may_break):
+        counter = self._new_temp()
+
+        self._reset_invariants(node)
+        self._emit('{0} = 0'.format(counter))
+        self._open('while {0}:'.format(self._expression(node.expr)))
+        self._check_loop(counter, 'max_while_runs')
+
+        self._loop_depth += 1
+        block_may_break = self._block(node.block, may_break)
+        self._loop_depth -= 1
+
+        if may_break or block_may_break:
+            self._open('if brk:')
+            self._emit('brk = False')
+            self._emit('break')
+            self._close()
+
+        self._emit('{0} += 1'.format(counter))
+        self._close()
+
+        # the loop resets the flag, unless its body is never executed
+        return may_break
+
+    def _for(self, node, may_break):
+        if not isinstance(node.listvar, (Variable, Function)) or not isinstance(node.itemvar, Variable) or \
+                node.itemvar.slot is None:
+            raise CompilerError('Unsupported for loop')
+
+        items, previous, counter = self._new_temp(), self._new_temp(), self._new_temp()
+        name, slot = node.itemvar.name, node.itemvar.slot
+
+        self._emit('{0} = {1}'.format(items, self._expression(node.listvar)))
+        self._open('if not isinstance({0}, list):'.format(items))
+        self._emit('raise ParserError({0!r}, ctx)'.format(
+            'Cannot iterate "{0}", expected a list.'.format(node.listvar.name)))
+        self._close()
+        self._reset_invariants(node)
+
+        # the item variable is local to the loop, it is stored in its slot by the for statement
+        self._emit('{0} = frame.bind({1!r}, {2})'.format(previous, name, slot))
+        self._emit('{0} = 0'.format(counter))
+
+        # the flag is checked at the start of every iteration, not after the block
+        check = len(self._lines)
+        self._open('for values[{0}] in {1}:'.format(slot, items))
+        self._check_loop(counter)
+        self._emit('{0} += 1'.format(counter))
+
+        self._loop_depth += 1
+        block_may_break = self._body(node.block, False)
+        self._loop_depth -= 1
+
+        self._close()
+        self._emit('frame.unbind({0!r}, {1})'.format(name, previous))
+
+        if may_break or block_may_break:
+            indent = '    ' * (self._indent + 1)
+            self._lines[check + 1:check + 1] = [indent + 'if brk:', indent + '    brk = False', indent + '    break']
+
+        # a break in the last iteration is not reset by the loop
+        return may_break or block_may_break
+
+    ##########################
+    # Expressions
+    ##########################
+
+    def _expression(self, node):
+        node_type = type(node)
+
+        if node_type is String:
+            return repr(node.value)
+        elif node_type is Num:
+            try:
+                return repr(int(node.value))
+            except (TypeError, ValueError):
+                pass
+        elif node_type is Constant:
+            if type(node.value) in (str, int, bool, type(None)):
+                return repr(node.value)
+
+            return self._const(node.value)
+        elif node_type is Invariant:
+            key = self._invariant_key(node)
+            return '(inv[{0}] if {0} in inv else store(inv, {0}, {1}))'.format(key, self._expression(node.expr))
+        elif node_type is List:
+            return '[{0}]'.format(', '.join(self._expression(item) for item in node.children))
+        elif node_type is Variable:
+            return self._variable(node)
+        elif node_type is Function:
+            return self._function(node)
+        elif node_type is SimpleExpression and node.op in _OPERATORS:
+            return '({0} {1} {2})'.format(self._expression(node.lval), node.op, self._expression(node.rval))
+
+        # everything else is evaluated by the interpreter
+        return 'visit({0})'.format(self._const(node))
+
+    def _variable(self, node):
+        if node.name in self._builtins:
+            if node.name not in self._builtin_names:
+                self._builtin_names[node.name] = '_b{0}'.format(len(self._builtin_names))
+
+            return self._builtin_names[node.name]
+
+        if node.slot in self._lazy_slots:
+            value = 'load_lazy({0}, {1!r})'.format(node.slot, node.name)
+        else:
+            value = self._load(node.slot, node.name)
+
+            if node.slot not in self._loop_slots:
+                value = '({0} if {0} is not UNSET else unknown({1!r}, ctx))'.format(value, node.name)
+
+        if node.index is not None:
+            return 'index({0}, {1!r}, {2!r}, ctx)'.format(value, node.name, node.index)
+
+        return value
+
+    def _load(self, slot, name):
+        # variables without a slot are looked up by name
+        if slot is None:
+            return 'lookup({0!r})'.format(name)
+
+        return 'force({0})'.format(slot) if slot in self._lazy_slots else 'values[{0}]'.format(slot)
+
+    def _function(self, node):
+        key = (node.name, node.checked)
+
+        if key not in self._functions:
+            self._functions[key] = '_f{0}'.format(len(self._functions))
+
+        args = ', '.join(self._expression(arg) for arg in node.args.children)
+        return '{0}([{1}], ctx)'.format(self._functions[key], args)
+
+
+class CompilingInterpreter(Interpreter):
+    """
+    An Interpreter that compiles templates to Python code before running them. Compiled templates are kept
+    for the parsed templates that were run last, so running a cached template again does not compile it again.
+    """
+
+    MAX_COMPILED = 64
+
+    # shared by all instances: (id of the AST, builtin names) -> (AST, CompiledTemplate or None)
+    _compiled = collections.OrderedDict()
+
+    def _execute(self, tree):
+        compiled = self.compile(tree)
+
+        if compiled is None:
+            return super()._execute(tree)
+
+        compiled.run(self)
+
+    def compile(self, tree):
+        """
+        Returns the compiled template for the given AST or None if it can not be compiled.
+
+        :param Template tree: The AST
+        :rtype: CompiledTemplate
+        """
+        key = (id(tree), frozenset(self._BUILTINS))
+
+        # the generated code uses the slots of the variables
+        self.resolve_slots(tree)
+
+        if key in self._compiled:
+            self._compiled.move_to_end(key)
+            return self._compiled[key][1]
+
+        try:
+            compiled = Compiler(self._BUILTINS).compile(tree, self._ctx.filename() or '<template>')
+        except CompilerError as e:
+            self.get_logger().debug('Template not compiled, using the interpreter: {0}'.format(e))
+            compiled = None
+
+        # the AST is stored as well, so its id is not reused while the entry exists
+        self._compiled[key] = (tree, compiled)
+
+        while len(self._compiled) > self.MAX_COMPILED:
+            self._compiled.popitem(last=False)
+
+        return compiled
+
+    def get_template_context(self):
+        return self._ctx
+
+    def get_builtins(self):
+        return self._BUILTINS
+
+    def get_frame(self):
+        return self._frame
+
+    def get_meter(self):
+        return self._meter
+
+
+BACKENDS = {
+    'interpreter': Interpreter,
+    'compiler': CompilingInterpreter,
+}
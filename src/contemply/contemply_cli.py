@@ -4,13 +4,17 @@
 # Copyright (C) 2019  Sean Mertiens
 # For more information on licensing see LICENSE file
 #
-import os, sys, logging
+import os, sys, logging, json
 import click
 from contemply import __version__ as contemply_version
 from colorama import Fore, init, Style
 from contemply import samples
+from contemply.cache import CompileCache
+from contemply.checker import find_templates, check_files
 from contemply.exceptions import *
+from contemply.fragments import FragmentCache
 from contemply.frontend import TemplateParser
+from contemply.langserver import LanguageServer
 from contemply.preferences import PreferencesProvider
 from contemply.storage import TemplateStorageManager
 
@@ -62,9 +66,21 @@ def cli(ctx):
 @click.option('--no-header', type=bool, is_flag=True, help='Do not show application header')
 @click.option('--verbose', '-v', type=click.BOOL, is_flag=True, help='Increase verbosity')
 @click.option('--print', '-p', 'print_out', type=click.BOOL, is_flag=True, help='Show template output in terminal')
+@click.option('--stream', type=click.BOOL, is_flag=True, help='Read the template line by line (for very large templates)')
+@click.option('--no-cache', type=click.BOOL, is_flag=True, help='Do not use cached templates')
+@click.option('--fragment-cache', type=click.BOOL, is_flag=True,
+              help='Keep the output of cache blocks in the cache directory for later runs')
+@click.option('--jobs', '-j', type=int, default=1,
+              help='Number of processes used to parse large templates (0 uses all CPUs)')
+@click.option('--backend', type=click.Choice(['interpreter', 'compiler']), default='interpreter',
+              help='Run the template with the interpreter or compile it to Python code first')
+@click.option('--optimize', '-O', type=click.BOOL, is_flag=True, help='Optimize the template before running it')
+@click.option('--answers', type=click.Path(exists=True, dir_okay=False),
+              help='JSON file with fixed values for template variables (e.g. {"author": "Jane"})')
+@click.option('--lazy', type=click.BOOL, is_flag=True, help='Ask questions when their answers are used for the first time')
 @click.argument('template_file')
 @click.pass_context
-def run(ctx, no_header, verbose, print_out, template_file):
+def run(ctx, no_header, verbose, print_out, stream, no_cache, fragment_cache, jobs, backend, optimize, answers, lazy, template_file):
     """
     Runs a template.
 
@@ -104,6 +120,31 @@ def run(ctx, no_header, verbose, print_out, template_file):
     if print_out is True:
         parser.set_output_mode(TemplateParser.OUTPUTMODE_CONSOLE)
 
+    if stream is True:
+        parser.set_streaming(True)
+
+    if jobs != 1:
+        parser.set_parallel(True, jobs or None)
+
+    parser.set_backend(backend)
+    parser.set_optimize(optimize)
+    parser.set_lazy(lazy)
+
+    if answers is not None:
+        try:
+            with open(answers, 'r') as f:
+                parser.set_bindings(json.load(f))
+        except (ValueError, TypeError) as e:
+            print_error('Could not read answers from {0}: {1}'.format(answers, e))
+            sys.exit(1)
+
+    if no_cache is not True:
+        parser.set_compile_cache(CompileCache(directory=ctx.obj.preferences.get_cache_dir()))
+
+    if fragment_cache is True:
+        parser.set_fragment_cache(FragmentCache(directory=os.path.join(ctx.obj.preferences.get_cache_dir(),
+                                                                       'fragments')))
+
     try:
         parser.parse_file(file)
     except ParserError as e:
@@ -113,6 +154,59 @@ def run(ctx, no_header, verbose, print_out, template_file):
         sys.exit()
 
 
+@cli.command()
+@click.option('--storage', '-s', 'storages', multiple=True, help='Check all templates in a storage location')
+@click.option('--jobs', '-j', type=int, default=0, help='Number of processes (default: all CPUs)')
+@click.option('--format', 'output_format', type=click.Choice(['text', 'json']), default='text',
+              help='Output format')
+@click.argument('paths', nargs=-1)
+@click.pass_context
+def check(ctx, storages, jobs, output_format, paths):
+    """
+    Checks templates for errors without running them.
+
+    PATHS can be template files or folders, folders are searched recursively for .pytpl files.
+    Every error in a template is reported. Exits with status 1 if any template contains errors.
+    """
+    storage = ctx.obj.storage
+    files = find_templates(paths)
+
+    try:
+        for name in storages:
+            files += [os.path.join(storage.list()[name], f) for f in sorted(storage.show(name))]
+    except StorageException as e:
+        print_error(str(e))
+        sys.exit(2)
+
+    results = []
+    for result in check_files(files, max_workers=jobs or None):
+        results.append(result)
+
+        if output_format == 'text':
+            for error in result['errors']:
+                print('{0}:{1}:{2}: {3}: {4}'.format(result['file'], error['line'], error['col'], error['type'],
+                                                     error['message']))
+
+    failed = len([r for r in results if not r['ok']])
+
+    if output_format == 'json':
+        print(json.dumps({'checked': len(results), 'failed': failed, 'results': results}, indent=2))
+    else:
+        print('Checked {0} {1}, {2} with errors.'.format(len(results), 'templates' if len(results) != 1
+                                                         else 'template', failed))
+
+    sys.exit(1 if failed else 0)
+
+
+@cli.command()
+@click.pass_context
+def langserver(ctx):
+    """
+    Starts a language server for template files (communicates over stdio).
+    """
+    sys.exit(LanguageServer().serve(sys.stdin.buffer, sys.stdout.buffer))
+
+
 @cli.command()
 @click.pass_context
 def version(ctx):
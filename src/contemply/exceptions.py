@@ -6,7 +6,8 @@
 #
 
 __all__ = ['TemplateException', 'ParserError', 'SyntaxError', 'StorageException', 'InvalidStorageNameException',
-           'StorageNameExistsException', 'StorageNameNotFoundException', 'InternalError', 'SecurityException']
+           'StorageNameExistsException', 'StorageNameNotFoundException', 'InternalError', 'SecurityException',
+           'CompilerError']
 
 
 class TemplateException(Exception):
@@ -22,13 +23,15 @@ class TemplateException(Exception):
 
     def __str__(self):
         if self.ctx is not None:
-            line = self.ctx.text()[self.ctx.line()]
+            line = self.ctx.line_text()
+            col = self.ctx.line_pos()
             marker = ''
             if line != '':
-                marker = '{0}^'.format(' ' * self.ctx.pos())
+                # keep tabs so the marker lines up with the source line
+                marker = '{0}^'.format(''.join(c if c == '\t' else ' ' for c in line[:col]))
 
             return '{6} in {1}, line {2}, col {3}: {0}\n{4}\n{5}'.format(self.message, self.ctx.filename(),
-                                                                         self.ctx.line(), self.ctx.line_pos(),
+                                                                         self.ctx.line() + 1, col + 1,
                                                                          line, marker, self.__class__.__name__)
         else:
             return '{1}: {0}'.format(self.message, self.__class__.__name__)
@@ -65,4 +68,8 @@ class StorageNameNotFoundException(StorageException):
     pass
 
 class SecurityException(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class CompilerError(Exception):
+    pass
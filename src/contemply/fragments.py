@@ -0,0 +1,229 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Cache blocks.
+
+The output of a cache block (#: cache "key" ... #: endcache) is stored for its key and the values of the variables
+it reads. When the block runs again with the same values, the stored lines are added to the output and the block
+is skipped. The parser analyzes every cache block when it is created:
+
+- reads: the variables read by the block, including the $variables of its content lines and strings (functions like
+  output() replace them). The item variables of loops inside the block are not read from outside.
+- calls: the functions the block calls. A block is only cached if it calls pure functions (see contemply.util.pure)
+  and output(), functions with side effects like echo() or ask() and functions like env() have to run every time.
+- fingerprint: a hash of the statements of the block, so a changed block does not use the lines stored on disk for
+  the old one.
+
+Statements that would not run on a hit are not allowed in a cache block: assignments, file blocks and a break that
+leaves the block.
+"""
+
+import hashlib
+
+from contemply.ast import *
+from contemply.cache import CompileCache
+from contemply.exceptions import ParserError
+from contemply.frames import UNSET
+from contemply.interpolation import split_variables
+
+# the default number of rendered blocks kept in memory
+DEFAULT_SIZE = 256
+
+# values whose repr is the same in every run, the key is created from the repr of the values
+_STABLE_TYPES = (str, int, float, bool, type(None))
+
+# the key of a variable without a value, no value has the same repr
+_UNSET_KEY = ('unset',)
+
+# fields that are set when a template is resolved, checked or analyzed, they are not part of the fingerprint
+_RUNTIME_FIELDS = frozenset(('slot', 'scope', 'invariants', 'checked', 'segments', 'reads', 'calls', 'fingerprint'))
+
+# the fields of the node types that are part of the fingerprint
+_fields = {}
+
+
+def analyze(node, ctx=None):
+    """
+    Finds the variables a cache block reads and the functions it calls and computes its fingerprint. The results
+    are stored in the node.
+
+    :param CacheBlock node: The cache block, nested cache blocks have to be analyzed already
+    :param TemplateContext ctx: The template context used for error messages
+    :raises: ParserError
+    """
+    reads = []
+    calls = []
+
+    # (node, names of the loop variables, whether the node is in a loop of the block)
+    stack = [(node.block, frozenset(), False)]
+
+    while stack:
+        child, loop_vars, in_loop = stack.pop()
+        child_type = type(child)
+
+        if child_type is Variable:
+            if child.name not in loop_vars:
+                reads.append(child.name)
+        elif child_type is ContentLine or child_type is OutputExpression or child_type is String:
+            segments = split_variables(child.value) if child_type is String else child.segments
+
+            if segments is not None:
+                reads.extend(name for name, index in segments[1::2] if name not in loop_vars)
+        elif child_type is Block or child_type is List or child_type is ArgumentList:
+            stack.extend((item, loop_vars, in_loop) for item in reversed(child.children))
+        elif child_type is CommandLine:
+            stack.append((child.statement, loop_vars, in_loop))
+        elif child_type is IFBlock:
+            if child._else is not None:
+                stack.append((child._else, loop_vars, in_loop))
+
+            stack.extend((item, loop_vars, in_loop) for item in reversed(child._if))
+        elif child_type is If:
+            stack += [(child.block, loop_vars, in_loop), (child.condition, loop_vars, in_loop)]
+        elif child_type is While:
+            stack += [(child.block, loop_vars, True), (child.expr, loop_vars, in_loop)]
+        elif child_type is For:
+            stack += [(child.block, loop_vars | {child.itemvar.name}, True), (child.listvar, loop_vars, in_loop)]
+        elif child_type is SimpleExpression:
+            stack += [(child.rval, loop_vars, in_loop), (child.lval, loop_vars, in_loop)]
+        elif child_type is Function:
+            calls.append(child.name)
+            stack.append((child.args, loop_vars, in_loop))
+        elif child_type is CacheBlock:
+            reads.extend(name for name in child.reads if name not in loop_vars)
+            calls.extend(child.calls)
+        elif child_type is Assignment:
+            raise ParserError('Variables can not be assigned in cache block "{0}"'.format(node.key), ctx)
+        elif child_type is FileBlockStart or child_type is FileBlockEnd:
+            raise ParserError('Cache block "{0}" can not contain file blocks'.format(node.key), ctx)
+        elif child_type is Break and not in_loop:
+            raise ParserError('Break can not leave cache block "{0}"'.format(node.key), ctx)
+
+    node.reads = _unique(reads)
+    node.calls = _unique(calls)
+    node.fingerprint = fingerprint(node.block)
+
+
+def fingerprint(node):
+    """
+    Returns a hash of the given node and all nodes below it. The hash is the same in every run, fields that are
+    set after the template was parsed (e.g. slots) are left out.
+
+    :param AST node: The root node
+    :rtype: str
+    """
+    h = hashlib.sha256()
+    stack = [node]
+
+    while stack:
+        item = stack.pop()
+
+        # every node type has a fixed number of fields and lists start with their length, so the encoding of
+        # different trees is different
+        if isinstance(item, AST):
+            h.update('{0}|'.format(type(item).__name__).encode('utf-8'))
+            stack.extend(getattr(item, name, None) for name in reversed(_node_fields(type(item))))
+        elif isinstance(item, (list, tuple)):
+            h.update('[{0}|'.format(len(item)).encode('utf-8'))
+            stack.extend(reversed(item))
+        else:
+            h.update('{0!r}|'.format(item).encode('utf-8'))
+
+    return h.hexdigest()
+
+
+def _unique(names):
+    # every name once, in the order of the first use. Dictionaries only keep the order of their keys since
+    # Python 3.6, before the order would depend on the hash seed of the process.
+    seen = set()
+    result = []
+
+    for name in names:
+        if name not in seen:
+            seen.add(name)
+            result.append(name)
+
+    return tuple(result)
+
+
+def _node_fields(node_type):
+    fields = _fields.get(node_type)
+
+    if fields is None:
+        fields = _fields[node_type] = [name for cls in reversed(node_type.__mro__)
+                                       for name in cls.__dict__.get('__slots__', ())
+                                       if name not in _RUNTIME_FIELDS]
+
+    return fields
+
+
+def _is_stable(value):
+    stack = [value]
+
+    while stack:
+        item = stack.pop()
+
+        if type(item) is list:
+            stack.extend(item)
+        elif type(item) not in _STABLE_TYPES and item is not _UNSET_KEY:
+            return False
+
+    return True
+
+
+class FragmentCache(CompileCache):
+    """
+    Keeps the rendered lines of cache blocks. Like parsed templates, the lines are kept in an in-process LRU and,
+    if a directory is given, on disk, so later runs and other processes can reuse them.
+    """
+
+    EXTENSION = '.lines'
+
+    def __init__(self, max_entries=DEFAULT_SIZE, directory=None, max_disk_entries=4096):
+        """
+        :param int max_entries: Maximum number of blocks kept in memory
+        :param str directory: Directory for the on-disk tier, None to disable it
+        :param int max_disk_entries: Maximum number of blocks kept on disk
+        """
+        super().__init__(max_entries, directory, max_disk_entries)
+
+        # runs of cache blocks that call functions which are not pure or read values which can not be part of a key
+        self.skipped = 0
+
+    def make_block_key(self, node, values):
+        """
+        Creates the cache key for the output of a cache block. Only strings, numbers, booleans, None and lists of
+        them can be part of a key, for other values None is returned and the block is not cached.
+
+        :param CacheBlock node: The cache block
+        :param list values: The values of the variables the block reads (node.reads), UNSET for unknown variables
+        :return: The cache key or None
+        :rtype: str
+        """
+        values = [_UNSET_KEY if value is UNSET else value for value in values]
+
+        if not _is_stable(values):
+            self.skipped += 1
+            return None
+
+        # the names are part of the key, so the values of different variables are never mixed up
+        return self.make_key(repr(values), ('fragment', node.key, node.fingerprint, ','.join(node.reads)))
+
+    def get_stats(self):
+        """
+        Returns the statistics of the cache as a dictionary with the keys "hits" (found in memory), "disk_hits"
+        (found on disk), "misses", "skipped" (runs that could not be cached), "size" (blocks kept in memory) and
+        "hit_rate" (the share of runs that used stored lines).
+
+        :rtype: dict
+        """
+        hits = self.hits + self.disk_hits
+        runs = hits + self.misses + self.skipped
+
+        return {'hits': self.hits, 'disk_hits': self.disk_hits, 'misses': self.misses, 'skipped': self.skipped,
+                'size': len(self._entries), 'hit_rate': hits / runs if runs > 0 else 0.0}
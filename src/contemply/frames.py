@@ -0,0 +1,322 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Slot-resolved variable storage.
+
+The Resolver gives every variable of a template a slot, an index into the list of values of a Frame. The
+Interpreter and the compiled code read and write variables by their slot instead of looking up their names in the
+builtins and the variables of the TemplateContext.
+
+Variables are global and keep their values after the template ran, a Frame loads them from the TemplateContext
+when the template starts and stores them back when it ends. The item variable of a for loop is local to the loop:
+it has a slot of its own, which hides a variable of the same name while the loop runs. After the loop the name
+refers to the outer variable again.
+
+While a template runs, TemplateContext.get() and set() look up names in the bindings of its frame, so template
+functions see the same variables as the template.
+
+A lazy assignment (#: lazy name = ask("Name?")) stores a Lazy value in the slot of its variable. The value is
+computed when the variable is read for the first time, with the values the variables have at that time. A lazy
+variable that is never read is never computed and is not stored when the template ends.
+"""
+
+from contemply.ast import *
+
+
+class _Unset:
+    __slots__ = ()
+
+    def __repr__(self):
+        return '<unset>'
+
+
+# the value of a slot whose variable has not been set
+UNSET = _Unset()
+
+
+class Lazy:
+    """
+    The value of a lazy assignment that was not computed yet, see Frame.force().
+    """
+
+    __slots__ = ('node', 'evaluate')
+
+    def __init__(self, node, evaluate):
+        """
+        :param Assignment node: The assignment
+        :param function evaluate: Computes the value, called with the assignment
+        """
+        self.node = node
+        self.evaluate = evaluate
+
+    def __repr__(self):
+        return '<lazy {0}>'.format(self.node.variable)
+
+
+class Scope:
+    """
+    The slots of a resolved template.
+    """
+
+    __slots__ = ('names', 'globals', 'builtins', 'lazy')
+
+    def __init__(self, builtins=()):
+        """
+        :param builtins: The names of the builtin values the template was resolved for
+        """
+        # the name of the variable of every slot
+        self.names = []
+        # name -> slot of the global variables
+        self.globals = {}
+        self.builtins = frozenset(builtins)
+        # the slots that are assigned by lazy assignments
+        self.lazy = set()
+
+    def add_slot(self, name):
+        """
+        Adds a slot for a variable.
+
+        :param str name: The name of the variable
+        :return: The new slot
+        :rtype: int
+        """
+        self.names.append(name)
+        return len(self.names) - 1
+
+    def global_slot(self, name):
+        """
+        Returns the slot of a global variable, the slot is added the first time the variable is used.
+
+        :param str name: The name of the variable
+        :rtype: int
+        """
+        slot = self.globals.get(name)
+
+        if slot is None:
+            slot = self.globals[name] = self.add_slot(name)
+
+        return slot
+
+    def __len__(self):
+        return len(self.names)
+
+
+class Frame:
+    """
+    The variables of a running template. Slots of global variables are loaded when the frame is created, slots of
+    loop variables are set by their loops.
+    """
+
+    __slots__ = ('scope', 'values', 'bindings', 'parent')
+
+    def __init__(self, scope, lookup):
+        """
+        :param Scope scope: The slots of the template
+        :param function lookup: Returns the current value of a global variable or UNSET
+        """
+        self.scope = scope
+        self.values = [UNSET] * len(scope)
+        # the slots of the names that are visible right now
+        self.bindings = dict(scope.globals)
+        self.parent = None
+
+        for name, slot in scope.globals.items():
+            self.values[slot] = lookup(name)
+
+    def bind(self, name, slot):
+        """
+        Makes a name refer to a slot, used by loops for their item variable.
+
+        :param str name: The name of the variable
+        :param int slot: The slot
+        :return: The slot the name referred to before or None, has to be passed to unbind()
+        :rtype: int
+        """
+        previous = self.bindings.get(name)
+        self.bindings[name] = slot
+        return previous
+
+    def unbind(self, name, previous):
+        """
+        Restores the slot of a name that was changed by bind().
+
+        :param str name: The name of the variable
+        :param int previous: The value bind() returned
+        """
+        if previous is None:
+            del self.bindings[name]
+        else:
+            self.bindings[name] = previous
+
+    def force(self, slot):
+        """
+        Returns the value of a slot. The value of a lazy assignment is computed and stored in the slot, so it is
+        computed only once.
+
+        :param int slot: The slot
+        :return: The value or UNSET
+        """
+        value = self.values[slot]
+
+        if type(value) is Lazy:
+            # the variable is unset while its value is computed
+            self.values[slot] = UNSET
+
+            try:
+                computed = value.evaluate(value.node)
+            except BaseException:
+                self.values[slot] = value
+                raise
+
+            self.values[slot] = value = computed
+
+        return value
+
+    def get_globals(self):
+        """
+        Returns the values of the global variables that are set, lazy variables that were not computed are left out.
+
+        :return: Dictionary with the values of the variables
+        :rtype: dict
+        """
+        values = self.values
+        return {name: values[slot] for name, slot in self.scope.globals.items()
+                if values[slot] is not UNSET and type(values[slot]) is not Lazy}
+
+    def get_deferred(self):
+        """
+        Returns the names of the global variables whose lazy values were not computed.
+
+        :rtype: list
+        """
+        values = self.values
+        return [name for name, slot in self.scope.globals.items() if type(values[slot]) is Lazy]
+
+    def get_visible(self):
+        """
+        Returns the values of all variables that are visible right now and set, lazy variables that were not
+        computed are left out.
+
+        :return: Dictionary with the values of the variables
+        :rtype: dict
+        """
+        values = self.values
+        return {name: values[slot] for name, slot in self.bindings.items()
+                if values[slot] is not UNSET and type(values[slot]) is not Lazy}
+
+
+class Resolver:
+    """
+    Assigns slots to the variables of a template. Reads of builtin values get no slot, they are resolved by the
+    interpreter. Nodes created after the template was resolved have no slot either, the interpreter looks them up
+    by name.
+    """
+
+    def __init__(self, builtins=()):
+        """
+        :param builtins: The names of the builtin values
+        """
+        self._builtins = frozenset(builtins)
+
+    def run(self, tree):
+        """
+        Resolves the variables of a template and stores the scope in it.
+
+        :param Template tree: The AST
+        :return: The scope
+        :rtype: Scope
+        """
+        scope = Scope(self._builtins)
+
+        # (node, loop variables as tuples (name, slot), innermost last)
+        stack = [(tree, ())]
+
+        while stack:
+            node, loops = stack.pop()
+            node_type = type(node)
+
+            if node_type is Variable:
+                node.slot = None if node.name in self._builtins else self._slot(node.name, loops, scope)
+            elif node_type is Assignment:
+                node.slot = self._slot(node.variable, loops, scope)
+
+                if node.lazy:
+                    scope.lazy.add(node.slot)
+
+                stack.append((node.value, loops))
+            elif node_type is For:
+                if type(node.itemvar) is Variable:
+                    node.itemvar.slot = scope.add_slot(node.itemvar.name)
+                    stack.append((node.block, loops + ((node.itemvar.name, node.itemvar.slot),)))
+                else:
+                    stack.append((node.block, loops))
+
+                stack.append((node.listvar, loops))
+            elif node_type is Block or node_type is List or node_type is ArgumentList:
+                stack.extend((child, loops) for child in reversed(node.children))
+            elif node_type is CommandLine:
+                stack.append((node.statement, loops))
+            elif node_type is CacheBlock:
+                stack.append((node.block, loops))
+            elif node_type is IFBlock:
+                if node._else is not None:
+                    stack.append((node._else, loops))
+
+                stack.extend((item, loops) for item in reversed(node._if))
+            elif node_type is If:
+                stack += [(node.block, loops), (node.condition, loops)]
+            elif node_type is While or node_type is CountingWhile:
+                if node_type is CountingWhile:
+                    node.slot = None if node.counter in self._builtins else self._slot(node.counter, loops, scope)
+
+                stack += [(node.block, loops), (node.expr, loops)]
+            elif node_type is SimpleExpression:
+                stack += [(node.rval, loops), (node.lval, loops)]
+            elif node_type is Function:
+                stack.append((node.args, loops))
+            elif node_type is Invariant:
+                stack.append((node.expr, loops))
+            elif node_type is Template:
+                stack.append((node.main_block, loops))
+            elif node_type is FileBlockStart and isinstance(node.create_missing_folders, AST):
+                stack.append((node.create_missing_folders, loops))
+
+        tree.scope = scope
+        return scope
+
+    def _slot(self, name, loops, scope):
+        for loop_name, slot in reversed(loops):
+            if loop_name == name:
+                return slot
+
+        return scope.global_slot(name)
+
+
+def resolve_slots(tree, builtins=()):
+    """
+    Assigns slots to the variables of a template. The tree is changed in place.
+
+    :param Template tree: The AST
+    :param builtins: The names of the builtin values
+    :return: The AST
+    :rtype: Template
+    """
+    Resolver(builtins).run(tree)
+    return tree
+
+
+def is_resolved(tree, builtins):
+    """
+    Checks whether a template was resolved for the given builtin values.
+
+    :param Template tree: The AST
+    :param builtins: The names of the builtin values
+    :rtype: bool
+    """
+    return tree.scope is not None and tree.scope.builtins == frozenset(builtins)
+
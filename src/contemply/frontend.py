@@ -6,11 +6,22 @@
 #
 import os, logging
 import contemply.cli as cli
+import contemply.functions
 from colorama import Fore, Style
 from contemply.storage import get_secure_path
+from contemply.compiler import BACKENDS
 from contemply.interpreter import Interpreter
+from contemply.inference import infer_types
+from contemply.frames import resolve_slots
+from contemply.fragments import FragmentCache
+from contemply.memo import CallCache
+from contemply.optimizer import Optimizer, OptimizerContext, defer_prompts, merge_content_lines
+from contemply.parallel import parse_parallel
+from contemply.partial import specialize, value_node
 from contemply.parser import TemplateContext, Parser
-from contemply.tokenizer import Tokenizer
+from contemply.scanner import scan_stream
+from contemply.symbols import FunctionTable
+from contemply.tokenizer import ENGINES
 from contemply import util
 
 class TemplateParser:
@@ -21,12 +32,27 @@ class TemplateParser:
     """
 
     OUTPUTMODE_CONSOLE, OUTPUTMODE_FILE = 0, 1
+    DEFAULT_BACKEND = 'interpreter'
 
     def __init__(self):
         self._ctx = TemplateContext()
         self._output_mode = self.OUTPUTMODE_FILE
         self._lookup_modules = []
+        self._function_table = None
         self._additional_builtins = {}
+        self._tokenizer_engine = 'classic'
+        self._backend = self.DEFAULT_BACKEND
+        self._streaming = False
+        self._cache = None
+        self._parallel = False
+        self._max_workers = None
+        self._optimize = False
+        self._lazy = False
+        self._bindings = {}
+        self._call_cache = CallCache(Interpreter.CALL_CACHE_SIZE)
+        self._fragment_cache = FragmentCache(Interpreter.FRAGMENT_CACHE_SIZE)
+        self._budget = None
+        self._usage = None
 
     def get_logger(self):
         """
@@ -56,12 +82,196 @@ class TemplateParser:
         """
         self._output_mode = mode
 
+    def set_streaming(self, enabled):
+        """
+        Enables or disables streaming input. In streaming mode parse_file reads the template line by line
+        instead of loading the whole file into memory. Only the line that is currently parsed is kept for
+        error messages, which keeps memory usage low for very large templates.
+
+        :param bool enabled: True to enable streaming input
+        """
+        self._streaming = enabled
+
+    def set_parallel(self, enabled, max_workers=None):
+        """
+        Enables or disables parallel parsing. Large templates are split at their top-level file blocks and the
+        parts are parsed in a process pool. Has no effect in streaming mode.
+
+        :param bool enabled: True to enable parallel parsing
+        :param int max_workers: The number of worker processes, defaults to the number of CPUs
+        """
+        self._parallel = enabled
+        self._max_workers = max_workers
+
+    def set_optimize(self, enabled):
+        """
+        Enables or disables the AST optimizer. The optimizer folds constant expressions, removes branches that
+        can never run and statements without effect before the template is executed.
+
+        :param bool enabled: True to enable the optimizer
+        """
+        self._optimize = enabled
+
+    def set_lazy(self, enabled):
+        """
+        Enables or disables lazy prompts for all templates. Answers of interactive functions like ask() that are
+        assigned at the top level of a template are only asked for when the variable is used for the first time,
+        questions whose answers are never used are not asked. Single assignments are made lazy with
+        "#: lazy name = ask(...)".
+
+        :param bool enabled: True to enable lazy prompts
+        """
+        self._lazy = enabled
+
+    def set_call_cache_size(self, size):
+        """
+        Sets the number of results of pure functions that are kept between calls and templates. Functions declared
+        with contemply.util.pure run once per distinct argument list while their results are kept.
+
+        :param int size: The maximum number of results, 0 disables the cache
+        """
+        self._call_cache = CallCache(size) if size > 0 else None
+
+    def get_call_cache(self):
+        """
+        Returns the cache for the results of pure functions, e.g. to read its statistics with get_stats().
+
+        :return: The cache or None if results are not cached
+        :rtype: CallCache
+        """
+        return self._call_cache
+
+    def set_fragment_cache(self, cache):
+        """
+        Sets the cache for the output of cache blocks (#: cache "key" ... #: endcache). A cache block that runs
+        again with the same key and the same values of the variables it reads adds the stored lines instead of
+        running. A cache with a directory keeps the output between runs.
+
+        :param contemply.fragments.FragmentCache cache: The cache or None to run cache blocks every time
+        """
+        self._fragment_cache = cache
+
+    def get_fragment_cache(self):
+        """
+        Returns the cache for the output of cache blocks, e.g. to read its statistics with get_stats().
+
+        :return: The cache or None if cache blocks are not cached
+        :rtype: contemply.fragments.FragmentCache
+        """
+        return self._fragment_cache
+
+    def set_budget(self, budget):
+        """
+        Limits the resources a template may use while it runs: the number of executed statements, the run time,
+        the output per file, the number of files and the size of values. A template that exceeds a limit stops
+        with a ParserError. Defaults to a budget that only limits while loops to 10000 iterations.
+
+        :param contemply.budget.Budget budget: The limits, None for the default budget
+        """
+        self._budget = budget
+
+    def get_usage(self):
+        """
+        Returns the resources used by the last template that ran: the keys "steps", "time" (in seconds),
+        "targets" and "output" (the number of characters per target).
+
+        :return: Dictionary with the usage or None if no template ran yet
+        :rtype: dict
+        """
+        return self._usage
+
+    def set_bindings(self, bindings):
+        """
+        Binds template variables to fixed values, e.g. answers that are the same for every run. Assignments to
+        bound variables assign the bound value (so ask() and similar functions are not called) and the template is
+        specialized for the known values before it runs, see contemply.partial.
+
+        :param dict bindings: The values of the bound variables by name
+        :raises: ValueError
+        """
+        bindings = dict(bindings or {})
+
+        for value in bindings.values():
+            # raises for values that cannot be used in templates
+            value_node(value)
+
+        self._bindings = bindings
+
+    def set_compile_cache(self, cache):
+        """
+        Sets a cache for parsed templates. When a template is parsed again with an unchanged text,
+        the cached AST is used and tokenizing and parsing are skipped.
+
+        :param CompileCache cache: A CompileCache instance or None to disable caching
+        """
+        self._cache = cache
+
+    def set_tokenizer_engine(self, engine):
+        """
+        Selects the tokenizer engine used to parse templates. Available engines are "classic" (the default,
+        character based tokenizer) and "regex" (single pass tokenizer using one compiled pattern).
+
+        :param str engine: The name of the tokenizer engine
+        :raises: ValueError
+        """
+        if engine not in ENGINES:
+            raise ValueError('Unknown tokenizer engine: {0}'.format(engine))
+
+        self._tokenizer_engine = engine
+
+    def set_backend(self, backend):
+        """
+        Selects how parsed templates are executed. Available backends are "interpreter" (the default, walks the
+        AST) and "compiler" (compiles the AST to Python code first, faster for templates with loops).
+
+        :param str backend: The name of the backend
+        :raises: ValueError
+        """
+        if backend not in BACKENDS:
+            raise ValueError('Unknown backend: {0}'.format(backend))
+
+        self._backend = backend
+        self._function_table = None
+
     def register_lookup_module(self, mod):
+        """
+        Registers a module containing template functions and builtins. Its functions shadow the functions of the
+        same name in contemply.functions and in the modules registered before.
+
+        :param module mod: The module
+        """
         if hasattr(mod, 'builtins'):
             for symbol, val in mod.builtins.items():
                 self._additional_builtins[symbol] = val
 
         self._lookup_modules.append(mod)
+        self._function_table = None
+
+        for name, module, by in self.get_shadowed_functions():
+            if by == getattr(mod, '__name__', None):
+                self.get_logger().info('Function {0}() of {1} is shadowed by {2}'.format(name, module, by))
+
+    def get_function_table(self):
+        """
+        Returns the symbol table of the template functions of contemply.functions and the registered modules.
+
+        :rtype: FunctionTable
+        """
+        if self._function_table is None:
+            self._function_table = FunctionTable([contemply.functions] + self._lookup_modules,
+                                                 BACKENDS[self._backend].get_internal_functions())
+
+        return self._function_table
+
+    def get_shadowed_functions(self):
+        """
+        Returns the template functions that are never called because a function of the same name takes
+        precedence, as a list of tuples (name, module of the shadowed function, module of the function that is
+        called instead).
+
+        :rtype: list
+        """
+        return self.get_function_table().get_shadowed()
 
     def parse_file(self, filename):
         """
@@ -73,6 +283,13 @@ class TemplateParser:
         """
         self._ctx.set_filename(os.path.basename(filename))
 
+        if self._streaming:
+            self._ctx.set_text('')
+            key = self._cache.make_file_key(filename, self._compile_options()) if self._cache is not None else None
+
+            with open(filename, 'r') as f:
+                return self._process(scan_stream(f, self._ctx), key)
+
         with open(filename, 'r') as f:
             lines = f.read()
 
@@ -93,27 +310,115 @@ class TemplateParser:
             self._ctx.set_text(text)
             self._ctx.set_filename('')
 
-        # Create the Tokenizer, Parser and Interpreter instances
-        tokenizer = Tokenizer(self._ctx)
-        tokenizer.get_logger().setLevel(self.get_logger().level)
-        parser = Parser(tokenizer, self._ctx)
-        interpreter = Interpreter(self._ctx)
+        return self._process()
+
+    def _compile_options(self):
+        # everything besides the template text that changes the resulting AST
+        # the optimizer and the type inference look at the builtin values and the functions that are called
+        options = (self._tokenizer_engine, repr(sorted(self._get_builtins().items())),
+                   ','.join(getattr(module, '__name__', repr(module)) for module in self._lookup_modules))
+
+        if self._optimize or self._bindings:
+            options += ('optimize',)
+
+        if self._bindings:
+            options += ('bindings', repr(sorted(self._bindings.items())))
+
+        if self._lazy:
+            options += ('lazy',)
+
+        return options
+
+    def _get_builtins(self):
+        builtins = dict(Interpreter.DEFAULT_BUILTINS)
+        builtins.update(self._additional_builtins)
+        return builtins
+
+    def _compile(self, lines=None, key=None):
+        """
+        Creates the AST for the current template, using the compile cache if one is set.
+
+        :param lines: Scanned lines to parse, defaults to the text of the TemplateContext
+        :param str key: The cache key, computed from the text of the TemplateContext if not given
+        :return: The AST
+        :rtype: Template
+        """
+        if self._cache is not None:
+            if key is None:
+                key = self._cache.make_key(self._ctx.text(), self._compile_options())
+
+            tree = self._cache.get(key)
+            if tree is not None:
+                self.get_logger().debug('Using cached template {0}'.format(key))
+                return tree
+
+        if self._parallel and lines is None:
+            tree = parse_parallel(self._ctx, self._tokenizer_engine, self._max_workers)
+        else:
+            tokenizer = ENGINES[self._tokenizer_engine](self._ctx)
+            tokenizer.get_logger().setLevel(self.get_logger().level)
+            parser = Parser(tokenizer, self._ctx)
+
+            # parse the input and create a AST
+            tree = parser.parse(lines)
+
+        octx = OptimizerContext(self._get_builtins(), self._lookup_modules)
+
+        if self._bindings:
+            tree = specialize(tree, self._bindings, octx)
+        elif self._optimize:
+            tree = Optimizer().optimize(tree, octx)
+
+        if self._lazy:
+            tree = defer_prompts(tree, octx)
+
+        # calls with correct argument types skip the checks, wrong calls fail before the template runs
+        tree = infer_types(tree, octx)
+
+        # static lines are added to the output as one run
+        tree = merge_content_lines(tree, octx)
+
+        # variables are read and written by their slots, see contemply.frames
+        tree = resolve_slots(tree, octx.builtins)
+
+        if self._cache is not None:
+            self._cache.put(key, tree)
+
+        return tree
+
+    def _process(self, lines=None, key=None):
+        tree = self._compile(lines, key)
+
+        interpreter = BACKENDS[self._backend](self._ctx)
         interpreter.get_logger().setLevel(self.get_logger().level)
 
         # register modules
-        interpreter.add_function_lookup(self._lookup_modules)
+        interpreter.set_function_table(self.get_function_table())
+        interpreter.set_call_cache(self._call_cache)
+        interpreter.set_fragment_cache(self._fragment_cache)
+
+        if self._budget is not None:
+            interpreter.set_budget(self._budget)
 
         for symbol, val in self._additional_builtins.items():
             interpreter.add_builtin(symbol, val)
 
-        # parse the input and create a AST
-        tree = parser.parse()
         # interpret the AST and execute all statements contained within
-        interpreter.interpret(tree)
+        try:
+            interpreter.interpret(tree)
+        finally:
+            self._usage = interpreter.get_usage()
+            self.get_logger().debug('Usage: {0}'.format(self._usage))
 
         # result will hold the contents of the parsed template
         result = interpreter.get_parsed_template()
 
+        if self._call_cache is not None:
+            self.get_logger().debug('Call cache: {0}'.format(self._call_cache.get_stats()))
+
+        if self._fragment_cache is not None:
+            self.get_logger().debug('Fragment cache: {0}'.format(self._fragment_cache.get_stats()))
+
         if self._output_mode == TemplateParser.OUTPUTMODE_FILE:
             for target_file, content in result.items():
                 if target_file == Interpreter.DEFAULT_TARGET:
@@ -122,9 +427,9 @@ class TemplateParser:
                         continue
 
                     # Prompt for outputfile
-                    target_file = cli.user_input('Please enter the filename of the new file: ')
+                    target_file = self._ctx.process_variables(
+                        cli.user_input('Please enter the filename of the new file: '))
 
-                target_file = self._ctx.process_variables(target_file)
                 path = get_secure_path(os.getcwd(), target_file)
                 disp_path = target_file.replace(os.getcwd(), '')
 
@@ -10,7 +10,7 @@ import os
 import contemply.cli as cli
 from colorama import Style, Fore
 from contemply.storage import get_secure_path
-from contemply.util import check_function_args
+from contemply.util import signature, pure, interactive
 
 """
 Built in functions
@@ -19,9 +19,9 @@ Built in functions
 
 # Interactive functions
 
+@interactive
+@signature('str', returns='str')
 def ask(args, ctx):
-    check_function_args(['ask', 'str'], args)
-
     prompt = args[0]
     if prompt[-1] != ' ':
         prompt = prompt + ' '
@@ -30,9 +30,9 @@ def ask(args, ctx):
     return answer
 
 
+@interactive
+@signature('str', 'list')
 def choose(args, ctx):
-    check_function_args(['choose', 'str', 'list'], args)
-
     choices = args[1]
     prompt = args[0]
     print(Style.BRIGHT + prompt + Style.RESET_ALL)
@@ -52,8 +52,9 @@ def choose(args, ctx):
     return choices[int(answer) - 1]
 
 
+@interactive
+@signature('str', '*str', returns='bool')
 def yesno(args, ctx):
-    check_function_args(['yesno', 'str', '*str'], args)
     default = 'Yes' if len(args) != 2 else args[1]
 
     return cli.prompt(args[0], default)
@@ -69,40 +70,45 @@ def setOutput(args, ctx):
 
 # Other functions
 
+@signature('str', returns='str')
 def env(args, ctx):
-    check_function_args(['env', 'str'], args)
     return os.environ[args[0]]
 
 
+@signature('str')
 def echo(args, ctx):
-    check_function_args(['echo', 'str'], args)
     print(ctx.process_variables(str(args[0])))
 
 
 # String functions
 
+@pure(cacheable=False)
+@signature('str', returns='str')
 def uppercase(args, ctx):
-    check_function_args(['uppercase', 'str'], args)
     return args[0].upper()
 
 
+@pure(cacheable=False)
+@signature('str', returns='str')
 def lowercase(args, ctx):
-    check_function_args(['lowercase', 'str'], args)
     return args[0].lower()
 
 
+@pure(cacheable=False)
+@signature('str', returns='str')
 def capitalize(args, ctx):
-    check_function_args(['capitalize', 'str'], args)
     return args[0].capitalize()
 
 
+@pure(cacheable=False)
+@signature('str', 'str', returns='bool')
 def contains(args, ctx):
-    check_function_args(['contains', 'str', 'str'], args)
     return args[1] in args[0]
 
 
+@pure(cacheable=False)
+@signature('str', 'str, list', 'str', returns='str')
 def replace(args, ctx):
-    check_function_args(['replace', 'str', 'str, list', 'str'], args)
     search = args[1] if isinstance(args[1], list) else [args[1]]
     result = args[0]
 
@@ -114,16 +120,16 @@ def replace(args, ctx):
 
 # Misc functions working on types
 
+@pure(cacheable=False)
+@signature('*str,list', returns='int')
 def size(args, ctx):
-    check_function_args(['size', '*str,list'], args)
-
     return len(args[0])
 
 
 # Filesystem functions
 
+@signature('str', '*str')
 def makeFolders(args, ctx):
-    check_function_args(['makeFolders', 'str', '*str'], args)
     path = get_secure_path(os.getcwd(), ctx.process_variables(args[0]))
 
     if len(args) == 2:
@@ -0,0 +1,182 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Incremental parsing for editors.
+
+The template is split into chunks of top-level statements (see contemply.scanner.scan_top_level): every
+top-level command line, control structure or command block is a chunk, and so is every run of content
+lines. Chunks are parsed on their own, in recovering mode so every error of a chunk is reported, and their
+nodes are kept, keyed by the text of the chunk. After an edit only the chunks whose text changed are parsed
+again, all other subtrees are reused.
+"""
+
+import re
+
+from contemply.ast import Template, Block
+from contemply.parser import TemplateContext, Parser, Diagnostic
+from contemply.scanner import scan_top_level, LINE_CONTENT, LINE_COMMAND, LINE_BLOCK_TOGGLE
+from contemply.tokenizer import ENGINES
+
+_ASSIGNMENT = re.compile(r'\s*(?:lazy\s+)?([A-Za-z_]\w*)\s*\+?=(?!=)')
+_FOR_ITEM = re.compile(r'\s*for\s+([A-Za-z_]\w*)\s+in\b')
+
+
+class Chunk:
+    """
+    The parse result of a part of the template.
+    """
+
+    __slots__ = ('text', 'children', 'errors')
+
+    def __init__(self, text, children, errors):
+        self.text = text
+        self.children = children
+        self.errors = errors
+
+
+class IncrementalParser:
+    """
+    Parses a template that is edited repeatedly and reuses the subtrees of unchanged chunks.
+    """
+
+    def __init__(self, engine='classic'):
+        """
+        :param str engine: The name of the tokenizer engine
+        """
+        self._engine = engine
+        self._chunks = {}
+        self._lines = []
+
+        self.tree = None
+        self.diagnostics = []
+        self.symbols = {}
+
+        # statistics of the last update
+        self.reused = 0
+        self.parsed = 0
+
+    def update(self, text):
+        """
+        Parses the new text of the template and returns the AST. Chunks that contain errors are left out
+        of the AST, the errors are available in the diagnostics attribute afterwards.
+
+        :param str text: The complete text of the template
+        :return: The AST
+        :rtype: Template
+        """
+        chunks = {}
+        diagnostics = []
+        symbols = {}
+        lines = []
+
+        tree = Template()
+        tree.main_block = Block()
+        children = tree.main_block.children
+
+        self.reused = self.parsed = 0
+
+        def add_chunk(first_line, start, end):
+            # the line break before the next chunk does not belong to this one
+            chunk_text = text[start:end - 1] if end is not None else text[start:]
+            chunk = chunks.get(chunk_text) or self._chunks.get(chunk_text)
+
+            if chunk is None:
+                chunk = self._parse_chunk(chunk_text)
+                self.parsed += 1
+            else:
+                self.reused += 1
+
+            chunks[chunk_text] = chunk
+
+            if chunk.errors:
+                diagnostics.extend(Diagnostic(first_line + d.line, d.col, d.message, d.kind) for d in chunk.errors)
+            else:
+                children.extend(chunk.children)
+
+        chunk_start = chunk_line = 0
+        previous = None
+        cmd_block = False
+
+        for number, (kind, line, offset, last, top_level) in enumerate(scan_top_level(text)):
+            lines.append(line)
+
+            # a new chunk starts with every top-level statement and with every run of content lines
+            if top_level and number > 0 and (kind != LINE_CONTENT or previous != LINE_CONTENT):
+                add_chunk(chunk_line, chunk_start, offset)
+                chunk_start, chunk_line = offset, number
+
+            previous = kind if top_level else None
+
+            if kind == LINE_BLOCK_TOGGLE:
+                cmd_block = not cmd_block
+            elif kind == LINE_COMMAND:
+                self._collect_symbols(symbols, line[2:], number, 2)
+            elif kind == LINE_CONTENT and cmd_block:
+                self._collect_symbols(symbols, line, number, 0)
+
+        add_chunk(chunk_line, chunk_start, None)
+
+        self._chunks = chunks
+        self._lines = lines
+        self.tree = tree
+        self.diagnostics = diagnostics
+        self.symbols = symbols
+
+        return tree
+
+    def _collect_symbols(self, symbols, command, line, col):
+        match = _ASSIGNMENT.match(command) or _FOR_ITEM.match(command)
+
+        if match is not None and match.group(1) not in symbols:
+            symbols[match.group(1)] = (line, col + match.start(1))
+
+    def _parse_chunk(self, text):
+        ctx = TemplateContext()
+        ctx.set_text(text)
+
+        parser = Parser(ENGINES[self._engine](ctx), ctx, recover=True)
+        tree = parser.parse()
+
+        return Chunk(text, tree.main_block.children, parser.errors)
+
+    def line_text(self, line):
+        """
+        Returns the text of the given line of the current template.
+
+        :param int line: The line number (starting at 0)
+        :rtype: str
+        """
+        return self._lines[line] if 0 <= line < len(self._lines) else ''
+
+    def word_at(self, line, col):
+        """
+        Returns the identifier at the given position and whether it is followed by a parenthesis
+        (i.e. a function call).
+
+        :param int line: The line number (starting at 0)
+        :param int col: The column (starting at 0)
+        :return: A tuple (name, is_call), name is None if there is no identifier at the position
+        :rtype: tuple
+        """
+        text = self.line_text(line)
+
+        for match in re.finditer(r'[A-Za-z_]\w*', text):
+            if match.start() <= col <= match.end():
+                return match.group(0), text[match.end():].lstrip().startswith('(')
+
+        return None, False
+
+    def definition(self, name):
+        """
+        Returns the position of the first assignment to the given variable.
+
+        :param str name: Name of the variable
+        :return: A tuple (line, col) or None if the variable is never assigned
+        :rtype: tuple
+        """
+        return self.symbols.get(name)
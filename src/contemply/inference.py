@@ -0,0 +1,211 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Static type inference for calls of template functions.
+
+Template functions declared with contemply.util.signature check the types of their arguments on every call. The
+types of most arguments are known before the template runs though: literals, builtin values, return values of
+functions and variables that are only assigned values of one type. TypeInference marks the calls whose arguments
+are known to be correct, so they skip the check. Calls that can never be correct raise a ParserError before the
+template runs.
+
+Variables keep their values between templates that share a TemplateContext, so the type of a variable is only
+known if it is assigned at the top level of the template before it is read anywhere. Functions from extension
+modules could change any variable, so in templates calling them variables have no known type.
+"""
+
+import collections
+
+from contemply.ast import *
+from contemply.exceptions import ParserError
+from contemply.optimizer import OptimizerContext, Pass, iter_nodes, constant_value, _OPERATORS
+from contemply.util import Signature
+
+# values used to find the result type of an operation
+_SAMPLES = {str: 'a', int: 1, float: 1.5, bool: True, list: [], type(None): None}
+
+
+class TypeInference(Pass):
+    """
+    Marks calls of template functions whose argument types are known to be correct as checked and raises a
+    ParserError for calls that always fail. Calls of functions without a signature are left unchanged.
+    """
+
+    name = 'types'
+
+    def __init__(self):
+        self._variables = {}
+
+    def run(self, tree, octx):
+        self._variables = self.variable_types(tree, octx)
+
+        for node in iter_nodes(tree):
+            if type(node) is Function:
+                self.check(node, octx)
+
+    def variable_types(self, tree, octx):
+        """
+        Returns the possible types of the variables with a known type.
+
+        :param Template tree: The AST
+        :param OptimizerContext octx: The optimizer context
+        :return: Dictionary with a frozenset of types for every variable
+        :rtype: dict
+        """
+        values = collections.defaultdict(list)
+        assigned_at = {}
+        read_at = {}
+        itemvars = set()
+
+        for i, child in enumerate(tree.main_block.children):
+            statement = child.statement if type(child) is CommandLine else child
+
+            for node in iter_nodes(child):
+                node_type = type(node)
+
+                if node_type is Variable:
+                    if id(node) not in itemvars:
+                        read_at.setdefault(node.name, i)
+                elif node_type is Assignment:
+                    if node.type == 'ASSIGN':
+                        values[node.variable].append(node.value)
+                elif node_type is For:
+                    # the loop assigns values of any type
+                    itemvars.add(id(node.itemvar))
+                    values[node.itemvar.name].append(None)
+                elif node_type is Function and not octx.keeps_variables(node.name):
+                    return {}
+
+            if type(statement) is Assignment and statement.type == 'ASSIGN':
+                assigned_at.setdefault(statement.variable, i)
+
+        # reads in the value of the first assignment happen before the assignment
+        types = {name: frozenset() for name, i in assigned_at.items() if read_at.get(name, i + 1) > i}
+        changed = True
+
+        while changed:
+            changed = False
+
+            for name, old in types.items():
+                if old is None:
+                    continue
+
+                new = old
+                for value in values[name]:
+                    value_types = self.expression_type(value, types, octx) if value is not None else None
+
+                    if value_types is None:
+                        new = None
+                        break
+
+                    new = new | value_types
+
+                if new != old:
+                    types[name] = new
+                    changed = True
+
+        return types
+
+    def expression_type(self, node, types, octx):
+        """
+        Returns a frozenset with the possible types of the value of an expression, or None if they are not known.
+        Expressions that always raise an error have no possible types.
+
+        :param AST node: The expression
+        :param dict types: The possible types of the variables
+        :param OptimizerContext octx: The optimizer context
+        :rtype: frozenset
+        """
+        node_type = type(node)
+
+        if node_type is String or node_type is Num or node_type is Constant:
+            known, value = constant_value(node)
+            return frozenset([type(value)]) if known else None
+        elif node_type is List:
+            return frozenset([list])
+        elif node_type is Invariant:
+            return self.expression_type(node.expr, types, octx)
+        elif node_type is Variable:
+            if node.name in octx.builtins:
+                return frozenset([type(octx.builtins[node.name])])
+
+            return types.get(node.name) if node.index is None else None
+        elif node_type is SimpleExpression:
+            left = self.expression_type(node.lval, types, octx)
+            right = self.expression_type(node.rval, types, octx)
+
+            if left is None or right is None or node.op not in _OPERATORS or \
+                    not all(t in _SAMPLES for t in left | right):
+                return None
+
+            result = set()
+            for lval in left:
+                for rval in right:
+                    try:
+                        result.add(type(_OPERATORS[node.op](_SAMPLES[lval], _SAMPLES[rval])))
+                    except Exception:
+                        pass
+
+            return frozenset(result)
+        elif node_type is Function:
+            signature = getattr(octx.resolve_function(node.name), 'signature', None)
+
+            if isinstance(signature, Signature) and signature.returns is not None:
+                return frozenset([signature.returns])
+
+        return None
+
+    def check(self, node, octx):
+        """
+        Checks the arguments of a function call and marks the call as checked if they are correct.
+
+        :param Function node: The function call
+        :param OptimizerContext octx: The optimizer context
+        :raises: ParserError
+        """
+        signature = getattr(octx.resolve_function(node.name), 'signature', None)
+
+        if not isinstance(signature, Signature):
+            return
+
+        args = node.args.children
+
+        if len(args) < signature.required:
+            raise ParserError('{} expects at least {} arguments.'.format(signature.name, signature.required))
+
+        if len(args) > len(signature.types):
+            raise ParserError('{} accepts a maximum of {} arguments'.format(signature.name, len(signature.types)))
+
+        checked = True
+
+        for n, arg in enumerate(args):
+            types = self.expression_type(arg, self._variables, octx)
+
+            if not types:
+                checked = False
+            elif not types & signature.types[n]:
+                raise ParserError('{} expected {} as argument number {}'.format(signature.name, signature.labels[n],
+                                                                               n))
+            elif not types <= signature.types[n]:
+                checked = False
+
+        node.checked = checked
+
+
+def infer_types(tree, octx=None):
+    """
+    Runs the type inference over the given template. The tree is changed in place.
+
+    :param Template tree: The AST
+    :param OptimizerContext octx: The optimizer context
+    :return: The AST
+    :rtype: Template
+    :raises: ParserError
+    """
+    TypeInference().run(tree, octx or OptimizerContext())
+    return tree
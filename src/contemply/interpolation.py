@@ -0,0 +1,84 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Variables in content lines.
+
+Content lines, output expressions and file names contain variables in the $name or $name[index] notation. Their
+text is split into segments once, when the node is created, so rendering a line only looks up the variables and
+joins the pieces (see TemplateContext.render).
+"""
+
+import functools
+import re
+
+# a variable in a content line ($name or $name[index]) and the character following it
+VARIABLE_PATTERN = re.compile(r'(\$[\w_]+)(\[(\d+)\])?(\s|\W|$)', re.MULTILINE)
+
+
+def variable_text(val, match):
+    """
+    Returns the replacement for a match of VARIABLE_PATTERN.
+
+    :param Any val: The value of the variable
+    :param match: The match
+    :return: The text of the value followed by the character after the variable
+    :rtype: str
+    """
+    if isinstance(val, list) and match.group(2) is not None:
+        val = val[int(match.group(3))]
+    if not isinstance(val, str):
+        val = str(val)
+
+    return '{0}{1}'.format(val, match.group(4))
+
+
+def split_variables(text):
+    """
+    Splits a text into literal text and variables. The segments alternate between literal text (at even
+    positions) and variables (at odd positions), a variable is a tuple (name, index) with index None if the
+    variable is not indexed. The index is only used if the value is a list, just like variable_text() does.
+
+    :param str text: The text
+    :return: Tuple with the segments, None if the text contains no variables
+    :rtype: tuple
+    """
+    if '$' not in text:
+        return None
+
+    return _split(text)
+
+
+# every variable reference is stored once, templates use few distinct variables
+_references = {}
+
+
+@functools.lru_cache(maxsize=1024)
+def _split(text):
+    segments = []
+    pos = 0
+
+    for match in VARIABLE_PATTERN.finditer(text):
+        name, brackets, index = match.group(1, 2, 3)
+
+        if brackets is None:
+            reference = (name[1:], None)
+            end = match.end(1)
+        else:
+            reference = (name[1:], int(index))
+            end = match.end(2)
+
+        # the character after the variable is part of the next literal
+        segments.append(text[pos:match.start()])
+        segments.append(_references.setdefault(reference, reference))
+        pos = end
+
+    if not segments:
+        return None
+
+    segments.append(text[pos:])
+    return tuple(segments)
@@ -6,54 +6,279 @@
 #
 
 import logging
+import operator
 import sys, os
 
 import contemply.functions
 from contemply.ast import *
-from contemply.util import check_function_args
+from contemply.util import check_function_args, IMMUTABLE_TYPES
 from contemply.exceptions import *
+from contemply.budget import Budget
+from contemply.fragments import FragmentCache, DEFAULT_SIZE as DEFAULT_FRAGMENT_CACHE_SIZE
+from contemply.frames import Frame, Lazy, UNSET, is_resolved, resolve_slots
+from contemply.memo import CallCache, DEFAULT_SIZE
 from contemply.storage import get_secure_path
+from contemply.symbols import FunctionTable
+
+class DispatchTable(dict):
+    """
+    Maps node types (or names) to the methods of a class called prefix + the lowercase type name (or the name).
+    A method is looked up the first time its key is used and then kept, so subclasses override visitors like any
+    other method, but have to do so in the class body.
+    """
+
+    def __init__(self, cls, prefix, default=None):
+        """
+        :param type cls: The class containing the methods
+        :param str prefix: The prefix of the method names
+        :param function default: The function for keys without a method
+        """
+        super().__init__()
+        self._cls = cls
+        self._prefix = prefix
+        self._default = default
+
+    def __missing__(self, key):
+        name = key if isinstance(key, str) else key.__name__.lower()
+        method = getattr(self._cls, self._prefix + name, self._default)
+        self[key] = method
+        return method
 
 
 class Interpreter:
     MAX_LOOP_RUNS = 10000
     DEFAULT_TARGET = '__default__'
+    DEFAULT_BUILTINS = {
+        'True': True,
+        'False': False,
+        'None': None
+    }
+    # results of cacheable pure functions kept by every interpreter, 0 disables the cache
+    CALL_CACHE_SIZE = DEFAULT_SIZE
+    # rendered cache blocks kept by every interpreter, 0 disables the cache
+    FRAGMENT_CACHE_SIZE = DEFAULT_FRAGMENT_CACHE_SIZE
+    OPERATORS = {
+        '==': operator.eq,
+        '<': operator.lt,
+        '>': operator.gt,
+        '<=': operator.le,
+        '>=': operator.ge,
+        '!=': operator.ne,
+        '+': operator.add,
+        '-': operator.sub,
+        '/': operator.truediv,
+        '*': operator.mul,
+    }
 
     def __init__(self, ctx):
-        self._BUILTINS = {
-            'True': True,
-            'False': False,
-            'None': None
-        }
+        self._BUILTINS = dict(self.DEFAULT_BUILTINS)
 
-        self._function_lookup = [contemply.functions]
+        # dispatch tables are shared by all instances of a class
+        self._visitors = self._get_dispatch_table('visit_', type(self).fallback_visit)
+        self._routines = self._get_dispatch_table('_run_')
+        self._internal_functions = self._get_dispatch_table('_internal_func_')
+
+        self._function_table = None
+
+        # inline caches, every function is resolved on its first call
+        self._calls = {}
+        self._checked_calls = {}
+        self._call_cache = CallCache(self.CALL_CACHE_SIZE) if self.CALL_CACHE_SIZE > 0 else None
+        self._fragment_cache = FragmentCache(self.FRAGMENT_CACHE_SIZE) if self.FRAGMENT_CACHE_SIZE > 0 else None
+        # whether the cache blocks of the running templates only call pure functions
+        self._cacheable_blocks = {}
 
         self._tree = []
         self._ctx = ctx
         self._line = 0
 
+        # the limits of a run and the resources the running template used
+        self._budget = Budget(max_while_runs=self.MAX_LOOP_RUNS)
+        self._meter = self._budget.start(ctx)
+
+        # the frame of the running template and its values
+        self._frame = None
+        self._values = None
+
         self.target = self.DEFAULT_TARGET
 
         self._break_current_loop = None
         self._loops_running = 0
 
         self._parsed_templates = {self.DEFAULT_TARGET: []}
+        self._invariants = {}
+
+    @classmethod
+    def _get_dispatch_table(cls, prefix, default=None):
+        # look in the class itself, a subclass needs its own tables
+        tables = cls.__dict__.get('_dispatch_tables')
+
+        if tables is None:
+            tables = {}
+            cls._dispatch_tables = tables
+
+        if prefix not in tables:
+            tables[prefix] = DispatchTable(cls, prefix, default)
+
+        return tables[prefix]
 
     def interpret(self, tree):
         self._tree = tree
+        outer = self._frame, self._values
+
+        self._frame = Frame(self.resolve_slots(tree), self._ctx.lookup)
+        self._values = self._frame.values
+        self._meter = self._budget.start(self._ctx)
+        self._ctx.push_frame(self._frame)
+
+        try:
+            self._execute(tree)
+        finally:
+            self._ctx.pop_frame()
+            self._frame, self._values = outer
+
+    def _execute(self, tree):
         self.visit(tree)
 
+    def resolve_slots(self, tree):
+        """
+        Returns the slots of the variables of a template, the template is resolved if it was not resolved for
+        the builtins of this interpreter.
+
+        :param Template tree: The AST
+        :rtype: Scope
+        """
+        if not is_resolved(tree, self._BUILTINS):
+            resolve_slots(tree, self._BUILTINS)
+
+        return tree.scope
+
     def get_logger(self):
         return logging.getLogger(self.__module__)
 
+    def get_budget(self):
+        return self._budget
+
+    def set_budget(self, budget):
+        """
+        Sets the limits for the templates this interpreter runs.
+
+        :param Budget budget: The limits
+        """
+        self._budget = budget
+
+    def get_usage(self):
+        """
+        Returns the resources the last template used, see Meter.get_usage().
+
+        :rtype: dict
+        """
+        usage = self._meter.get_usage()
+        usage['output'] = {target: sum(len(line) + 1 for line in lines)
+                           for target, lines in self._parsed_templates.items()}
+        return usage
+
     def get_parsed_template(self):
         return self._parsed_templates
 
     def add_function_lookup(self, lu):
-        if isinstance(lu, list):
-            self._function_lookup += lu
-        else:
-            self._function_lookup.append(lu)
+        modules = lu if isinstance(lu, list) else [lu]
+        self.set_function_table(FunctionTable(self.get_function_table().get_modules() + modules,
+                                              self.get_internal_functions()))
+
+    def get_function_table(self):
+        """
+        Returns the symbol table of the template functions.
+
+        :rtype: FunctionTable
+        """
+        if self._function_table is None:
+            self._function_table = FunctionTable([contemply.functions], self.get_internal_functions())
+
+        return self._function_table
+
+    def set_function_table(self, table):
+        """
+        Sets the symbol table of the template functions. The table has to contain contemply.functions.
+
+        :param FunctionTable table: The symbol table
+        """
+        self._function_table = table
+        self._calls = {}
+        self._checked_calls = {}
+        self._cacheable_blocks = {}
+
+    def get_call_cache(self):
+        """
+        Returns the cache for the results of pure functions or None if results are not cached.
+
+        :rtype: CallCache
+        """
+        return self._call_cache
+
+    def set_call_cache(self, cache):
+        """
+        Sets the cache for the results of pure functions, so it can be shared by several interpreters.
+
+        :param CallCache cache: The cache or None to disable caching
+        """
+        self._call_cache = cache
+        self._calls = {}
+        self._checked_calls = {}
+
+    def get_fragment_cache(self):
+        """
+        Returns the cache for the output of cache blocks or None if cache blocks always run.
+
+        :rtype: FragmentCache
+        """
+        return self._fragment_cache
+
+    def set_fragment_cache(self, cache):
+        """
+        Sets the cache for the output of cache blocks, so it can be shared by several interpreters or stored on disk.
+
+        :param FragmentCache cache: The cache or None to disable caching
+        """
+        self._fragment_cache = cache
+
+    @classmethod
+    def get_internal_functions(cls):
+        """
+        Returns the names of the internal functions.
+
+        :rtype: list
+        """
+        prefix = '_internal_func_'
+        return [name[len(prefix):] for name in dir(cls) if name.startswith(prefix)]
+
+    def resolve_function(self, name, checked=False):
+        """
+        Returns a callable for the template function with the given name, that takes the argument list and
+        the template context. Internal functions take precedence over the functions of the lookup modules.
+
+        :param str name: The name of the function
+        :param bool checked: Whether the arguments are known to be correct, see Function.checked
+        :rtype: function
+        """
+        internal = self._internal_functions[name]
+        if internal is not None:
+            return lambda args, ctx: internal(self, args)
+
+        call = self.get_function_table().resolve(name)
+
+        if call is not None:
+            target = getattr(call, 'unchecked', call) if checked else call
+
+            if self._call_cache is not None and getattr(call, 'pure', False) and getattr(call, 'cacheable', False):
+                return self._call_cache.wrap(call, target)
+
+            return target
+
+        def unknown(args, ctx):
+            raise ParserError("Unknown function: {0}".format(name), self._ctx)
+
+        return unknown
 
     def add_builtin(self, symbol, val):
         self._BUILTINS[symbol] = val
@@ -61,12 +286,98 @@ class Interpreter:
     def _cleanup(self):
         pass
 
+    def _defer(self, node):
+        return Lazy(node, self._evaluate_lazy)
+
+    def _evaluate_lazy(self, node):
+        # called when a lazy variable is read for the first time
+        value = self.visit(node.value)
+
+        if self._meter.max_value_size is not None:
+            self._meter.check_value(node.variable, value)
+
+        return value
+
+    def _load_lazy(self, slot, name):
+        value = self._frame.force(slot)
+
+        if value is UNSET:
+            raise ParserError('Unknown variable: "{0}"'.format(name), self._ctx)
+
+        return value
+
     def _add_content_line(self, content):
         if self.target not in self._parsed_templates:
+            self._meter.add_target(self.target)
             self._parsed_templates[self.target] = [content]
         else:
             self._parsed_templates[self.target].append(content)
 
+        if self._meter.max_output is not None:
+            self._meter.add_output(self.target, len(content) + 1)
+
+    def _add_content_lines(self, lines):
+        if self.target not in self._parsed_templates:
+            self._meter.add_target(self.target)
+            self._parsed_templates[self.target] = list(lines)
+        else:
+            self._parsed_templates[self.target].extend(lines)
+
+        if self._meter.max_output is not None:
+            self._meter.add_output(self.target, sum(len(line) for line in lines) + len(lines))
+
+    def _is_cacheable(self, node):
+        # a block that calls functions with side effects (e.g. echo() or ask()) or functions whose result does not
+        # only depend on their arguments (e.g. env()) has to run every time, output() only adds lines
+        cacheable = self._cacheable_blocks.get(node)
+
+        if cacheable is None:
+            table = self.get_function_table()
+            cacheable = self._cacheable_blocks[node] = all(
+                name == 'output' or (self._internal_functions[name] is None and
+                                     getattr(table.resolve(name), 'pure', False) is True) for name in node.calls)
+
+        return cacheable
+
+    def _fragment_key(self, node):
+        # the key of the output of a cache block, None if the block is not cached
+        cache = self._fragment_cache
+
+        if cache is None:
+            return None
+
+        if not self._is_cacheable(node):
+            cache.skipped += 1
+            return None
+
+        values = []
+        for name in node.reads:
+            value = self._ctx.lookup(name)
+            values.append(self._BUILTINS.get(name, UNSET) if value is UNSET else value)
+
+        return cache.make_block_key(node, values)
+
+    def _load_fragment(self, key):
+        # adds the stored output of a cache block, False if the block has to run
+        lines = self._fragment_cache.get(key) if key is not None else None
+
+        if lines is None:
+            return False
+
+        if lines:
+            self._add_content_lines(lines)
+
+        return True
+
+    def _output_position(self):
+        return self.target, len(self._parsed_templates.get(self.target, ()))
+
+    def _store_fragment(self, key, position):
+        # stores the lines a cache block added since the given position
+        if key is not None and self._fragment_cache is not None:
+            target, start = position
+            self._fragment_cache.put(key, tuple(self._parsed_templates.get(target, ())[start:]))
+
     ##########################
     # Internal functions
     ##########################
@@ -89,33 +400,21 @@ class Interpreter:
     ##########################
 
     def visit(self, node):
-        method_name = 'visit_' + type(node).__name__.lower()
-        visitor = getattr(self, method_name, self.fallback_visit)
-        # print('Visiting: ' + type(node).__name__)
-        return visitor(node)
+        return self._visitors[type(node)](self, node)
 
     def fallback_visit(self, node):
         raise ParserError('No visitor found for node {0}'.format(node))
 
     def visit_function(self, node):
-        # function
-        func = node.name
         args = self.visit(node.args)
 
-        # check for internal function
-        if hasattr(self, '_internal_func_{0}'.format(func)):
-            call = getattr(self, '_internal_func_{0}'.format(func))
-            return call(args)
+        calls = self._checked_calls if node.checked else self._calls
+        call = calls.get(node.name)
 
-        call = None
-        for f in self._function_lookup:
-            if hasattr(f, '{0}'.format(func)):
-                call = getattr(f, '{0}'.format(func))
+        if call is None:
+            call = calls[node.name] = self.resolve_function(node.name, node.checked)
 
-        if call is not None:
-            return call(args, self._ctx)
-        else:
-            raise ParserError("Unknown function: {0}".format(func), self._ctx)
+        return call(args, self._ctx)
 
     def visit_break(self, node):
         if self._loops_running <= 0:
@@ -132,22 +431,50 @@ class Interpreter:
     def visit_num(self, node):
         return int(node.value)
 
+    def visit_constant(self, node):
+        return node.value
+
+    def visit_invariant(self, node):
+        if node in self._invariants:
+            return self._invariants[node]
+
+        value = self.visit(node.expr)
+
+        # mutable values are created again every time, just like without the optimizer
+        if isinstance(value, IMMUTABLE_TYPES):
+            self._invariants[node] = value
+
+        return value
+
+    def _reset_invariants(self, loop):
+        # invariants keep their value while the loop runs, the next run of the loop computes them again
+        for invariant in loop.invariants:
+            self._invariants.pop(invariant, None)
+
     def visit_variable(self, node):
-        if node.name in self._BUILTINS:
-            return self._BUILTINS[node.name]
+        slot = node.slot
 
-        if self._ctx.has(node.name):
-            var = self._ctx.get(node.name)
-            if node.index is not None:
-                if isinstance(var, list):
-                    return var[node.index]
-                else:
-                    raise ParserError('Variable "{0}" is not a list.'.format(node.name), self._ctx)
-            else:
-                return var
+        if slot is not None:
+            var = self._values[slot]
+
+            if type(var) is Lazy:
+                var = self._frame.force(slot)
+        elif node.name in self._BUILTINS:
+            return self._BUILTINS[node.name]
         else:
+            var = self._ctx.lookup(node.name)
+
+        if var is UNSET:
             raise ParserError('Unknown variable: "{0}"'.format(node.name), self._ctx)
 
+        if node.index is not None:
+            if isinstance(var, list):
+                return var[node.index]
+            else:
+                raise ParserError('Variable "{0}" is not a list.'.format(node.name), self._ctx)
+
+        return var
+
     def visit_list(self, node):
         pylist = []
 
@@ -156,29 +483,104 @@ class Interpreter:
 
         return pylist
 
+    def _run(self, node):
+        """
+        Executes a statement node without recursing into nested blocks.
+
+        Compound statements (blocks, conditionals, loops) are executed by generator routines that yield the
+        child nodes they want to run. Children are executed on an explicit stack and their result is sent
+        back to the routine, so the nesting depth of a template is not limited by the Python recursion limit.
+
+        :param AST node: The node to execute
+        :return: The result of the node
+        """
+        routines = self._routines
+        visitors = self._visitors
+
+        routine = routines[type(node)]
+        if routine is None:
+            return visitors[type(node)](self, node)
+
+        stack = [routine(self, node)]
+        value = None
+
+        while stack:
+            try:
+                child = stack[-1].send(value)
+            except StopIteration as e:
+                stack.pop()
+                value = e.value
+            else:
+                routine = routines[type(child)]
+
+                if routine is not None:
+                    stack.append(routine(self, child))
+                    value = None
+                else:
+                    value = visitors[type(child)](self, child)
+
+        return value
+
     def visit_template(self, node):
-        self.visit(node.main_block)
+        self._run(node)
+
+    def _run_template(self, node):
+        yield node.main_block
 
     def visit_block(self, node):
+        self._run(node)
+
+    def _run_block(self, node):
+        meter = self._meter
+        meter.steps += len(node.children)
+
+        if meter.steps > meter.max_steps:
+            meter.exceeded_steps()
+
         for item in node.children:
-            self.visit(item)
+            # command lines only wrap their statement, so the statement is executed directly
+            yield item.statement if type(item) is CommandLine else item
 
             if self._break_current_loop is True:
                 # Do not process any more statements from this block
                 break
 
     def visit_contentline(self, node):
-        line = self._ctx.process_variables(node.content)
-        self._add_content_line(line)
+        segments = node.segments
+        self._add_content_line(node.content if segments is None else self._ctx.render(segments))
+
+    def visit_textrun(self, node):
+        self._add_content_lines(node.lines)
 
     def visit_commandline(self, node):
-        self.visit(node.statement)
+        self._run(node)
+
+    def _run_commandline(self, node):
+        yield node.statement
 
     def visit_assignment(self, node):
         if node.type == 'ASSIGN':
-            self._ctx.set(node.variable, self.visit(node.value))
+            if node.lazy and node.slot is not None:
+                self._values[node.slot] = self._defer(node)
+                return
+
+            value = self.visit(node.value)
+
+            if self._meter.max_value_size is not None:
+                self._meter.check_value(node.variable, value)
+
+            if node.slot is not None:
+                self._values[node.slot] = value
+            else:
+                self._ctx.set(node.variable, value)
         elif node.type == 'ASSIGN_PLUS':
-            list_var = self._ctx.get(node.variable)
+            list_var = self._values[node.slot] if node.slot is not None else self._ctx.lookup(node.variable)
+
+            if type(list_var) is Lazy:
+                list_var = self._frame.force(node.slot)
+
+            if list_var is UNSET:
+                raise ParserError('Unknown variable: {0}'.format(node.variable), self._ctx)
 
             # check var type
             if not isinstance(list_var, list):
@@ -186,33 +588,91 @@ class Interpreter:
             else:
                 list_var.append(self.visit(node.value))
 
+                if self._meter.max_value_size is not None:
+                    self._meter.check_value(node.variable, list_var)
+
     def visit_string(self, node):
         return node.value
 
     def visit_if(self, node):
+        return self._run(node)
+
+    def _run_if(self, node):
         if self.visit(node.condition):
-            self.visit(node.block)
+            yield node.block
             return True
         else:
             return False
 
     def visit_ifblock(self, node):
+        self._run(node)
+
+    def _run_ifblock(self, node):
         results = []
         for item in node._if:
-            results.append(self.visit(item))
+            results.append((yield item))
 
         if True not in results and node._else is not None:
             # all conditions returned false -> execute else block
-            self.visit(node._else)
+            yield node._else
 
     def visit_while(self, node):
+        self._run(node)
+
+    def _run_while(self, node):
         counter = 0
+        meter = self._meter
         self._loops_running += 1
+        self._reset_invariants(node)
 
         while (self.visit(node.expr)):
-            if counter >= self.MAX_LOOP_RUNS:
-                raise ParserError("Maximum loop iterations of {0} reached.".format(self.MAX_LOOP_RUNS))
-            self.visit(node.block)
+            if counter >= meter.max_while_runs:
+                meter.exceeded_loop_runs(meter.max_while_runs)
+            if meter.deadline is not None:
+                meter.check_time()
+            yield node.block
+
+            if self._break_current_loop:
+                self._break_current_loop = False
+                break
+
+            counter += 1
+
+        self._loops_running -= 1
+
+    def visit_countingwhile(self, node):
+        self._run(node)
+
+    def _run_countingwhile(self, node):
+        slot = node.slot
+
+        # only integer counters can be counted natively, everything else runs like any while loop
+        if slot is None or type(self._values[slot]) is not int:
+            return (yield from self._run_while(node))
+
+        self._reset_invariants(node)
+        bound = self.visit(node.bound)
+
+        if type(bound) is not int:
+            return (yield from self._run_while(node))
+
+        # the optimizer made sure that the body changes the counter by step in every iteration,
+        # so the condition does not have to be evaluated
+        if node.op == '<=':
+            bound += 1
+        elif node.op == '>=':
+            bound -= 1
+
+        counter = 0
+        meter = self._meter
+        self._loops_running += 1
+
+        for _ in range(self._values[slot], bound, node.step):
+            if counter >= meter.max_while_runs:
+                meter.exceeded_loop_runs(meter.max_while_runs)
+            if meter.deadline is not None:
+                meter.check_time()
+            yield node.block
 
             if self._break_current_loop:
                 self._break_current_loop = False
@@ -223,6 +683,9 @@ class Interpreter:
         self._loops_running -= 1
 
     def visit_for(self, node):
+        self._run(node)
+
+    def _run_for(self, node):
         # Check listvar
         listvar = self.visit(node.listvar)
 
@@ -233,18 +696,70 @@ class Interpreter:
         if len(listvar) == 0:
             return
 
+        # the list may grow while the loop runs
+        counter = 0
+        meter = self._meter
         self._loops_running += 1
+        self._reset_invariants(node)
+
+        name, slot = node.itemvar.name, node.itemvar.slot
+
+        if slot is None:
+            # the loop was created after the template was resolved
+            for item in listvar:
+                if self._break_current_loop:
+                    self._break_current_loop = False
+                    break
+                if counter >= meter.max_loop_runs:
+                    meter.exceeded_loop_runs(meter.max_loop_runs)
+                if meter.deadline is not None:
+                    meter.check_time()
+
+                counter += 1
+                self._ctx.set(name, item)
+                yield node.block
+        else:
+            # the item variable is local to the loop
+            previous = self._frame.bind(name, slot)
+            values = self._values
 
-        for item in listvar:
-            if self._break_current_loop:
-                self._break_current_loop = False
-                break
+            for item in listvar:
+                if self._break_current_loop:
+                    self._break_current_loop = False
+                    break
+                if counter >= meter.max_loop_runs:
+                    meter.exceeded_loop_runs(meter.max_loop_runs)
+                if meter.deadline is not None:
+                    meter.check_time()
+
+                counter += 1
+                values[slot] = item
+                yield node.block
 
-            self._ctx.set(node.itemvar.name, item)
-            self.visit(node.block)
+            self._frame.unbind(name, previous)
 
         self._loops_running -= 1
 
+    def visit_cacheblock(self, node):
+        self._run(node)
+
+    def _run_cacheblock(self, node):
+        key = self._fragment_key(node)
+
+        # the first statement of a block also runs if the break flag is set, so the output would be different
+        if self._break_current_loop is True:
+            key = None
+
+        if self._load_fragment(key):
+            return
+
+        position = self._output_position()
+        yield node.block
+
+        # a break in the last iteration of a for loop leaves the flag set, a hit would not set it
+        if self._break_current_loop is not True:
+            self._store_fragment(key, position)
+
     def visit_else(self, node):
         pass
 
@@ -255,34 +770,18 @@ class Interpreter:
         lval = self.visit(node.lval)
         rval = self.visit(node.rval)
 
-        if node.op == '==':
-            return lval == rval
-        elif node.op == '<':
-            return lval < rval
-        elif node.op == '>':
-            return lval > rval
-        elif node.op == '<=':
-            return lval <= rval
-        elif node.op == '>=':
-            return lval >= rval
-        elif node.op == '!=':
-            return lval != rval
-        elif node.op == '+':
-            return lval + rval
-        elif node.op == '-':
-            return lval - rval
-        elif node.op == '/':
-            return lval / rval
-        elif node.op == '*':
-            return lval * rval
-        else:
+        op = self.OPERATORS.get(node.op)
+        if op is None:
             raise ParserError("Unrecognized operator: {0}".format(node.op), self._ctx)
 
+        return op(lval, rval)
+
     def visit_noop(self, node):
         pass
 
     def visit_fileblockstart(self, node):
-        self.target = node.filename
+        # the variables of the name are replaced while they are visible, e.g. the item variable of a loop
+        self.target = self._ctx.process_variables(node.filename)
 
         if node.create_missing_folders:
             val = self.visit(node.create_missing_folders)
@@ -292,10 +791,10 @@ class Interpreter:
 
             if val:
                 self.get_logger().debug('FileBlockStart: create_missing_folders=True -> creating folders')
-                os.makedirs(os.path.dirname(get_secure_path(os.getcwd(), self._ctx.process_variables(self.target))))
+                os.makedirs(os.path.dirname(get_secure_path(os.getcwd(), self.target)))
 
     def visit_fileblockend(self, node):
         self.target = self.DEFAULT_TARGET
 
     def visit_outputexpression(self, node):
-        self._add_content_line(self._ctx.process_variables(node.content))
+        self.visit_contentline(node)
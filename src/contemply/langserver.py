@@ -0,0 +1,276 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+A minimal Language Server Protocol endpoint for .pytpl files, communicating over stdio.
+
+Supported requests and notifications: initialize, shutdown, exit, textDocument/didOpen,
+textDocument/didChange (full document sync), textDocument/didClose, textDocument/definition,
+textDocument/hover and textDocument/documentSymbol. Diagnostics are published after every change.
+
+Positions are sent as character offsets, which match the UTF-16 offsets of the protocol for all characters
+of the basic multilingual plane.
+"""
+
+import inspect
+import json
+import logging
+
+import contemply.functions
+from contemply.incremental import IncrementalParser
+from contemply.interpreter import Interpreter
+from contemply.symbols import FunctionTable
+
+# LSP constants
+SYNC_FULL = 1
+SEVERITY_ERROR = 1
+SYMBOL_VARIABLE = 13
+PARSE_ERROR, METHOD_NOT_FOUND, INTERNAL_ERROR = -32700, -32601, -32603
+
+
+def read_message(stream):
+    """
+    Reads a single JSON-RPC message from a binary stream.
+
+    :param stream: A readable binary stream
+    :return: The decoded message or None at the end of the stream
+    :rtype: dict
+    """
+    length = None
+
+    while True:
+        header = stream.readline()
+        if header == b'':
+            return None
+
+        header = header.strip()
+        if header == b'':
+            break
+
+        name, _, value = header.decode('ascii').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value.strip())
+
+    if length is None:
+        return None
+
+    return json.loads(stream.read(length).decode('utf-8'))
+
+
+def write_message(stream, message):
+    """
+    Writes a single JSON-RPC message to a binary stream.
+
+    :param stream: A writable binary stream
+    :param dict message: The message
+    """
+    body = json.dumps(message).encode('utf-8')
+    stream.write('Content-Length: {0}\r\n\r\n'.format(len(body)).encode('ascii') + body)
+    stream.flush()
+
+
+class LanguageServer:
+    """
+    Serves diagnostics and symbol lookup for Contemply templates. Every open document has its own
+    IncrementalParser, so only the changed parts of a document are parsed again after an edit.
+    """
+
+    def __init__(self, engine='classic', lookup_modules=None):
+        """
+        :param str engine: The name of the tokenizer engine
+        :param list lookup_modules: Additional modules containing template functions
+        """
+        self._engine = engine
+        self._functions = FunctionTable([contemply.functions] + (lookup_modules or []),
+                                        Interpreter.get_internal_functions())
+        self._documents = {}
+        self._output = None
+        self._shutdown = False
+
+    def get_logger(self):
+        return logging.getLogger(self.__module__)
+
+    def serve(self, input_stream, output_stream):
+        """
+        Handles messages until the client sends exit or closes the stream.
+
+        :param input_stream: Readable binary stream (usually stdin)
+        :param output_stream: Writable binary stream (usually stdout)
+        :return: The exit code
+        :rtype: int
+        """
+        self._output = output_stream
+
+        while True:
+            try:
+                message = read_message(input_stream)
+            except ValueError as e:
+                self._send({'jsonrpc': '2.0', 'id': None, 'error': {'code': PARSE_ERROR, 'message': str(e)}})
+                continue
+
+            if message is None or message.get('method') == 'exit':
+                return 0 if self._shutdown else 1
+
+            self.handle(message)
+
+    def handle(self, message):
+        """
+        Dispatches a single message to its handler and sends the response for requests.
+
+        :param dict message: The decoded message
+        """
+        method = message.get('method', '')
+        handler = getattr(self, 'handle_' + method.replace('/', '_').lower(), None)
+        is_request = 'id' in message
+
+        if handler is None:
+            if is_request:
+                self._send({'jsonrpc': '2.0', 'id': message['id'],
+                            'error': {'code': METHOD_NOT_FOUND, 'message': 'Unknown method: ' + method}})
+            return
+
+        try:
+            result = handler(message.get('params') or {})
+        except Exception as e:
+            # an error in one message must not stop the server, the client gets an error for requests
+            self.get_logger().exception('Could not handle {0}'.format(method))
+
+            if is_request:
+                self._send({'jsonrpc': '2.0', 'id': message['id'],
+                            'error': {'code': INTERNAL_ERROR, 'message': '{0}: {1}'.format(type(e).__name__, e)}})
+            return
+
+        if is_request:
+            self._send({'jsonrpc': '2.0', 'id': message['id'], 'result': result})
+
+    def _send(self, message):
+        if self._output is not None:
+            write_message(self._output, message)
+
+    def _notify(self, method, params):
+        self._send({'jsonrpc': '2.0', 'method': method, 'params': params})
+
+    ##########################
+    # Handlers
+    ##########################
+
+    def handle_initialize(self, params):
+        return {
+            'capabilities': {
+                'textDocumentSync': SYNC_FULL,
+                'definitionProvider': True,
+                'hoverProvider': True,
+                'documentSymbolProvider': True,
+            },
+            'serverInfo': {'name': 'contemply'}
+        }
+
+    def handle_initialized(self, params):
+        pass
+
+    def handle_shutdown(self, params):
+        self._shutdown = True
+
+    def handle_textdocument_didopen(self, params):
+        document = params['textDocument']
+        self._update(document['uri'], document['text'])
+
+    def handle_textdocument_didchange(self, params):
+        # with full document sync the last change contains the complete text
+        changes = params['contentChanges']
+        if changes:
+            self._update(params['textDocument']['uri'], changes[-1]['text'])
+
+    def handle_textdocument_didclose(self, params):
+        uri = params['textDocument']['uri']
+        self._documents.pop(uri, None)
+        self._notify('textDocument/publishDiagnostics', {'uri': uri, 'diagnostics': []})
+
+    def handle_textdocument_definition(self, params):
+        uri = params['textDocument']['uri']
+        document = self._documents.get(uri)
+        if document is None:
+            return None
+
+        name, is_call = document.word_at(params['position']['line'], params['position']['character'])
+        position = document.definition(name) if name is not None and not is_call else None
+
+        if position is None:
+            return None
+
+        return {'uri': uri, 'range': self._range(position[0], position[1], len(name))}
+
+    def handle_textdocument_hover(self, params):
+        document = self._documents.get(params['textDocument']['uri'])
+        if document is None:
+            return None
+
+        line, col = params['position']['line'], params['position']['character']
+        name, is_call = document.word_at(line, col)
+
+        if name is None:
+            return None
+
+        if is_call:
+            text = self.describe_function(name)
+        else:
+            position = document.definition(name)
+            text = 'Variable {0}, first assigned in line {1}'.format(name, position[0] + 1) \
+                if position is not None else None
+
+        return {'contents': {'kind': 'plaintext', 'value': text}} if text is not None else None
+
+    def handle_textdocument_documentsymbol(self, params):
+        document = self._documents.get(params['textDocument']['uri'])
+        if document is None:
+            return []
+
+        return [{'name': name, 'kind': SYMBOL_VARIABLE, 'range': self._range(line, col, len(name)),
+                 'selectionRange': self._range(line, col, len(name))}
+                for name, (line, col) in document.symbols.items()]
+
+    ##########################
+    # Helpers
+    ##########################
+
+    def describe_function(self, name):
+        """
+        Returns a description of a template function or None if the function does not exist.
+
+        :param str name: Name of the function
+        :rtype: str
+        """
+        if hasattr(Interpreter, '_internal_func_{0}'.format(name)):
+            return '{0}(...) - internal function'.format(name)
+
+        func = self._functions.resolve(name)
+
+        if func is None:
+            return None
+
+        doc = inspect.getdoc(func)
+        return '{0}(...) - function from {1}'.format(name, func.__module__) + ('\n\n' + doc if doc else '')
+
+    def _update(self, uri, text):
+        document = self._documents.get(uri)
+        if document is None:
+            document = self._documents[uri] = IncrementalParser(self._engine)
+
+        document.update(text)
+
+        self._notify('textDocument/publishDiagnostics', {
+            'uri': uri,
+            'diagnostics': [{
+                'range': self._range(d.line, d.col, 1),
+                'severity': SEVERITY_ERROR,
+                'source': 'contemply',
+                'message': '{0}: {1}'.format(d.kind, d.message)
+            } for d in document.diagnostics]
+        })
+
+    def _range(self, line, col, length):
+        return {'start': {'line': line, 'character': col}, 'end': {'line': line, 'character': col + length}}
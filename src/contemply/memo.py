@@ -0,0 +1,104 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Memoization of pure template functions.
+
+Functions declared with contemply.util.pure only depend on their arguments, so the results of their calls can be
+reused. The cache keeps the results of the calls that were used last. Only immutable results are kept, a list
+returned from the cache could be changed by the template. Calls that raise an error are not cached.
+"""
+
+import collections
+
+from contemply.util import IMMUTABLE_TYPES
+
+# the default number of results kept
+DEFAULT_SIZE = 1024
+
+
+def _key(args):
+    key = []
+
+    for arg in args:
+        # the type is part of the key, True == 1 but uppercase(True) would fail
+        arg_type = type(arg)
+        key.append(arg_type)
+        key.append(_key(arg) if arg_type is list else arg)
+
+    return tuple(key)
+
+
+class CallCache:
+    """
+    A bounded cache for the results of pure template functions that evicts the least recently used results.
+    """
+
+    def __init__(self, maxsize=DEFAULT_SIZE):
+        """
+        :param int maxsize: The maximum number of results kept
+        """
+        self._maxsize = maxsize
+        self._entries = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def wrap(self, func, target=None):
+        """
+        Returns a function that takes the argument list and the template context like func, but calls func
+        only for arguments it has not seen before.
+
+        :param function func: The pure template function, the results are cached for it
+        :param function target: The function that is called on a miss, defaults to func. Used to call func
+                                without checking its arguments.
+        :rtype: function
+        """
+        target = target or func
+        entries = self._entries
+
+        def cached(args, ctx):
+            try:
+                key = (func, _key(args))
+                value = entries[key]
+            except KeyError:
+                pass
+            except TypeError:
+                # unhashable arguments
+                return target(args, ctx)
+            else:
+                self.hits += 1
+                entries.move_to_end(key)
+                return value
+
+            self.misses += 1
+            value = target(args, ctx)
+
+            if isinstance(value, IMMUTABLE_TYPES):
+                entries[key] = value
+
+                if len(entries) > self._maxsize:
+                    entries.popitem(last=False)
+
+            return value
+
+        return cached
+
+    def get_stats(self):
+        """
+        Returns the statistics of the cache as a dictionary with the keys "hits", "misses", "size" and "maxsize".
+
+        :rtype: dict
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self._maxsize}
+
+    def clear(self):
+        """
+        Removes all results and resets the statistics.
+        """
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
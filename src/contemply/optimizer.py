@@ -0,0 +1,867 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+AST optimization passes.
+
+The Optimizer runs a pipeline of passes over the AST created by the Parser before it is executed. Every pass
+rewrites the tree in place and has to keep the output of the template unchanged, including its errors and the
+way the Interpreter handles break:
+
+- a Block checks the break flag after every statement, but always runs its first statement
+- every If of an IFBlock is evaluated and every If with a true condition runs its block
+- a For loop checks the flag before every iteration, so a break in the last iteration leaves it set
+
+Statements can therefore only be removed or moved where the break flag cannot be set when they run. The passes
+use may_break() to find those places.
+
+Loop passes need to know which variables a loop changes. Besides assignments and for loops, template functions
+could change variables through the TemplateContext, so loops calling functions from extension modules are left
+unchanged.
+"""
+
+import collections
+import logging
+
+import contemply.functions
+from contemply.ast import *
+from contemply.interpreter import Interpreter, IMMUTABLE_TYPES
+from contemply.symbols import FunctionTable
+
+_IMMUTABLE = IMMUTABLE_TYPES
+
+# folded strings longer than this are computed while the template runs
+MAX_FOLDED_LENGTH = 4096
+
+# the operators are folded with the functions the interpreter uses
+_OPERATORS = Interpreter.OPERATORS
+
+
+def may_break(node):
+    """
+    Returns whether the break flag may be set after the given statement ran (with the flag not set before).
+
+    :param AST node: A statement
+    :rtype: bool
+    """
+    node_type = type(node)
+
+    if node_type is Break:
+        return True
+    elif node_type is CommandLine:
+        return may_break(node.statement)
+    elif node_type is Block:
+        return any(may_break(child) for child in node.children)
+    elif node_type is IFBlock:
+        return any(may_break(item.block) for item in node._if) or \
+               (node._else is not None and may_break(node._else))
+    elif node_type is For:
+        # a break in the last iteration is not reset by the loop
+        return may_break(node.block)
+    elif node_type is CacheBlock:
+        # a loop in the block can leave the flag set, like a For loop in any other block
+        return may_break(node.block)
+
+    return False
+
+
+def iter_nodes(node):
+    """
+    Yields the given node and all nodes below it.
+
+    :param AST node: The root node
+    :rtype: generator
+    """
+    stack = [node]
+
+    while stack:
+        node = stack.pop()
+        yield node
+
+        node_type = type(node)
+
+        if node_type is Block or node_type is List or node_type is ArgumentList:
+            stack.extend(reversed(node.children))
+        elif node_type is CommandLine:
+            stack.append(node.statement)
+        elif node_type is CacheBlock:
+            stack.append(node.block)
+        elif node_type is IFBlock:
+            if node._else is not None:
+                stack.append(node._else)
+
+            stack.extend(reversed(node._if))
+        elif node_type is If:
+            stack += [node.block, node.condition]
+        elif node_type is While or node_type is CountingWhile:
+            stack += [node.block, node.expr]
+        elif node_type is For:
+            stack += [node.block, node.itemvar, node.listvar]
+        elif node_type is Assignment:
+            stack.append(node.value)
+        elif node_type is SimpleExpression:
+            stack += [node.rval, node.lval]
+        elif node_type is Function:
+            stack.append(node.args)
+        elif node_type is Invariant:
+            stack.append(node.expr)
+        elif node_type is Template:
+            stack.append(node.main_block)
+        elif node_type is FileBlockStart and isinstance(node.create_missing_folders, AST):
+            stack.append(node.create_missing_folders)
+
+
+def constant_value(node):
+    """
+    Returns a tuple (True, value) if the value of the given expression is known before the template runs,
+    (False, None) otherwise.
+
+    :param AST node: An expression
+    :rtype: tuple
+    """
+    node_type = type(node)
+
+    if node_type is Constant or node_type is String:
+        return True, node.value
+    elif node_type is Num:
+        try:
+            return True, int(node.value)
+        except (TypeError, ValueError):
+            pass
+
+    return False, None
+
+
+class OptimizerContext:
+    """
+    Everything the passes know about the environment the template will run in.
+    """
+
+    def __init__(self, builtins=None, lookup_modules=None):
+        """
+        :param dict builtins: The builtin values of the interpreter, defaults to Interpreter.DEFAULT_BUILTINS
+        :param list lookup_modules: Additional modules containing template functions
+        """
+        self.builtins = dict(Interpreter.DEFAULT_BUILTINS if builtins is None else builtins)
+        self.lookup_modules = [contemply.functions] + list(lookup_modules or [])
+        self.functions = FunctionTable(self.lookup_modules, Interpreter.get_internal_functions())
+
+    def resolve_function(self, name):
+        """
+        Returns the function the interpreter calls for the given name (internal functions are returned unbound)
+        or None if there is no such function.
+
+        :param str name: The name of the function
+        :rtype: function
+        """
+        if hasattr(Interpreter, '_internal_func_{0}'.format(name)):
+            return getattr(Interpreter, '_internal_func_{0}'.format(name))
+
+        return self.functions.resolve(name)
+
+    def is_pure(self, name):
+        """
+        Returns whether calls to the given function can be evaluated once and reused.
+
+        :param str name: The name of the function
+        :rtype: bool
+        """
+        return getattr(self.resolve_function(name), 'pure', False) is True
+
+    def is_interactive(self, name):
+        """
+        Returns whether the given function asks the user for a value, see contemply.util.interactive.
+
+        :param str name: The name of the function
+        :rtype: bool
+        """
+        return getattr(self.resolve_function(name), 'interactive', False) is True
+
+    def keeps_variables(self, name):
+        """
+        Returns whether the given function is known not to change template variables. This is true for the
+        internal functions, the functions of contemply.functions and pure functions.
+
+        :param str name: The name of the function
+        :rtype: bool
+        """
+        func = self.resolve_function(name)
+        return func is not None and (getattr(func, '__module__', None) in (Interpreter.__module__,
+                                                                          contemply.functions.__name__) or
+                                     self.is_pure(name))
+
+
+class LoopEffects:
+    """
+    The variables a loop changes.
+    """
+
+    def __init__(self, loop, octx):
+        """
+        :param AST loop: A While or For node
+        :param OptimizerContext octx: The optimizer context
+        """
+        # number of assignments for every variable
+        self.assignments = collections.Counter()
+        self.written = set()
+        self.appends = False
+        self.unknown_calls = False
+
+        if type(loop) is For:
+            self.written.add(loop.itemvar.name)
+
+        for node in iter_nodes(loop.block):
+            node_type = type(node)
+
+            if node_type is Assignment:
+                self.written.add(node.variable)
+
+                if node.type == 'ASSIGN':
+                    self.assignments[node.variable] += 1
+                else:
+                    # the list could also be stored in other variables
+                    self.appends = True
+            elif node_type is For:
+                self.written.add(node.itemvar.name)
+            elif node_type is Function and not octx.keeps_variables(node.name):
+                self.unknown_calls = True
+
+        # the condition can call functions, too
+        if type(loop) is not For:
+            for node in iter_nodes(loop.expr):
+                if type(node) is Function and not octx.keeps_variables(node.name):
+                    self.unknown_calls = True
+
+    def is_invariant(self, variable):
+        """
+        Returns whether the value of the variable with the given name is the same in every iteration.
+
+        :param str variable: The name of the variable
+        :rtype: bool
+        """
+        return not self.unknown_calls and not self.appends and variable not in self.written
+
+
+class Pass:
+    """
+    Base class of all optimization passes.
+    """
+
+    name = None
+
+    def run(self, tree, octx):
+        """
+        Optimizes the given template in place.
+
+        :param Template tree: The AST
+        :param OptimizerContext octx: The optimizer context
+        """
+        self.block(tree.main_block, False, octx)
+
+    def block(self, block, entry_break, octx):
+        """
+        Optimizes a block and all blocks nested in it. The default implementation only visits the nested blocks.
+
+        :param Block block: The block
+        :param bool entry_break: Whether the break flag may be set when the block starts
+        :param OptimizerContext octx: The optimizer context
+        """
+        for i, child in enumerate(block.children):
+            # every statement but the first only runs if the flag is not set
+            self.nested(child, entry_break and i == 0, octx)
+
+    def nested(self, node, entry_break, octx):
+        """
+        Optimizes the blocks nested in the given statement.
+        """
+        node_type = type(node)
+
+        if node_type is CommandLine:
+            self.nested(node.statement, entry_break, octx)
+        elif node_type is Block:
+            self.block(node, entry_break, octx)
+        elif node_type is IFBlock:
+            if_break = entry_break
+
+            for item in node._if:
+                self.block(item.block, if_break, octx)
+
+                # later blocks run even if this block sets the flag
+                if_break = if_break or may_break(item.block)
+
+            # the else block only runs if no other block ran
+            if node._else is not None:
+                self.block(node._else, entry_break, octx)
+        elif node_type is While or node_type is CountingWhile:
+            self.block(node.block, entry_break, octx)
+        elif node_type is For:
+            # the loop resets the flag before its body runs
+            self.block(node.block, False, octx)
+        elif node_type is CacheBlock:
+            self.block(node.block, entry_break, octx)
+
+
+class ConstantFolding(Pass):
+    """
+    Replaces expressions whose values are known before the template runs with Constant nodes: builtin values,
+    operations on literals and calls of pure functions with literal arguments. Expressions that would raise an error
+    are left unchanged, so the error is still raised while the template runs.
+    """
+
+    name = 'fold'
+
+    def block(self, block, entry_break, octx):
+        for child in block.children:
+            self.statement(child.statement if type(child) is CommandLine else child, octx)
+
+    def statement(self, node, octx):
+        node_type = type(node)
+
+        if node_type is Assignment:
+            node.value = self.expression(node.value, octx)
+        elif node_type is Block:
+            self.block(node, False, octx)
+        elif node_type is IFBlock:
+            for item in node._if:
+                item.condition = self.expression(item.condition, octx)
+                self.block(item.block, False, octx)
+
+            if node._else is not None:
+                self.block(node._else, False, octx)
+        elif node_type is While or node_type is CountingWhile:
+            node.expr = self.expression(node.expr, octx)
+            self.block(node.block, False, octx)
+        elif node_type is For or node_type is CacheBlock:
+            self.block(node.block, False, octx)
+        elif node_type is Function:
+            self.expression(node, octx)
+
+    def expression(self, node, octx):
+        """
+        Returns the folded expression.
+        """
+        node_type = type(node)
+
+        if node_type is Variable:
+            if node.name in octx.builtins and isinstance(octx.builtins[node.name], _IMMUTABLE):
+                return Constant(octx.builtins[node.name])
+        elif node_type is SimpleExpression:
+            node.lval = self.expression(node.lval, octx)
+            node.rval = self.expression(node.rval, octx)
+
+            return self.fold(node)
+        elif node_type is Function or node_type is List:
+            children = node.args.children if node_type is Function else node.children
+
+            for i, child in enumerate(children):
+                children[i] = self.expression(child, octx)
+
+            if node_type is Function and octx.is_pure(node.name):
+                return self.call(node, octx)
+
+        return node
+
+    def call(self, node, octx):
+        args = [constant_value(arg) for arg in node.args.children]
+
+        if not all(known for known, value in args):
+            return node
+
+        try:
+            # pure functions do not use the template context
+            value = octx.resolve_function(node.name)([value for known, value in args], None)
+        except Exception:
+            return node
+
+        if not isinstance(value, _IMMUTABLE) or (isinstance(value, str) and len(value) > MAX_FOLDED_LENGTH):
+            return node
+
+        return Constant(value)
+
+    def fold(self, node):
+        known_l, lval = constant_value(node.lval)
+        known_r, rval = constant_value(node.rval)
+
+        if not known_l or not known_r or node.op not in _OPERATORS:
+            return node
+
+        # do not create huge strings for templates that might never need them
+        if node.op == '*' and (isinstance(lval, str) or isinstance(rval, str)):
+            count = rval if isinstance(lval, str) else lval
+            text = lval if isinstance(lval, str) else rval
+
+            if isinstance(count, int) and len(text) * count > MAX_FOLDED_LENGTH:
+                return node
+
+        try:
+            value = _OPERATORS[node.op](lval, rval)
+        except Exception:
+            return node
+
+        if not isinstance(value, _IMMUTABLE) or (isinstance(value, str) and len(value) > MAX_FOLDED_LENGTH):
+            return node
+
+        return Constant(value)
+
+
+class DeadBranchElimination(Pass):
+    """
+    Removes the Ifs of an IFBlock whose conditions are always false, the else block if one condition is always
+    true and while loops that never run. An IFBlock that runs a single known block is replaced by the block.
+    """
+
+    name = 'branches'
+
+    def block(self, block, entry_break, octx):
+        children = block.children
+
+        for i, child in enumerate(children):
+            node = child.statement if type(child) is CommandLine else child
+            replacement = self.statement(node)
+
+            if replacement is not node:
+                children[i] = replacement
+
+        super().block(block, entry_break, octx)
+
+    def statement(self, node):
+        node_type = type(node)
+
+        if node_type is IFBlock:
+            items = []
+            always = False
+
+            for item in node._if:
+                known, value = constant_value(item.condition)
+
+                if not known:
+                    items.append(item)
+                elif value:
+                    items.append(item)
+                    always = True
+
+            node._if = items
+
+            if always:
+                node._else = None
+
+            if len(items) == 0:
+                return node._else if node._else is not None else NoOp()
+
+            if len(items) == 1 and always:
+                return items[0].block
+        elif node_type is While:
+            known, value = constant_value(node.expr)
+
+            if known and not value:
+                return NoOp()
+
+        return node
+
+
+class NoOpElimination(Pass):
+    """
+    Removes NoOp statements (comments, empty command lines, stray endif) from blocks.
+    """
+
+    name = 'noop'
+
+    def block(self, block, entry_break, octx):
+        children = block.children
+        kept = []
+
+        for i, child in enumerate(children):
+            node = child.statement if type(child) is CommandLine else child
+
+            # the first statement of a block also runs if the break flag is set, so if a NoOp is the first
+            # statement, removing it would run the next statement
+            if type(node) is NoOp and not (entry_break and len(kept) == 0 and i < len(children) - 1):
+                continue
+
+            kept.append(child)
+
+        block.children = kept
+
+        super().block(block, entry_break, octx)
+
+
+class BlockFlattening(Pass):
+    """
+    Moves the statements of Blocks nested directly in a block (e.g. left by DeadBranchElimination) into the
+    surrounding block.
+    """
+
+    name = 'flatten'
+
+    def block(self, block, entry_break, octx):
+        super().block(block, entry_break, octx)
+
+        children = []
+
+        for i, child in enumerate(block.children):
+            if type(child) is Block:
+                # an empty block as first statement stops the surrounding block if the flag is set, just like a NoOp
+                if len(child.children) > 0 or not (entry_break and i == 0 and len(block.children) > 1):
+                    children.extend(child.children)
+                    continue
+
+            children.append(child)
+
+        block.children = children
+
+
+class ContentMerging(Pass):
+    """
+    Merges runs of content lines and output expressions without variables into TextRun nodes, which add all of
+    their lines to the output at once. The lines are not copied, the TextRun keeps the strings of the merged nodes.
+
+    The pass runs for every template, so it walks the blocks on an explicit stack instead of recursing. The break
+    flag is assumed to be set at the start of every block but the main block and the bodies of for loops.
+    """
+
+    name = 'content'
+
+    def run(self, tree, octx):
+        stack = [(tree.main_block, False)]
+
+        while stack:
+            block, entry_break = stack.pop()
+            self.merge(block, entry_break)
+
+            for child in block.children:
+                node = child.statement if type(child) is CommandLine else child
+                node_type = type(node)
+
+                if node_type is Block:
+                    stack.append((node, True))
+                elif node_type is IFBlock:
+                    stack.extend((item.block, True) for item in node._if)
+
+                    if node._else is not None:
+                        stack.append((node._else, True))
+                elif node_type is While or node_type is CountingWhile:
+                    stack.append((node.block, True))
+                elif node_type is For:
+                    # the loop resets the flag before its body runs
+                    stack.append((node.block, False))
+                elif node_type is CacheBlock:
+                    stack.append((node.block, True))
+
+    def merge(self, block, entry_break):
+        """
+        Merges the runs of static lines of a block, the nested blocks are not changed.
+
+        :param Block block: The block
+        :param bool entry_break: Whether the break flag may be set when the block starts
+        """
+        children = []
+        run = []
+
+        for i, child in enumerate(block.children):
+            node = child.statement if type(child) is CommandLine else child
+            node_type = type(node)
+
+            # the first statement of a block also runs if the break flag is set, the lines after it do not
+            if (node_type is ContentLine or node_type is OutputExpression) and node.segments is None and \
+                    not (entry_break and i == 0):
+                run.append((child, node.content))
+                continue
+
+            self._flush(run, children)
+            children.append(child)
+
+        self._flush(run, children)
+        block.children = children
+
+    def _flush(self, run, children):
+        if len(run) == 1:
+            children.append(run[0][0])
+        elif len(run) > 1:
+            children.append(TextRun(tuple(content for child, content in run)))
+
+        del run[:]
+
+
+def merge_content_lines(tree, octx=None):
+    """
+    Merges the static content lines of a template, see ContentMerging. The tree is changed in place.
+
+    :param Template tree: The AST
+    :param OptimizerContext octx: The optimizer context
+    :return: The AST
+    :rtype: Template
+    """
+    ContentMerging().run(tree, octx or OptimizerContext())
+    return tree
+
+
+class LazyPrompts(Pass):
+    """
+    Makes the assignments of the answers of interactive functions lazy, so questions are asked when their answers
+    are used for the first time and questions whose answers are never used are not asked at all. Only assignments in
+    the main block whose arguments are literals are changed, they have the same value whenever they are computed.
+    """
+
+    name = 'lazy'
+
+    def run(self, tree, octx):
+        for child in tree.main_block.children:
+            node = child.statement if type(child) is CommandLine else child
+
+            if type(node) is Assignment and node.type == 'ASSIGN' and type(node.value) is Function and \
+                    octx.is_interactive(node.value.name) and self.is_literal(node.value.args, octx):
+                node.lazy = True
+
+    def is_literal(self, node, octx):
+        for child in iter_nodes(node):
+            if type(child) is Variable and child.name not in octx.builtins or type(child) is Function:
+                return False
+
+        return True
+
+
+def defer_prompts(tree, octx=None):
+    """
+    Makes the assignments of the answers of interactive functions lazy, see LazyPrompts. The tree is changed in place.
+
+    :param Template tree: The AST
+    :param OptimizerContext octx: The optimizer context
+    :return: The AST
+    :rtype: Template
+    """
+    LazyPrompts().run(tree, octx or OptimizerContext())
+    return tree
+
+
+class LoopInvariantHoisting(Pass):
+    """
+    Wraps function calls and operations whose values do not change while a loop runs in Invariant nodes that are
+    owned by the loop. An Invariant is computed when it is needed for the first time in a run of its loop, later
+    iterations reuse the value (see Interpreter.visit_invariant). Invariants are owned by the outermost loop they
+    are invariant in.
+    """
+
+    name = 'hoist'
+
+    def nested(self, node, entry_break, octx):
+        node_type = type(node)
+
+        if node_type is While or node_type is For:
+            effects = LoopEffects(node, octx)
+
+            if node_type is While:
+                node.expr = self.hoist(node.expr, node, effects, octx)
+
+            for statement in iter_nodes(node.block):
+                self.statement(statement, node, effects, octx)
+
+        super().nested(node, entry_break, octx)
+
+    def statement(self, node, loop, effects, octx):
+        node_type = type(node)
+
+        if node_type is Assignment:
+            node.value = self.hoist(node.value, loop, effects, octx)
+        elif node_type is If:
+            node.condition = self.hoist(node.condition, loop, effects, octx)
+        elif node_type is While:
+            node.expr = self.hoist(node.expr, loop, effects, octx)
+
+    def hoist(self, node, loop, effects, octx):
+        """
+        Returns the expression with its largest invariant subexpressions replaced by Invariant nodes.
+        """
+        node_type = type(node)
+
+        if node_type is Invariant:
+            return node
+
+        if (node_type is Function or node_type is SimpleExpression) and self.is_invariant(node, effects, octx):
+            invariant = Invariant(node)
+            loop.invariants.append(invariant)
+            return invariant
+
+        if node_type is SimpleExpression:
+            node.lval = self.hoist(node.lval, loop, effects, octx)
+            node.rval = self.hoist(node.rval, loop, effects, octx)
+        elif node_type is Function or node_type is List:
+            # the call itself is kept, but its arguments can be invariant
+            children = node.args.children if node_type is Function else node.children
+
+            for i, child in enumerate(children):
+                children[i] = self.hoist(child, loop, effects, octx)
+
+        return node
+
+    def is_invariant(self, node, effects, octx):
+        node_type = type(node)
+
+        if node_type in (Constant, String, Num, Invariant):
+            return True
+        elif node_type is Variable:
+            return node.name in octx.builtins or effects.is_invariant(node.name)
+        elif node_type is SimpleExpression:
+            return node.op in _OPERATORS and self.is_invariant(node.lval, effects, octx) and \
+                   self.is_invariant(node.rval, effects, octx)
+        elif node_type is Function:
+            return octx.is_pure(node.name) and all(self.is_invariant(arg, effects, octx)
+                                                   for arg in node.args.children)
+        elif node_type is List:
+            return all(self.is_invariant(item, effects, octx) for item in node.children)
+
+        return False
+
+
+class CountingLoops(Pass):
+    """
+    Replaces while loops of the form
+
+        while i < bound
+            ...
+            i = i + step
+        endwhile
+
+    with CountingWhile nodes, which the interpreter runs as a loop over a range instead of evaluating the condition
+    in every iteration. The counter has to be changed exactly once in the loop, by an assignment directly in its
+    body, and the bound has to be invariant. The interpreter checks at run time that counter and bound are
+    integers and runs the loop like any while loop otherwise.
+    """
+
+    name = 'counting'
+
+    # the comparisons that end a loop counting up (step > 0) or down (step < 0)
+    OPERATORS = {'<': 1, '<=': 1, '>': -1, '>=': -1}
+
+    def block(self, block, entry_break, octx):
+        children = block.children
+
+        for i, child in enumerate(children):
+            node = child.statement if type(child) is CommandLine else child
+
+            if type(node) is While:
+                loop = self.counting_loop(node, octx)
+
+                if loop is not None:
+                    children[i] = loop
+
+        super().block(block, entry_break, octx)
+
+    def counting_loop(self, node, octx):
+        """
+        Returns a CountingWhile for the given loop or None if the loop does not count.
+        """
+        expr = node.expr
+
+        if type(expr) is not SimpleExpression or expr.op not in self.OPERATORS or type(expr.lval) is not Variable \
+                or expr.lval.index is not None or expr.lval.name in octx.builtins:
+            return None
+
+        name = expr.lval.name
+        effects = LoopEffects(node, octx)
+
+        if effects.unknown_calls or effects.assignments[name] != 1 or not self.is_bound(expr.rval, name, effects):
+            return None
+
+        step = None
+        for child in node.block.children:
+            statement = child.statement if type(child) is CommandLine else child
+
+            if type(statement) is Assignment and statement.variable == name:
+                step = self.get_step(statement, name)
+
+        # the loop has to run towards the bound
+        if step is None or (step > 0) != (self.OPERATORS[expr.op] > 0):
+            return None
+
+        loop = CountingWhile(expr, node.block, name, expr.op, expr.rval, step)
+        loop.invariants = node.invariants
+
+        return loop
+
+    def is_bound(self, node, counter, effects):
+        node_type = type(node)
+
+        if node_type in (Constant, Num, Invariant):
+            return True
+
+        # the interpreter checks that the bound is an integer, so appending to lists does not matter
+        return node_type is Variable and node.index is None and node.name != counter and \
+               node.name not in effects.written
+
+    def get_step(self, node, counter):
+        # counter = counter + n or counter = counter - n
+        value = node.value
+
+        if node.type != 'ASSIGN' or type(value) is not SimpleExpression or value.op not in ('+', '-') or \
+                type(value.lval) is not Variable or value.lval.name != counter or value.lval.index is not None:
+            return None
+
+        known, step = constant_value(value.rval)
+
+        if not known or type(step) is not int or step <= 0:
+            return None
+
+        return step if value.op == '+' else -step
+
+
+DEFAULT_PASSES = (ConstantFolding, DeadBranchElimination, NoOpElimination, BlockFlattening, LoopInvariantHoisting,
+                  CountingLoops)
+
+
+class Optimizer:
+    """
+    Runs a pipeline of optimization passes over an AST.
+    """
+
+    def __init__(self, passes=None):
+        """
+        :param list passes: The passes to run (Pass instances), defaults to DEFAULT_PASSES
+        """
+        self._passes = list(passes) if passes is not None else [p() for p in DEFAULT_PASSES]
+
+    def get_logger(self):
+        return logging.getLogger(self.__module__)
+
+    def get_passes(self):
+        """
+        Returns the passes of the pipeline.
+
+        :rtype: list
+        """
+        return self._passes
+
+    def add_pass(self, optimizer_pass):
+        """
+        Adds a pass to the end of the pipeline.
+
+        :param Pass optimizer_pass: The pass
+        """
+        self._passes.append(optimizer_pass)
+
+    def optimize(self, tree, octx=None):
+        """
+        Runs all passes over the given template. The tree is changed in place and returned.
+
+        Every single change keeps the template valid, so if a pass gives up because the template is nested too
+        deeply, the tree is used as far as it has been optimized.
+
+        :param Template tree: The AST
+        :param OptimizerContext octx: The optimizer context
+        :return: The optimized AST
+        :rtype: Template
+        """
+        octx = octx or OptimizerContext()
+
+        for optimizer_pass in self._passes:
+            try:
+                optimizer_pass.run(tree, octx)
+            except RecursionError:
+                self.get_logger().debug('Template is nested too deeply for optimizer pass {0}'.format(
+                    optimizer_pass.name))
+                break
+
+        return tree
@@ -0,0 +1,108 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Parallel parsing of large templates.
+
+Templates with many top-level file blocks are split at the file block boundaries (see
+contemply.scanner.split_file_blocks). The segments are parsed concurrently in a process pool and the
+children of their main blocks are joined in order, which results in the same AST as parsing the template
+sequentially.
+"""
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from contemply.ast import Template, Block
+from contemply.parser import TemplateContext, Parser
+from contemply.scanner import split_file_blocks
+from contemply.tokenizer import ENGINES
+
+# Segments are merged into chunks of at least this size, smaller templates are parsed sequentially
+MIN_CHUNK_SIZE = 64 * 1024
+
+
+def get_logger():
+    return logging.getLogger(__name__)
+
+
+def parse_segment(text, engine='classic'):
+    """
+    Parses a single segment of a template and returns the children of its main block.
+    This function is run in the worker processes.
+
+    :param str text: The text of the segment
+    :param str engine: The name of the tokenizer engine
+    :return: List with the top-level nodes of the segment
+    :rtype: list
+    """
+    ctx = TemplateContext()
+    ctx.set_text(text)
+
+    return Parser(ENGINES[engine](ctx), ctx).parse().main_block.children
+
+
+def chunk_bounds(starts, size, chunks, min_size=MIN_CHUNK_SIZE):
+    """
+    Merges neighbouring segments into at most the given number of chunks of roughly the same size.
+
+    :param list starts: The start offsets of the segments
+    :param int size: The length of the whole text
+    :param int chunks: The maximum number of chunks
+    :param int min_size: The minimum size of a chunk
+    :return: List with the start offset of every chunk
+    :rtype: list
+    """
+    target = max(size // max(chunks, 1), min_size)
+    bounds = [0]
+
+    for start in starts[1:]:
+        if start - bounds[-1] >= target and size - start >= target:
+            bounds.append(start)
+
+    return bounds
+
+
+def parse_parallel(ctx, engine='classic', max_workers=None, min_chunk_size=MIN_CHUNK_SIZE):
+    """
+    Parses the text of the given TemplateContext and returns the AST. Independent top-level file blocks are
+    parsed in a process pool.
+
+    If the template can not be split, or any segment fails to parse, the whole template is parsed
+    sequentially, so errors are reported exactly like they are without parallel parsing.
+
+    :param TemplateContext ctx: The template context holding the text to parse
+    :param str engine: The name of the tokenizer engine
+    :param int max_workers: The number of worker processes, defaults to the number of CPUs
+    :param int min_chunk_size: The minimum size of the text parsed by a single worker
+    :return: The AST
+    :rtype: Template
+    """
+    text = ctx.text()
+    workers = max_workers or os.cpu_count() or 1
+    bounds = chunk_bounds(split_file_blocks(text), len(text), workers, min_chunk_size)
+
+    if workers > 1 and len(bounds) > 1:
+        # every segment but the last one ends right before the line break that precedes the next segment
+        segments = [text[start:end - 1] for start, end in zip(bounds, bounds[1:])] + [text[bounds[-1]:]]
+
+        try:
+            with ProcessPoolExecutor(min(workers, len(segments))) as pool:
+                results = list(pool.map(parse_segment, segments, [engine] * len(segments)))
+        except Exception as e:
+            get_logger().debug('Parallel parsing failed, parsing sequentially: {0}'.format(e))
+        else:
+            node = Template()
+            node.main_block = Block()
+
+            for children in results:
+                node.main_block.children.extend(children)
+
+            return node
+
+    return Parser(ENGINES[engine](ctx), ctx).parse()
@@ -5,14 +5,24 @@
 # For more information on licensing see LICENSE file
 #
 
-import os, re, sys
+import bisect, os, re, sys
 
 import contemply.cli as cli
 from colorama import Fore, Style
+from contemply.fragments import analyze
+from contemply.frames import UNSET, Lazy
+from contemply.interpolation import VARIABLE_PATTERN, variable_text, split_variables
 from contemply.interpreter import *
+from contemply.scanner import *
 from contemply.tokenizer import *
 from contemply.storage import get_secure_path
 
+_NEWLINE = re.compile('\n')
+_NEWLINE_TOKEN, _EOF_TOKEN = Token(NEWLINE), Token(EOF)
+
+# "endcache" only ends a cache block if it is the only word of the statement, it can still be used as a name
+_ENDCACHE = re.compile(r'\s*(#:)?\s*endcache\s*$')
+
 
 class TemplateContext:
     """
@@ -22,11 +32,13 @@ class TemplateContext:
 
     def __init__(self):
         self._data = {}
+        # the frame of the template that is running
+        self._frame = None
         self._text = ''
         self._filename = ''
-        self._line = 0
         self._pos = 0
-        self._line_pos = 0
+        self._line_starts = None
+        self._current_line = None
 
     def set_text(self, text):
         """
@@ -36,6 +48,20 @@ class TemplateContext:
         :return:
         """
         self._text = text
+        self._pos = 0
+        self._line_starts = None
+        self._current_line = None
+
+    def set_current_line(self, line, text, offset):
+        """
+        Sets the line that is currently parsed. This is used when the template is streamed and the
+        complete text is not available, so only the current line can be used for error messages.
+
+        :param int line: The line number
+        :param str text: The text of the line
+        :param int offset: The position of the line inside the template
+        """
+        self._current_line = (line, text, offset)
 
     def text(self):
         """
@@ -45,6 +71,19 @@ class TemplateContext:
         """
         return self._text
 
+    def line_starts(self):
+        """
+        Returns the offsets at which the lines of the current text start.
+        The index is built once per text, the first time it is needed.
+
+        :return: List with the start offset of every line
+        :rtype: list
+        """
+        if self._line_starts is None:
+            self._line_starts = [0] + [match.end() for match in _NEWLINE.finditer(self._text)]
+
+        return self._line_starts
+
     def set_filename(self, val):
         """
         Sets the path of the template file.
@@ -55,21 +94,24 @@ class TemplateContext:
 
     def set_line(self, val):
         """
-        Sets the current line. Should usually not be used.
+        Moves the current position to the start of the given line. Should usually not be used.
 
         :param int val: line number
         """
-        self._line = val
+        if self._current_line is not None:
+            self._pos = self._current_line[2]
+            return
+
+        starts = self.line_starts()
+        self._pos = starts[min(max(val, 0), len(starts) - 1)]
 
     def set_pos(self, val):
         """
-        Sets the current position inside the text (column)
+        Sets the current position inside the text
 
         :param int val: The current character position
         """
-        diff =  val - self._pos
         self._pos = val
-        self._line_pos = self._line_pos +  diff
 
     def set_line_pos(self, val):
         """
@@ -78,15 +120,42 @@ class TemplateContext:
 
         :param int val: The current character position
         """
-        self._line_pos = val
+        self._pos = self._line_start() + val
 
     def line_pos(self):
         """
         Gets the current position inside the line (column)
         Only used for error messages
         """
-        return self._line_pos
+        return self._pos - self._line_start()
 
+    def _line_start(self):
+        if self._current_line is not None:
+            return self._current_line[2]
+
+        return self.line_starts()[self.line()]
+
+    def line_text(self, line=None):
+        """
+        Returns the text of a line in the template, without the line break.
+
+        :param int line: The line number, defaults to the current line
+        :return: The text of the line
+        :rtype: str
+        """
+        if self._current_line is not None:
+            return self._current_line[1] if line is None or line == self._current_line[0] else ''
+
+        starts = self.line_starts()
+
+        if line is None:
+            line = self.line()
+
+        if line < 0 or line >= len(starts):
+            return ''
+
+        end = starts[line + 1] - 1 if line + 1 < len(starts) else len(self._text)
+        return self._text[starts[line]:end]
 
     def filename(self):
         """
@@ -99,16 +168,20 @@ class TemplateContext:
 
     def line(self):
         """
-        Returns the current line in the template file
+        Returns the current line in the template file.
+        The line is computed from the current position using the line index.
 
         :return: Line  number
         :rtype: int
         """
-        return self._line
+        if self._current_line is not None:
+            return self._current_line[0]
+
+        return bisect.bisect_right(self.line_starts(), self._pos) - 1
 
     def pos(self):
         """
-        Returns the current character position inside the template file line
+        Returns the current character position inside the template text
         :return: Character position
         :rtype: int
         """
@@ -121,6 +194,17 @@ class TemplateContext:
         :param str varname: The name of the variable
         :param Any v: Variable value
         """
+        frame = self._frame
+
+        while frame is not None:
+            slot = frame.bindings.get(varname)
+
+            if slot is not None:
+                frame.values[slot] = v
+                return
+
+            frame = frame.parent
+
         self._data[varname] = v
 
     def get(self, varname):
@@ -132,29 +216,102 @@ class TemplateContext:
         :rtype: Any
         :raises: ParserError
         """
-        try:
-            return self._data[varname]
-        except KeyError:
+        value = self.lookup(varname)
+
+        if value is UNSET:
             raise ParserError('Unknown variable: {0}'.format(varname), self)
 
+        return value
+
+    def lookup(self, varname, force=True):
+        """
+        Returns the value of a variable or UNSET if it does not exist. Variables of the running template are
+        looked up in its frame, see contemply.frames.
+
+        :param str varname: Name of the variable
+        :param bool force: Whether the value of a lazy variable is computed, if not the Lazy value is returned
+        :return: Variable value
+        :rtype: Any
+        """
+        frame = self._frame
+
+        while frame is not None:
+            slot = frame.bindings.get(varname)
+
+            if slot is not None:
+                value = frame.values[slot]
+                return frame.force(slot) if force and type(value) is Lazy else value
+
+            frame = frame.parent
+
+        return self._data.get(varname, UNSET)
+
     def has(self, varname):
         """
-        Checks whether a variable with the given name exists.
+        Checks whether a variable with the given name exists. The value of a lazy variable is not computed.
 
         :param str varname: Name of the variable
         :return: True if variable exists, False if not
         :rtype: bool
         """
-        return varname in self._data
+        return self.lookup(varname, False) is not UNSET
 
     def get_all(self):
         """
-        Returns a dictionary with all the variables
+        Returns a dictionary with all the variables. While a template runs the dictionary is a copy of the
+        variables that are visible to the template, use set() to change them. Lazy variables whose value was not
+        computed yet are left out.
 
         :return: A dictionary with all defined variables
         :rtype: dict
         """
-        return self._data
+        if self._frame is None:
+            return self._data
+
+        frames = []
+        frame = self._frame
+
+        while frame is not None:
+            frames.append(frame)
+            frame = frame.parent
+
+        data = dict(self._data)
+
+        for frame in reversed(frames):
+            data.update(frame.get_visible())
+
+        return data
+
+    def push_frame(self, frame):
+        """
+        Sets the frame of a template that starts running, its variables hide the variables of the context.
+
+        :param Frame frame: The frame
+        """
+        frame.parent = self._frame
+        self._frame = frame
+
+    def pop_frame(self):
+        """
+        Removes the frame of the template that stopped running and stores its global variables.
+
+        :return: The frame
+        :rtype: Frame
+        """
+        frame = self._frame
+        self._frame = frame.parent
+
+        for varname, value in frame.get_globals().items():
+            self.set(varname, value)
+
+        # a lazy assignment that was never read still replaces the previous value
+        for varname in frame.get_deferred():
+            self.set(varname, UNSET)
+
+            if self._data.get(varname) is UNSET:
+                del self._data[varname]
+
+        return frame
 
     def set_position(self, line, col):
         """
@@ -164,7 +321,7 @@ class TemplateContext:
         :param int col: THe new column
         """
         self.set_line(line)
-        self.set_pos(col)
+        self._pos += col
 
     def process_variables(self, text):
         """
@@ -176,40 +333,89 @@ class TemplateContext:
         :return: The parsed text
         :rtype: str
         """
+        segments = split_variables(text)
+        return text if segments is None else self.render(segments)
+
+    def render(self, segments):
+        """
+        Joins the segments of a text created by contemply.interpolation.split_variables, with the values of
+        the variables in place of the variables.
+
+        :param tuple segments: The segments
+        :return: The text
+        :rtype: str
+        :raises: ParserError
+        """
+        pieces = list(segments)
 
-        def check_and_replace(match):
-            varname = match.group(1)[1:]  # strip trailing $
+        for i in range(1, len(pieces), 2):
+            varname, index = pieces[i]
+            value = self.lookup(varname)
 
-            if not self.has(varname):
+            if value is UNSET:
                 raise ParserError('Unknown variable: "{0}"'.format(varname), self)
-            else:
-                val = self.get(varname)
 
-                if isinstance(val, list) and match.group(2) is not None:
-                    val = val[int(match.group(3))]
-                if not isinstance(val, str):
-                    val = str(val)
+            if index is not None and isinstance(value, list):
+                value = value[index]
+
+            pieces[i] = value if isinstance(value, str) else str(value)
+
+        return ''.join(pieces)
+
+
+class Diagnostic:
+    """
+    An error found while parsing a template. Lines and columns start at 0.
+    """
+
+    __slots__ = ('line', 'col', 'message', 'kind')
 
-                return '{0}{1}'.format(val, match.group(4))
+    def __init__(self, line, col, message, kind):
+        self.line = line
+        self.col = col
+        self.message = message
+        self.kind = kind
 
-        p = re.compile(r'(\$[\w_]+)(\[(\d+)\])?(\s|\W|$)', re.MULTILINE)
-        text = p.sub(check_and_replace, text)
+    @classmethod
+    def from_exception(cls, e, line_offset=0):
+        """
+        Creates a diagnostic from the current position of the exception's TemplateContext.
+
+        :param TemplateException e: The exception
+        :param int line_offset: Added to the line number
+        :rtype: Diagnostic
+        """
+        if e.ctx is not None:
+            return cls(line_offset + e.ctx.line(), e.ctx.line_pos(), e.message, type(e).__name__)
+
+        return cls(line_offset, 0, e.message, type(e).__name__)
 
-        return text
+    def __repr__(self):
+        return '{0}({1}:{2}: {3})'.format(self.kind, self.line, self.col, self.message)
 
 
 class Parser:
     """
     This class will do the actual parsing. It needs a Tokenizer instance and will then create
     an AST from the input tokens that can be interpreted using the Interpreter.
+
+    In recovering mode errors do not stop the parser. Every error is recorded in the errors list and
+    parsing continues with the next line, so all errors of a template are found in one pass.
     """
 
-    def __init__(self, tokenizer, ctx):
+    def __init__(self, tokenizer, ctx, recover=False):
         self._token = None
         self._tokenizer = tokenizer
         self._ctx = ctx
 
         self._cmd_block_mode = False
+        self._lines = None
+        self._pending_line = None
+
+        self._recover = recover
+        self._at_eof = False
+        self._line = None
+        self.errors = []
 
     def _raise_error(self, msg):
         raise ParserError(msg, self._ctx)
@@ -217,63 +423,156 @@ class Parser:
     def get_logger(self):
         return logging.getLogger(self.__module__)
 
-    def parse(self):
-        root = self._consume_template()
+    def parse(self, lines=None):
+        """
+        Parses the template and returns the AST.
+
+        :param lines: Scanned lines to parse (see contemply.scanner), defaults to the text of the TemplateContext
+        :return: The AST
+        :rtype: Template
+        """
+        root = self._consume_template(lines)
         return root
 
+    def _run(self, routine):
+        """
+        Runs a parsing routine without recursing into nested blocks.
+
+        Routines are generators that yield a tuple of delimiters whenever they need a nested block. The
+        block is then parsed on an explicit stack and the resulting Block node is sent back to the routine,
+        so the nesting depth of a template is not limited by the Python recursion limit.
+
+        :param generator routine: The routine to run
+        :return: The return value of the routine
+        """
+        stack = [routine]
+        value = None
+
+        while stack:
+            try:
+                delim = stack[-1].send(value)
+            except StopIteration as e:
+                stack.pop()
+                value = e.value
+            else:
+                stack.append(self._consume_block(delim))
+                value = None
+
+        return value
+
     def _consume_block(self, delim=(EOF,)):
         node = Block()
 
         self._token = Token(None)
 
         while self._token.type() not in delim:
-            peek = self._tokenizer.get_next_token(True)
+            if self._pending_line is not None:
+                line, self._pending_line = self._pending_line, None
+            else:
+                line = next(self._lines, None)
 
-            if peek.type() == EOF and EOF not in delim:
-                raise ParserError('Unexpected end of file, expected {}'.format(', '.join(delim)))
+            if line is None:
+                self._at_eof = True
+                error = ParserError('Unexpected end of file, expected {}'.format(', '.join(delim)), self._ctx)
 
-            if peek.type() == COMMENT:
-                self._tokenizer.skip_until('\n')
-                self._token = self._tokenizer.get_next_token()  # NEWLINE or EOF
+                if self._recover:
+                    self.errors.append(Diagnostic.from_exception(error))
 
-            elif peek.type() == CMD_BLOCK:
-                self._token = self._tokenizer.get_next_token()
-                self._cmd_block_mode = not self._cmd_block_mode
-                self._token = self._tokenizer.get_next_token()
+                raise error
 
-            elif peek.type() == CMD_LINE_START or self._cmd_block_mode:
-                if not self._cmd_block_mode:
-                    self._token = self._tokenizer.get_next_token()
-                    self._token = self._tokenizer.get_next_token()
-                else:
-                    self._token = self._tokenizer.get_next_token()
+            kind, text, offset, last = line
 
-                # Check again for delim since block consumption is non-inclusive
-                if self._token.type() in delim:
-                    return node
+            if kind == LINE_COMMENT:
+                self._end_line(text, offset, last)
 
-                node.children.append(self._consume_cmd_line())
-            else:
-                node.children.append(self._consume_content_line())
+            elif kind == LINE_BLOCK_TOGGLE or kind == LINE_COMMAND or self._cmd_block_mode:
+                try:
+                    self._load_line(text, offset, last)
+
+                    if kind == LINE_BLOCK_TOGGLE:
+                        self._token = self._tokenizer.get_next_token()
+                        self._cmd_block_mode = not self._cmd_block_mode
+                        self._token = self._tokenizer.get_next_token()
+                    else:
+                        if not self._cmd_block_mode:
+                            self._token = self._tokenizer.get_next_token()
+                            self._token = self._tokenizer.get_next_token()
+                        else:
+                            self._token = self._tokenizer.get_next_token()
+
+                        if self._token.type() == SYMBOL and self._token.value() == 'endcache' and \
+                                _ENDCACHE.match(text):
+                            self._token = Token(ENDCACHE, self._token.value(), self._token.span())
+
+                        # Check again for delim since block consumption is non-inclusive
+                        if self._token.type() in delim:
+                            return node
+
+                        node.children.append((yield from self._consume_cmd_line()))
+
+                    # all statements should consume until NEWLINE or end of file
+                    if self._token.type() not in (NEWLINE, EOF):
+                        raise InternalError(
+                            'Statments did not consume whole line, got ' + self._token.type() + ' instead.',
+                            self._ctx)
 
-            # all statements should consume until NEWLINE or end of file
-            if self._token.type() not in (NEWLINE, EOF):
-                raise InternalError('Statments did not consume whole line, got ' + self._token.type() + ' instead.',
-                                    self._ctx)
+                except TemplateException as e:
+                    # the end of the file was reached in a nested block, there is nothing left to recover
+                    if not self._recover or self._at_eof:
+                        raise
+
+                    self.errors.append(Diagnostic.from_exception(e))
+                    self._skip_line()
             else:
-                self._ctx.set_line(self._ctx.line() + 1)
-                self._ctx.set_line_pos(0)
+                # Content lines are taken from the scanner as they are and never reach the tokenizer.
+                # Consume the whole run of content lines at once.
+                append = node.children.append
+                append(ContentLine(text))
+
+                for line in self._lines:
+                    if line[0] != LINE_CONTENT:
+                        self._pending_line = line
+                        break
+
+                    append(ContentLine(line[1]))
+                    last = line[3]
+
+                self._token = _EOF_TOKEN if last else _NEWLINE_TOKEN
 
         return node
 
-    def _consume_template(self):
+    def _load_line(self, text, offset, last):
+        # every line but the last one ends with a NEWLINE token
+        self._line = (text, offset, last)
+        self._tokenizer.load(text if last else text + '\n', offset)
+
+    def _skip_line(self):
+        # continue with the next line after an error, statements can span a single line only
+        text, offset, last = self._line
+        self._end_line(text, offset, last)
+
+    def _end_line(self, text, offset, last):
+        self._ctx.set_pos(offset + len(text))
+        self._token = _EOF_TOKEN if last else _NEWLINE_TOKEN
+
+    def _consume_template(self, lines=None):
 
         node = Template()
 
-        self._ctx.set_position(0, 0)
-        self._tokenizer.update_position()
+        self._ctx.set_pos(0)
+        self._lines = iter(lines) if lines is not None else scan_lines(self._ctx.text())
+        self._pending_line = None
+        self._at_eof = False
+        self.errors = []
+
+        try:
+            node.main_block = self._run(self._consume_block())
+        except TemplateException:
+            # in recovering mode the error has already been recorded
+            if not (self._recover and self._at_eof):
+                raise
 
-        node.main_block = self._consume_block()
+            node.main_block = Block()
 
         return node
 
@@ -284,13 +583,21 @@ class Parser:
             raise ParserError('Unexpected token, got ' + self._token.type() + ' expected ' + ttype, self._ctx)
 
     def _consume_cmd_line(self):
-        statement = self._consume_statement()
+        statement = yield from self._consume_statement()
         return CommandLine(statement)
 
-    def _consume_symbol(self):
+    def _consume_symbol(self, statement=False):
         name = self._token.value()
         self._token = self._consume_next_token(SYMBOL)
 
+        if statement and name == 'lazy' and self._token.type() == SYMBOL:
+            # "lazy" is only a keyword in front of an assignment, so it can still be used as a variable name
+            return self._consume_lazy_assignment()
+
+        return self._consume_name(name)
+
+    def _consume_name(self, name):
+        # the rest of a function call, an assignment or a variable after its name
         if self._token.type() == LPAR:
             node = self._consume_function(name)
         elif self._token.type() in (ASSIGN, ASSIGN_PLUS):
@@ -313,6 +620,32 @@ class Parser:
         value = self._consume_expression()
         return Assignment(name, value, assignment_type)
 
+    def _consume_lazy_assignment(self):
+        name = self._token.value()
+        self._token = self._consume_next_token(SYMBOL)
+
+        if self._token.type() != ASSIGN:
+            raise ParserError('Expected "=" after "lazy {0}"'.format(name), self._ctx)
+
+        node = self._consume_assignment(name)
+        node.lazy = True
+
+        stack = [node.value]
+        while stack:
+            child = stack.pop()
+
+            if type(child) is Variable and child.name == name:
+                raise ParserError('The value of lazy variable "{0}" can not read the variable itself'.format(name),
+                                  self._ctx)
+            elif type(child) is SimpleExpression:
+                stack += [child.lval, child.rval]
+            elif type(child) is Function:
+                stack += child.args.children
+            elif type(child) is List:
+                stack += child.children
+
+        return node
+
     def _consume_value(self):
         node = None
         if self._token.type() == SYMBOL:
@@ -332,7 +665,7 @@ class Parser:
     def _consume_while_loop(self):
         self._token = self._consume_next_token(WHILE)
         expr = self._consume_expression()
-        block = self._consume_block((ENDWHILE,))
+        block = yield (ENDWHILE,)
         node = While(expr, block)
         self._token = self._consume_next_token(ENDWHILE)
 
@@ -344,17 +677,36 @@ class Parser:
         self._token = self._consume_next_token(IN)
         listvar = self._consume_symbol()
 
-        block = self._consume_block((ENDFOR,))
+        block = yield (ENDFOR,)
         node = For(listvar, itemvar, block)
         self._token = self._consume_next_token(ENDFOR)
 
         return node
 
+    def _consume_cache_block(self):
+        self._token = self._consume_next_token(SYMBOL)
+
+        if self._token.type() != STRING:
+            # "cache" is only a keyword in front of the key of a cache block, so it can still be used as a name
+            return self._consume_name('cache')
+
+        key = self._token.value()
+        self._token = self._consume_next_token(STRING)
+
+        block = yield (ENDCACHE,)
+        node = CacheBlock(key, block)
+        self._token = self._consume_next_token(ENDCACHE)
+        analyze(node, self._ctx)
+
+        return node
+
     def _consume_statement(self):
-        if self._token.type() == SYMBOL:
-            node = self._consume_symbol()
+        if self._token.type() == SYMBOL and self._token.value() == 'cache':
+            node = yield from self._consume_cache_block()
+        elif self._token.type() == SYMBOL:
+            node = self._consume_symbol(True)
         elif self._token.type() == IF:
-            node = self._consume_if_block()
+            node = yield from self._consume_if_block()
         elif self._token.type() == ELSEIF:
             return NoOp()
         elif self._token.type() == ELSE:
@@ -363,13 +715,15 @@ class Parser:
             self._token = self._consume_next_token(ENDIF)
             return NoOp()
         elif self._token.type() == WHILE:
-            node = self._consume_while_loop()
+            node = yield from self._consume_while_loop()
         elif self._token.type() == ENDWHILE:
             node = NoOp()
         elif self._token.type() == FOR:
-            node = self._consume_for_loop()
+            node = yield from self._consume_for_loop()
         elif self._token.type() == ENDFOR:
             node = Endfor()
+        elif self._token.type() == ENDCACHE:
+            raise ParserError('Unexpected ENDCACHE: no cache block to close', self._ctx)
         elif self._token.type() == BREAK:
             self._token = self._consume_next_token(BREAK)
             node = Break()
@@ -445,7 +799,7 @@ class Parser:
     def _consume_if_block(self):
         self._token = self._consume_next_token(IF)
         cond = self._consume_expression()
-        block = self._consume_block((ELSE, ENDIF, ELSEIF))
+        block = yield (ELSE, ENDIF, ELSEIF)
         node = IFBlock()
         node._if.append(If(cond, block))
 
@@ -454,12 +808,12 @@ class Parser:
             if self._token.type() == ELSEIF:
                 self._token = self._consume_next_token(ELSEIF)
                 cond = self._consume_expression()
-                elseif_block = self._consume_block((ELSE, ELSEIF, ENDIF))
+                elseif_block = yield (ELSE, ELSEIF, ENDIF)
                 node._if.append(If(cond, elseif_block))
 
             elif self._token.type() == ELSE:
                 self._token = self._consume_next_token(ELSE)
-                else_block = self._consume_block((ENDIF,))
+                else_block = yield (ENDIF,)
                 node._else = else_block
 
             else:
@@ -468,11 +822,6 @@ class Parser:
         self._token = self._consume_next_token(ENDIF)
         return node
 
-    def _consume_content_line(self):
-        line = self._tokenizer.get_raw('\n')
-        self._token = self._tokenizer.get_next_token()
-        return ContentLine(line)
-
     def _consume_argument_list(self):
         node = ArgumentList()
         while self._token.type() != RPAR:
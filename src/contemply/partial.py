@@ -0,0 +1,209 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Partial evaluation of templates against known answers.
+
+Bindings fix the values of template variables, usually the answers to ask(), yesno() or choose() that are the
+same for every run (author, license, ...). Every assignment to a bound variable assigns the bound value instead,
+so the question is not asked anymore. Where the value of a bound variable is known, reads of the variable are
+replaced by its value and its $variables in content lines are inlined. The optimizer then removes the branches
+that depend on the bound values, so running the residual template only costs its remaining dynamic parts.
+
+The value of a variable is known after its assignment if the variable is assigned exactly once, at the top level
+of the template, nothing else in the template could change it and the assigned value is constant (a bound value,
+a literal or an expression the optimizer can fold, e.g. a call of a pure function with known arguments).
+"""
+
+import collections
+
+from contemply.ast import *
+from contemply.interpreter import IMMUTABLE_TYPES
+from contemply.optimizer import Optimizer, OptimizerContext, Pass, ConstantFolding, iter_nodes, constant_value
+from contemply.parser import VARIABLE_PATTERN, variable_text
+
+
+def value_node(value):
+    """
+    Returns an expression node for the given value.
+
+    :param Any value: A string, number, boolean, None or a list of these
+    :rtype: AST
+    :raises: ValueError
+    """
+    if isinstance(value, IMMUTABLE_TYPES):
+        return Constant(value)
+
+    if isinstance(value, (list, tuple)):
+        # a List node creates a new list in every run
+        node = List()
+        node.children = [value_node(item) for item in value]
+        return node
+
+    raise ValueError('Cannot bind a value of type {0}'.format(type(value).__name__))
+
+
+def inline_variables(text, values):
+    """
+    Replaces the given variables in a content line. Other variables are kept, so they are replaced while the
+    template runs. If inlining would change how the remaining variables are found (e.g. because a value contains a
+    $ sign), the text is returned unchanged.
+
+    :param str text: The content line
+    :param dict values: The known values by variable name
+    :return: The new content line
+    :rtype: str
+    """
+    pieces = []
+    kept = []
+    length = pos = 0
+    changed = False
+
+    for match in VARIABLE_PATTERN.finditer(text):
+        piece = None
+
+        if match.group(1)[1:] in values:
+            try:
+                piece = variable_text(values[match.group(1)[1:]], match)
+            except (IndexError, ValueError, TypeError):
+                # the error is raised while the template runs
+                piece = None
+
+        literal = text[pos:match.start()]
+        length += len(literal)
+
+        if piece is None:
+            piece = match.group(0)
+            kept.append((length, length + len(piece)))
+        else:
+            changed = True
+
+        pieces += [literal, piece]
+        length += len(piece)
+        pos = match.end()
+
+    if not changed:
+        return text
+
+    result = ''.join(pieces) + text[pos:]
+
+    if [match.span() for match in VARIABLE_PATTERN.finditer(result)] != kept:
+        return text
+
+    return result
+
+
+class BindVariables(Pass):
+    """
+    Assigns the bound values to bound variables and inlines the values where they are known.
+    """
+
+    name = 'bind'
+
+    def __init__(self, bindings):
+        """
+        :param dict bindings: The values of the bound variables by name
+        """
+        self._bindings = dict(bindings)
+
+    def run(self, tree, octx):
+        assignments = collections.Counter()
+        changing = set()
+        unknown_calls = False
+
+        for node in iter_nodes(tree):
+            node_type = type(node)
+
+            if node_type is Assignment:
+                if node.type != 'ASSIGN':
+                    changing.add(node.variable)
+                else:
+                    assignments[node.variable] += 1
+
+                    if node.variable in self._bindings:
+                        node.value = value_node(self._bindings[node.variable])
+            elif node_type is For:
+                changing.add(node.itemvar.name)
+            elif node_type is Function and not octx.keeps_variables(node.name):
+                unknown_calls = True
+
+        if unknown_calls:
+            return
+
+        # variables that can be inlined, in the order of their assignments
+        inline = {}
+        folding = ConstantFolding()
+
+        for child in tree.main_block.children:
+            statement = child.statement if type(child) is CommandLine else child
+
+            if inline:
+                self.inline(child, inline, octx)
+
+            if type(statement) is Assignment and statement.type == 'ASSIGN':
+                name = statement.variable
+
+                if assignments[name] != 1 or name in changing or name in octx.builtins:
+                    continue
+
+                statement.value = folding.expression(statement.value, octx)
+                known, value = constant_value(statement.value)
+
+                if known and isinstance(value, IMMUTABLE_TYPES):
+                    inline[name] = value
+
+    def inline(self, node, values, octx):
+        for child in iter_nodes(node):
+            child_type = type(child)
+
+            if child_type is ContentLine or child_type is OutputExpression:
+                child.content = inline_variables(child.content, values)
+            elif child_type is Assignment:
+                child.value = self.expression(child.value, values)
+            elif child_type is If:
+                child.condition = self.expression(child.condition, values)
+            elif child_type is While or child_type is CountingWhile:
+                child.expr = self.expression(child.expr, values)
+            elif child_type is Function:
+                children = child.args.children
+
+                for i, arg in enumerate(children):
+                    children[i] = self.expression(arg, values)
+
+    def expression(self, node, values):
+        node_type = type(node)
+
+        if node_type is Variable:
+            if node.index is None and node.name in values:
+                return Constant(values[node.name])
+        elif node_type is SimpleExpression:
+            node.lval = self.expression(node.lval, values)
+            node.rval = self.expression(node.rval, values)
+        elif node_type is List:
+            for i, item in enumerate(node.children):
+                node.children[i] = self.expression(item, values)
+
+        return node
+
+
+def specialize(tree, bindings, octx=None):
+    """
+    Specializes a template for the given bindings and optimizes the result. The tree is changed in place.
+
+    :param Template tree: The AST
+    :param dict bindings: The values of the bound variables by name
+    :param OptimizerContext octx: The optimizer context
+    :return: The residual template
+    :rtype: Template
+    :raises: ValueError
+    """
+    octx = octx or OptimizerContext()
+
+    optimizer = Optimizer()
+    optimizer.get_passes().insert(0, BindVariables(bindings))
+
+    return optimizer.optimize(tree, octx)
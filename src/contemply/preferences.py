@@ -43,6 +43,15 @@ class PreferencesProvider:
 
         self.get_logger().debug('Settings saved')
 
+    def get_cache_dir(self):
+        """
+        Returns the directory for cached data, next to the settings file.
+
+        :return: Path to the cache directory
+        :rtype: str
+        """
+        return os.path.join(os.path.dirname(self._get_settings_file('settings.json')), 'cache')
+
     def _get_settings_file(self, fname=''):
 
         if 'CONTEMPLY_SETTINGS_FILE' in os.environ:
@@ -5,10 +5,14 @@
 # For more information on licensing see LICENSE file
 #
 
+from contemply.util import signature
+
 builtins = {
     'Yes': True,
     'No': False
 }
 
+
+@signature(returns='str')
 def my_function(args, ctx):
     return 'Hello world!'
\ No newline at end of file
@@ -0,0 +1,151 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+The scanner is the first stage of the parsing process. It splits the template into lines and classifies
+every line using cheap prefix checks, so only command lines have to be handed to the tokenizer.
+"""
+
+import re
+
+# Line kinds
+LINE_CONTENT, LINE_COMMAND, LINE_BLOCK_TOGGLE, LINE_COMMENT = 'CONTENT', 'COMMAND', 'BLOCK_TOGGLE', 'COMMENT'
+
+
+def classify_line(line):
+    """
+    Returns the kind of the given line. Only the start of the line is checked, so indented
+    command lines are content lines (just like the tokenizer treats them).
+
+    :param str line: A single line without line break
+    :return: One of LINE_CONTENT, LINE_COMMAND, LINE_BLOCK_TOGGLE, LINE_COMMENT
+    :rtype: str
+    """
+    if line[:1] != '#':
+        return LINE_CONTENT
+
+    marker = line[1:3]
+    if marker == '::':
+        return LINE_BLOCK_TOGGLE
+    elif marker[:1] == ':':
+        return LINE_COMMAND
+    elif marker[:1] == '%':
+        return LINE_COMMENT
+
+    return LINE_CONTENT
+
+
+def scan_lines(text):
+    """
+    Splits the text into lines and yields a tuple (kind, line, offset, last) for every line.
+    offset is the position of the line inside the text, last is True for the last line.
+
+    :param str text: The template text
+    :rtype: generator
+    """
+    lines = text.split('\n')
+    last_line = lines.pop()
+    offset = 0
+
+    for line in lines:
+        if line[:1] != '#':
+            yield LINE_CONTENT, line, offset, False
+        else:
+            yield classify_line(line), line, offset, False
+
+        offset += len(line) + 1
+
+    yield classify_line(last_line), last_line, offset, True
+
+
+def scan_stream(stream, ctx=None):
+    """
+    Reads the lines of a template incrementally from a text stream (e.g. an open file) and yields the same
+    tuples as scan_lines. The complete text is never held in memory.
+
+    If a TemplateContext is given, it is told about every line read, so errors can still show the
+    offending source line.
+
+    :param stream: A readable text stream
+    :param TemplateContext ctx: The template context
+    :rtype: generator
+    """
+    offset = 0
+
+    for number, raw in enumerate(stream):
+        last = raw[-1:] != '\n'
+        line = raw if last else raw[:-1]
+        kind = LINE_CONTENT if line[:1] != '#' else classify_line(line)
+
+        if ctx is not None:
+            ctx.set_current_line(number, line, offset)
+
+        yield kind, line, offset, last
+
+        if last:
+            return
+
+        offset += len(raw)
+
+    # the text ended with a line break (or was empty), so the last line is empty
+    if ctx is not None:
+        ctx.set_current_line(number + 1 if offset else 0, '', offset)
+
+    yield LINE_CONTENT, '', offset, True
+
+
+# "cache" and "endcache" can be names, they only start and end a block in front of a key or on their own
+_BLOCK_OPEN = re.compile(r'\s*((if|while|for)\b|cache\s*["\'])')
+_BLOCK_CLOSE = re.compile(r'\s*((endif|endwhile|endfor)\b|endcache\s*$)')
+_FILE_BLOCK_START = re.compile(r'\s*>>')
+
+
+def scan_top_level(text):
+    """
+    Like scan_lines, but also tracks the nesting of control structures and command blocks. Yields a tuple
+    (kind, line, offset, last, top_level) for every line. top_level is True if the line starts a statement
+    that is not nested in if/while/for or inside a command block, e.g. the opening line of an if block.
+
+    The nesting is tracked with cheap prefix checks only, the lines are not tokenized.
+
+    :param str text: The template text
+    :rtype: generator
+    """
+    depth = 0
+    cmd_block = False
+
+    for kind, line, offset, last in scan_lines(text):
+        top_level = depth == 0 and not cmd_block
+
+        if kind == LINE_BLOCK_TOGGLE:
+            cmd_block = not cmd_block
+        elif kind == LINE_COMMAND or (cmd_block and kind == LINE_CONTENT):
+            command = line[2:] if kind == LINE_COMMAND else line
+
+            if _BLOCK_OPEN.match(command):
+                depth += 1
+            elif _BLOCK_CLOSE.match(command) and depth > 0:
+                depth -= 1
+
+        yield kind, line, offset, last, top_level
+
+
+def split_file_blocks(text):
+    """
+    Splits the text at top-level file blocks (command lines starting with >>) and returns the start offsets
+    of the resulting segments. A file block is only used as a boundary if it is not nested in a control
+    structure or a command block, so every segment can be parsed on its own.
+
+    Segments that cannot be parsed on their own must be handled by the caller (e.g. by parsing the whole
+    text again).
+
+    :param str text: The template text
+    :return: List with the start offset of every segment, the first one is always 0
+    :rtype: list
+    """
+    return [0] + [offset for kind, line, offset, last, top_level in scan_top_level(text)
+                  if top_level and offset > 0 and kind == LINE_COMMAND and _FILE_BLOCK_START.match(line, 2)]
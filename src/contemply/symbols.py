@@ -0,0 +1,108 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+The symbol table of template functions.
+"""
+
+
+class FunctionTable:
+    """
+    Maps the names of template functions to the functions of the lookup modules. The table is built when a module
+    is added, so resolving a name is a single dictionary lookup.
+
+    Precedence, from highest to lowest:
+
+    1. internal functions of the interpreter (output(), exit(), ...), they are resolved by the interpreter
+    2. the functions of the lookup modules, a module added later wins over the modules added before it
+
+    A function that is hidden by a function of the same name with a higher precedence is shadowed, see
+    get_shadowed().
+    """
+
+    def __init__(self, modules=None, internal=None):
+        """
+        :param list modules: The lookup modules in the order of their registration
+        :param list internal: The names of the internal functions of the interpreter
+        """
+        self._modules = []
+        self._functions = {}
+        self._owners = {}
+        self._shadowed = []
+        self._internal = frozenset(internal or [])
+
+        for module in modules or []:
+            self.add_module(module)
+
+    def add_module(self, module):
+        """
+        Adds the callable attributes of a module to the table. They shadow functions of the same name that are
+        already in the table.
+
+        :param module module: The lookup module
+        """
+        for name in dir(module):
+            if name.startswith('__'):
+                continue
+
+            func = getattr(module, name, None)
+            if not callable(func):
+                continue
+
+            if name in self._functions and self._functions[name] is not func:
+                self._shadowed.append((name, self._owners[name], module))
+
+            self._functions[name] = func
+            self._owners[name] = module
+
+        self._modules.append(module)
+
+    def get_modules(self):
+        """
+        Returns the lookup modules in the order of their registration.
+
+        :rtype: list
+        """
+        return list(self._modules)
+
+    def resolve(self, name):
+        """
+        Returns the function for the given name or None if no module contains it.
+
+        :param str name: The name of the function
+        :rtype: function
+        """
+        return self._functions.get(name)
+
+    def get_module(self, name):
+        """
+        Returns the module that contains the function for the given name or None.
+
+        :param str name: The name of the function
+        :rtype: module
+        """
+        return self._owners.get(name)
+
+    def get_shadowed(self):
+        """
+        Returns the functions that are never called because they are shadowed, as a list of tuples
+        (name, name of the module of the shadowed function, name of the module of the function that is called
+        instead). The module of internal functions is "<internal>".
+
+        :rtype: list
+        """
+        shadowed = [(name, _module_name(module), _module_name(by)) for name, module, by in self._shadowed]
+
+        for name, module in sorted(self._owners.items()):
+            if name in self._internal:
+                shadowed.append((name, _module_name(module), '<internal>'))
+
+        return shadowed
+
+
+def _module_name(module):
+    return getattr(module, '__name__', repr(module))
@@ -6,6 +6,7 @@
 #
 
 import logging
+import re
 
 from contemply.exceptions import *
 
@@ -13,6 +14,7 @@ from contemply.exceptions import *
 STRING, INTEGER, LIST, SYMBOL, EOF = 'STRING', 'INTEGER', 'LIST', 'SYMBOL', 'EOF',
 LPAR, RPAR, COMMA, LSQRBR, RSQRBR, ASSIGN, ASSIGN_PLUS, NEWLINE = 'LPAR', 'RPAR', 'COMMA', 'LSQRBR', 'RSQRBR', 'ASSIGN', 'ASSIGN_PLUS', 'NEWLINE'
 IF, ELSE, ENDIF, WHILE, ENDWHILE, FOR, IN, ENDFOR, ELSEIF, BREAK = 'IF', 'ELSE', 'ENDIF', 'WHILE', 'ENDWHILE', 'FOR', 'IN', 'ENDFOR', 'ELSEIF', 'BREAK'
+CACHE, ENDCACHE = 'CACHE', 'ENDCACHE'
 
 OPERATORS = COMP_EQ, COMP_LT, COMP_GT, COMP_LT_EQ, COMP_GT_EQ, COMP_NOT_EQ, ADD, SUB, DIV, MULT = 'COMP_EQ', 'COMP_LT', 'COMP_GT', 'COMP_LT_EQ', \
                                                                                                   'COMP_GT_EQ', 'COMP_NOT_EQ', 'ADD', 'SUB', 'DIV', 'MULT'
@@ -22,10 +24,12 @@ RESERVED = 'True', 'False', 'None', 'for', 'in', 'while', 'endwhile', 'endif', '
 
 
 class Token:
+    __slots__ = ('_type', '_val', '_span')
 
-    def __init__(self, ttype, val=None):
+    def __init__(self, ttype, val=None, span=None):
         self._type = ttype
         self._val = val
+        self._span = span
 
     def value(self):
         return self._val
@@ -33,6 +37,16 @@ class Token:
     def type(self):
         return self._type
 
+    def span(self):
+        """
+        Returns the start and end offset of the token inside the tokenized text.
+        Only tokenizers that track spans (e.g. RegexTokenizer) set this value.
+
+        :return: Tuple (start, end) or None
+        :rtype: tuple
+        """
+        return self._span
+
     def __str__(self):
         return 'Token: {0} ({1})'.format(self._type, self._val)
 
@@ -43,7 +57,7 @@ class Token:
 class Tokenizer:
     def __init__(self, ctx):
         self._pos = 0
-        self._line = 0
+        self._base = 0
         self._token = None
         self._ctx = ctx
         self._text = ''
@@ -63,13 +77,24 @@ class Tokenizer:
         return lst
 
     def update_position(self):
-        self._line = self._ctx.line()
-        self._text = self._ctx.text()  # [self._line]
+        self._text = self._ctx.text()
         self._pos = self._ctx.pos()
 
     def set_text(self, text):
         self._text = text
 
+    def load(self, text, offset=0):
+        """
+        Loads a new text (usually a single command line) and resets the position to its start.
+
+        :param str text: The text to tokenize
+        :param int offset: The position of the text inside the template, used to report positions
+        """
+        self._text = text
+        self._pos = 0
+        self._base = offset
+        self._ctx.set_pos(offset)
+
     def get_chr(self):
         try:
             return self._text[self._pos]
@@ -78,7 +103,7 @@ class Tokenizer:
 
     def _advance(self):
         self._pos += 1
-        self._ctx.set_pos(self._pos)
+        self._ctx.set_pos(self._base + self._pos)
 
     def lookahead(self, size=1):
         try:
@@ -90,15 +115,6 @@ class Tokenizer:
         while self.get_chr() is not None and self.get_chr().isspace() and self.get_chr() != '\n':
             self._advance()
 
-    def get_raw(self, end_delim='\n'):
-
-        raw = ''
-        while self.get_chr() is not None and self.get_chr() != end_delim:
-            raw += self.get_chr()
-            self._advance()
-
-        return raw
-
     def skip_until(self, delim='\n'):
         while self.get_chr() is not None and self.get_chr() not in delim:
             self._advance()
@@ -281,12 +297,9 @@ class Tokenizer:
                 token = Token(COMP_GT, '>')
                 advance = 2
 
-        elif self.get_chr() == '!':
-            if self.lookahead() == '=':
-                token = Token(COMP_NOT_EQ, '!=')
-                advance = 2
-            else:
-                advance = 1
+        elif self.get_chr() == '!' and self.lookahead() == '=':
+            token = Token(COMP_NOT_EQ, '!=')
+            advance = 2
 
         else:
             if peek:
@@ -333,3 +346,137 @@ class Tokenizer:
             self._advance()
 
         return Token(INTEGER, int(val))
+
+
+class RegexTokenizer(Tokenizer):
+    """
+    Tokenizer engine that matches a whole token at once using a single compiled alternation pattern
+    instead of walking the text character by character. It emits the same token types and values as
+    Tokenizer, but each token also carries its span inside the text.
+
+    Unlike Tokenizer, keywords only match as whole words (e.g. "format" is a SYMBOL, not FOR + "mat").
+    """
+
+    _WHITESPACE = re.compile(r'[^\S\n]+')
+
+    # Order matters: the first matching alternative wins.
+    _TOKEN_SPEC = (
+        (CMD_BLOCK, r'\#::'),
+        (CMD_LINE_START, r'\#:'),
+        (COMMENT, r'\#%'),
+        (NEWLINE, r'\n'),
+        (ENDIF, r'endif\b'),
+        (ENDWHILE, r'endwhile\b'),
+        (ENDFOR, r'endfor\b'),
+        (ELSEIF, r'elseif\b'),
+        (ELSE, r'else\b'),
+        (IF, r'if\b'),
+        (WHILE, r'while\b'),
+        (FOR, r'for\b'),
+        (IN, r'in\b'),
+        (BREAK, r'break\b'),
+        (SYMBOL, r'[^\W\d]\w*'),
+        (INTEGER, r'\d+'),
+        (STRING, r'"[^"\n]*"|\'[^\'\n]*\''),
+        ('UNTERMINATED_STRING', r'["\']'),
+        (LPAR, r'\('),
+        (RPAR, r'\)'),
+        (LSQRBR, r'\['),
+        (RSQRBR, r'\]'),
+        (COMMA, r','),
+        (ASSIGN_PLUS, r'\+='),
+        (ADD, r'\+|-(?!>)'),
+        (OUTPUT_LINE, r'->'),
+        (DIV, r'/'),
+        (MULT, r'\*'),
+        (COMP_EQ, r'=='),
+        (ASSIGN, r'='),
+        (COMP_LT_EQ, r'<='),
+        (FILE_BLOCK_END, r'<<'),
+        (COMP_LT, r'<'),
+        (COMP_GT_EQ, r'>='),
+        (FILE_BLOCK_START, r'>>'),
+        (COMP_GT, r'>'),
+        (COMP_NOT_EQ, r'!='),
+    )
+
+    _PATTERN = re.compile('|'.join('(?P<{0}>{1})'.format(name, regex) for name, regex in _TOKEN_SPEC))
+
+    # Token types whose value is the matched text itself
+    _VALUE_TOKENS = (LPAR, LSQRBR, RSQRBR, COMMA, ASSIGN_PLUS, ADD, OUTPUT_LINE, DIV, MULT, COMP_EQ, ASSIGN,
+                     COMP_LT_EQ, FILE_BLOCK_END, COMP_LT, COMP_GT_EQ, COMP_GT, COMP_NOT_EQ)
+
+    def skip_until(self, delim='\n'):
+        if len(delim) != 1:
+            return super().skip_until(delim)
+
+        end = self._text.find(delim, self._pos)
+        self._set_pos(len(self._text) if end == -1 else end)
+
+    def _set_pos(self, pos):
+        self._pos = pos
+        self._ctx.set_pos(self._base + pos)
+
+    def get_next_token(self, peek=False):
+        """
+        Retrieves the next token from the text stream. See Tokenizer.get_next_token for the peek semantics.
+
+        :param bool peek: If TRUE, the tokenizer will not advance.
+        :return: The next token
+        :rtype: Token
+        """
+        text = self._text
+        pos = self._pos
+
+        if not peek:
+            ws = self._WHITESPACE.match(text, pos)
+            if ws is not None:
+                pos = ws.end()
+
+        if pos >= len(text):
+            if pos != self._pos:
+                self._set_pos(pos)
+            return Token(EOF, span=(self._base + pos, self._base + pos))
+
+        match = self._PATTERN.match(text, pos)
+
+        if match is None:
+            if peek:
+                return Token(None)
+
+            self._set_pos(pos)
+            raise SyntaxError("Unrecognized token '{0}'".format(text[pos]), self._ctx)
+
+        ttype = match.lastgroup
+        end = match.end()
+
+        if ttype == 'UNTERMINATED_STRING':
+            if peek:
+                return Token(STRING)
+
+            self._set_pos(end)
+            raise SyntaxError('Unterminated string', self._ctx)
+
+        if ttype == SYMBOL:
+            val = match.group()
+        elif ttype == INTEGER:
+            val = int(match.group())
+        elif ttype == STRING:
+            val = text[pos + 1:end - 1]
+        elif ttype == RPAR:
+            val = ''
+        elif ttype in self._VALUE_TOKENS:
+            val = match.group()
+        else:
+            val = None
+
+        if not peek:
+            self._set_pos(end)
+
+        return Token(ttype, val, (self._base + pos, self._base + end))
+
+
+ENGINES = {
+    'classic': Tokenizer,
+    'regex': RegexTokenizer
+}
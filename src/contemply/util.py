@@ -5,6 +5,12 @@
 # For more information on licensing see LICENSE file
 #
 
+import functools
+
+# values that can be shared instead of being computed again
+IMMUTABLE_TYPES = (str, int, float, bool, type(None))
+
+
 def islistempty(listvar):
     """
     Checks wether a list has only empty values.
@@ -23,19 +29,89 @@ def islistempty(listvar):
 
     return has_empty
 
+_TYPE_MAP = {
+    'str': str,
+    'list': list,
+    'int': int,
+    'float': float,
+    'bool': bool
+}
+
+
 def _get_native_type(def_type):
-    type_map = {
-        'str': str,
-        'list': list,
-        'int': int,
-        'float': float,
-        'bool': bool
-    }
-
-    if not def_type in type_map:
+    if not def_type in _TYPE_MAP:
         raise Exception('Could not map type definition "{}"'.format(def_type))
 
-    return type_map[def_type]
+    return _TYPE_MAP[def_type]
+
+
+class Signature:
+    """
+    A function definition in the format of check_function_args, parsed once into the number of required
+    arguments and the allowed types of every argument.
+    """
+
+    __slots__ = ('name', 'required', 'types', 'labels', 'returns')
+
+    def __init__(self, definition, returns=None):
+        """
+        :param list definition: The definition, starting with the function name
+        :param str returns: The type of the return value, if it is always the same
+        :raises: Exception
+        """
+        self.name = definition[0] + '()'
+        self.required = 0
+        types = []
+        labels = []
+
+        for def_type in definition[1:]:
+            if def_type.startswith('*'):
+                def_type = def_type[1:]
+            elif self.required < len(types):
+                raise Exception('After an optional argument only further optional arguments are allowed.')
+            else:
+                self.required += 1
+
+            labels.append(def_type)
+            types.append(frozenset(_get_native_type(item) for item in def_type.replace(' ', '').split(',')))
+
+        self.types = tuple(types)
+        self.labels = tuple(labels)
+        self.returns = _get_native_type(returns) if returns is not None else None
+
+    def check(self, args):
+        """
+        Raises an exception if the arguments don't match the definition.
+
+        :param list args:
+        :raises: Exception
+        """
+        if len(args) < self.required:
+            raise Exception('{} expects at least {} arguments.'.format(self.name, self.required))
+
+        if len(args) > len(self.types):
+            raise Exception('{} accepts a maximum of {} arguments'.format(self.name, len(self.types)))
+
+        for n, arg in enumerate(args):
+            if type(arg) not in self.types[n]:
+                raise Exception('{} expected {} as argument number {}'.format(self.name, self.labels[n], n))
+
+
+@functools.lru_cache(maxsize=256)
+def _parse_signature(definition):
+    return Signature(definition)
+
+
+def get_signature(definition):
+    """
+    Returns the parsed Signature for a function definition. Signatures are parsed once and shared by all
+    calls with the same definition.
+
+    :param list definition: The definition, starting with the function name
+    :rtype: Signature
+    :raises: Exception
+    """
+    return _parse_signature(tuple(definition))
 
 
 def check_function_args(definition, args):
@@ -53,37 +129,79 @@ def check_function_args(definition, args):
     :param list args:
     :raises: Exception
     """
+    get_signature(definition).check(args)
 
-    func_name = definition[0] + '()'
-    definition = definition[1:]
-    min_args_needed = 0
-    optional_arg_encountered = False
 
-    for arg in definition:
-        if arg.startswith('*'):
-            optional_arg_encountered = True
-        else:
-            if optional_arg_encountered:
-                raise Exception('After an optional argument only further optional arguments are allowed.')
+def signature(*definition, returns=None):
+    """
+    Decorator for template functions that checks the arguments of every call. Functions in contemply.functions
+    and in extension modules use it instead of calling check_function_args themselves, so the definition is
+    parsed only once. The decorated function keeps the (args, ctx) convention.
+
+    Format:
 
-            min_args_needed += 1
+        @signature('str', '*str', returns='str')
 
-    if len(args) < min_args_needed:
-        raise Exception('{} expects at least {} arguments.'.format(func_name, min_args_needed))
+    The Signature and the function without the check are kept as the attributes "signature" and "unchecked" of
+    the decorated function, so calls that are known to be correct before the template runs can skip the check.
 
-    if len(args) > len(definition):
-        raise Exception('{} accepts a maximum of {} arguments'.format(func_name, len(definition)))
+    :param str definition: The argument types, like in check_function_args without the function name
+    :param str returns: The type of the return value, if it is always the same
+    :return: The decorator
+    :rtype: function
+    """
+
+    def decorate(func):
+        parsed = Signature([func.__name__] + list(definition), returns)
+
+        @functools.wraps(func)
+        def checked(args, ctx):
+            parsed.check(args)
+            return func(args, ctx)
 
-    for n, def_type in enumerate(definition):
-        optional = def_type.startswith('*')
-        if optional:
-            def_type = def_type[1:]
+        checked.signature = parsed
+        checked.unchecked = func
+        return checked
 
-            if n > len(args) - 1:
-                # optional argument not found in argument list
-                continue
+    return decorate
 
-        def_type_list = [_get_native_type(item) for item in def_type.replace(' ', '').split(',')]
 
-        if type(args[n]) not in def_type_list:
-            raise Exception('{} expected {} as argument number {}'.format(func_name, def_type, n))
+def pure(func=None, cacheable=True):
+    """
+    Decorator for template functions whose result only depends on their arguments and that have no side effects.
+    Pure functions do not get a template context when they are evaluated before the template runs.
+
+    Format:
+
+        @pure
+        @pure(cacheable=False)
+
+    The interpreter keeps the results of cacheable functions, so they run once per distinct argument list. Cheap
+    functions should not be cacheable, looking up the result costs more than calling them.
+
+    :param function func: The function
+    :param bool cacheable: Whether the results should be cached
+    :return: The decorated function or the decorator
+    :rtype: function
+    """
+
+    def decorate(func):
+        func.pure = True
+        func.cacheable = cacheable
+        return func
+
+    return decorate(func) if func is not None else decorate
+
+
+def interactive(func):
+    """
+    Decorator for template functions that ask the user for a value. When lazy prompts are enabled (see
+    TemplateParser.set_lazy), assignments of their results are computed when the variable is used for the first time,
+    so questions whose answers are not used are never asked.
+
+    :param function func: The function
+    :return: The function
+    :rtype: function
+    """
+    func.interactive = True
+    return func
@@ -5,11 +5,40 @@
 # For more information on licensing see LICENSE file
 #
 
+from contemply.ast import AST
 from contemply.frontend import TemplateParser
 import pytest
 
+def pytest_addoption(parser):
+    parser.addoption('--backend', default='interpreter', choices=('interpreter', 'compiler'),
+                     help='Backend used to run templates')
+
+
+@pytest.fixture(autouse=True)
+def template_backend(request, monkeypatch):
+    monkeypatch.setattr(TemplateParser, 'DEFAULT_BACKEND', request.config.getoption('backend'))
+
+
 @pytest.fixture()
 def parser_inst():
     parser = TemplateParser()
     parser.set_output_mode(TemplateParser.OUTPUTMODE_CONSOLE)
-    return parser
\ No newline at end of file
+    return parser
+
+
+def dump_ast(node):
+    """
+    Converts an AST into nested tuples, so two trees can be compared.
+    """
+    if isinstance(node, list):
+        return [dump_ast(n) for n in node]
+    elif not isinstance(node, AST):
+        return node
+
+    fields = [s for cls in type(node).__mro__ for s in getattr(cls, '__slots__', ())]
+    return (type(node).__name__,) + tuple(dump_ast(getattr(node, f)) for f in fields)
+
+
+@pytest.fixture()
+def ast_dump():
+    return dump_ast
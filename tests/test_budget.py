@@ -0,0 +1,161 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import pytest
+
+from contemply.budget import Budget
+from contemply.exceptions import ParserError
+from contemply.frontend import TemplateParser
+
+COUNTED = '\n'.join([
+    '#: items = ["a", "b", "c"]',
+    '#: i = 0',
+    '#: while i < 2',
+    '#: i = i + 1',
+    '#: for item in items',
+    '$item $i',
+    '#: endfor',
+    '#: endwhile',
+    'static',
+    'lines',
+])
+
+
+def test_usage(parser_inst):
+    result = parser_inst.parse(COUNTED)
+    usage = parser_inst.get_usage()
+
+    # 4 statements in the main block (the static lines are merged), 2 in every iteration of the while loop and 1
+    # in every iteration of the for loop
+    assert usage['steps'] == 4 + 2 * 2 + 6
+    assert usage['targets'] == 0
+    assert usage['output'] == {'__default__': sum(len(line) + 1 for line in result['__default__'])}
+    assert usage['time'] >= 0
+
+
+def test_backends_count_the_same_steps():
+    steps = []
+
+    for backend in ('interpreter', 'compiler'):
+        parser = TemplateParser()
+        parser.set_output_mode(TemplateParser.OUTPUTMODE_CONSOLE)
+        parser.set_backend(backend)
+        parser.set_budget(Budget(max_steps=14))
+        parser.parse(COUNTED)
+        steps.append(parser.get_usage()['steps'])
+
+        parser.set_budget(Budget(max_steps=13))
+        with pytest.raises(ParserError, match='Maximum number of steps of 13 reached'):
+            parser.parse(COUNTED)
+
+    assert steps == [14, 14]
+
+
+def test_loop_runs(parser_inst):
+    parser_inst.set_budget(Budget(max_loop_runs=2))
+
+    with pytest.raises(ParserError, match='Maximum loop iterations of 2 reached'):
+        parser_inst.parse('#: items = ["a", "b", "c"]\n#: for item in items\n#: endfor')
+
+    parser_inst.set_budget(Budget(max_while_runs=None))
+    parser_inst.parse('#: i = 0\n#: while i < 20000\n#: i = i + 1\n#: endwhile')
+    assert parser_inst.get_template_context().get('i') == 20000
+
+    # the limit for all loops also limits while loops
+    parser_inst.set_budget(Budget(max_loop_runs=5))
+    with pytest.raises(ParserError, match='Maximum loop iterations of 5 reached'):
+        parser_inst.parse('#: while True\n#: endwhile')
+
+
+def test_for_loops_are_not_limited_by_default():
+    # only while loops are limited by default, a for loop ends with its list
+    for backend in ('interpreter', 'compiler'):
+        parser = TemplateParser()
+        parser.set_output_mode(TemplateParser.OUTPUTMODE_CONSOLE)
+        parser.set_backend(backend)
+        parser.get_template_context().set('items', list(range(0, 10001)))
+        parser.parse('#: count = 0\n#: for item in items\n#: count = count + 1\n#: endfor')
+
+        assert parser.get_template_context().get('count') == 10001
+
+        with pytest.raises(ParserError, match='Maximum loop iterations of 10000 reached'):
+            parser.parse('#: while True\n#: endwhile')
+
+
+def test_growing_list(parser_inst):
+    parser_inst.set_budget(Budget(max_loop_runs=10000))
+
+    with pytest.raises(ParserError, match='Maximum loop iterations of 10000 reached'):
+        parser_inst.parse('#: items = [1]\n#: for item in items\n#: items += item\n#: endfor')
+
+
+def test_time(parser_inst):
+    parser_inst.set_budget(Budget(max_time=0.05, max_while_runs=None))
+
+    with pytest.raises(ParserError, match='Maximum run time of 0.05 seconds reached'):
+        parser_inst.parse('#: while True\n#: endwhile')
+
+
+def test_output(parser_inst):
+    text = '\n'.join([
+        '#: names = ["a", "b"]',
+        '#: for name in names',
+        '1234567 $name',
+        '#: endfor',
+        '#: >> "first.txt"',
+        '123456789',
+        '#: <<',
+    ])
+
+    # every target is counted on its own
+    parser_inst.set_budget(Budget(max_output=20))
+    parser_inst.parse(text)
+    assert parser_inst.get_usage()['output'] == {'__default__': 20, 'first.txt': 10}
+
+    parser_inst.set_budget(Budget(max_output=19))
+    with pytest.raises(ParserError, match='Maximum output size of 19 characters reached for __default__'):
+        parser_inst.parse(text)
+
+    # static lines are merged, the merged lines are counted as well
+    with pytest.raises(ParserError, match='Maximum output size of 19 characters reached'):
+        parser_inst.parse('\n'.join(['static line'] * 2))
+
+
+def test_targets(parser_inst):
+    text = '\n'.join([
+        'default',
+        '#: names = ["a", "b"]',
+        '#: for name in names',
+        '#: >> "$name.txt"',
+        '$name',
+        '#: <<',
+        '#: >> "other.txt"',
+        '$name',
+        '#: <<',
+        '#: endfor',
+    ])
+
+    # the variables of file names are replaced when the file block starts
+    parser_inst.set_budget(Budget(max_targets=3))
+    parser_inst.parse(text)
+    assert parser_inst.get_usage()['targets'] == 3
+
+    parser_inst.set_budget(Budget(max_targets=2))
+    with pytest.raises(ParserError, match='Maximum number of output files of 2 reached with b.txt'):
+        parser_inst.parse(text)
+
+
+def test_value_size(parser_inst):
+    parser_inst.set_budget(Budget(max_value_size=100))
+
+    with pytest.raises(ParserError, match='Maximum value size of 100 reached for variable text'):
+        parser_inst.parse('#: text = "ab"\n#: while True\n#: text = text + text\n#: endwhile')
+
+    with pytest.raises(ParserError, match='Maximum value size of 100 reached for variable items'):
+        parser_inst.parse('#: items = []\n#: while True\n#: items += 1\n#: endwhile')
+
+    parser_inst.parse('#: number = 1000000 * 1000000')
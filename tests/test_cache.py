@@ -0,0 +1,111 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import os
+import pytest
+
+import contemply
+from contemply.cache import CompileCache
+from contemply.interpreter import Interpreter
+from contemply.parser import Parser
+from contemply.ast import Template
+
+TEXT = '\n'.join([
+    '#: items = ["a", "b"]',
+    '#: for item in items',
+    'Item $item',
+    '#: endfor',
+])
+
+
+def test_memory_lru():
+    cache = CompileCache(max_entries=2)
+    trees = [Template() for i in range(0, 3)]
+
+    for i, tree in enumerate(trees):
+        cache.put(str(i), tree)
+
+    assert cache.get('0') is None
+    assert cache.get('1') is trees[1]
+    assert cache.get('2') is trees[2]
+    assert cache.hits == 2
+    assert cache.misses == 1
+
+
+def test_key_changes_with_version_and_options(monkeypatch):
+    cache = CompileCache()
+    key = cache.make_key(TEXT, ('classic',))
+
+    assert key == cache.make_key(TEXT, ('classic',))
+    assert key != cache.make_key(TEXT, ('regex',))
+    assert key != cache.make_key(TEXT + '\n', ('classic',))
+
+    monkeypatch.setattr(contemply, '__version__', '99.0.0')
+    assert key != cache.make_key(TEXT, ('classic',))
+
+
+def test_parse_uses_cache(parser_inst, monkeypatch):
+    parser_inst.set_compile_cache(CompileCache())
+    expected = parser_inst.parse(TEXT)
+
+    def fail(*args):
+        raise AssertionError('template should not be parsed again')
+
+    monkeypatch.setattr(Parser, 'parse', fail)
+    assert parser_inst.parse(TEXT) == expected
+
+
+def test_disk_cache_shared_between_instances(parser_inst, tmpdir, monkeypatch):
+    directory = os.path.join(str(tmpdir), 'cache')
+
+    parser_inst.set_compile_cache(CompileCache(directory=directory))
+    expected = parser_inst.parse(TEXT)
+    assert len([f for f in os.listdir(directory) if f.endswith('.ast')]) == 1
+
+    def fail(*args):
+        raise AssertionError('template should not be parsed again')
+
+    monkeypatch.setattr(Parser, 'parse', fail)
+
+    cache = CompileCache(directory=directory)
+    parser_inst.set_compile_cache(cache)
+    assert parser_inst.parse(TEXT) == expected
+    assert cache.disk_hits == 1
+
+
+def test_disk_cache_discards_broken_entries(tmpdir):
+    directory = str(tmpdir)
+    cache = CompileCache(directory=directory)
+    key = cache.make_key(TEXT)
+
+    with open(os.path.join(directory, key + '.ast'), 'wb') as f:
+        f.write(b'not a pickle')
+
+    assert cache.get(key) is None
+    assert not os.path.exists(os.path.join(directory, key + '.ast'))
+
+
+def test_disk_cache_prunes_old_entries(tmpdir):
+    cache = CompileCache(directory=str(tmpdir), max_disk_entries=2)
+
+    for i in range(0, 4):
+        cache.put('key{0}'.format(i), Template())
+
+    assert len([f for f in os.listdir(str(tmpdir)) if f.endswith('.ast')]) == 2
+
+
+def test_streaming_uses_cache(parser_inst, tmpdir, monkeypatch):
+    testfile = os.path.join(str(tmpdir), 'demo.pytpl')
+    with open(testfile, 'w') as f:
+        f.write(TEXT)
+
+    parser_inst.set_streaming(True)
+    parser_inst.set_compile_cache(CompileCache())
+    expected = parser_inst.parse_file(testfile)[Interpreter.DEFAULT_TARGET]
+
+    monkeypatch.setattr(Parser, 'parse', lambda *args: pytest.fail('template should not be parsed again'))
+    assert parser_inst.parse_file(testfile)[Interpreter.DEFAULT_TARGET] == expected == ['Item a', 'Item b']
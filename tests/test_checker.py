@@ -0,0 +1,114 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import os
+import pytest
+
+from contemply.checker import find_templates, check_file, check_files
+from contemply.exceptions import ParserError
+from contemply.parser import TemplateContext, Parser
+from contemply.tokenizer import ENGINES
+
+BROKEN = '\n'.join([
+    '#: name = "unterminated',
+    'Content',
+    '#: if name ==',
+    '#: value = )',
+    '#: endif',
+    '#: for item in items',
+    '$item',
+    '#: endfor extra',
+    '#: if name',
+])
+
+
+def parse(text, recover, engine='classic'):
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    parser = Parser(ENGINES[engine](ctx), ctx, recover=recover)
+    return parser.parse(), parser.errors
+
+
+@pytest.mark.parametrize('engine', list(ENGINES.keys()))
+def test_recovering_parser_reports_all_errors(engine):
+    tree, errors = parse(BROKEN, True, engine)
+
+    assert [(e.kind, e.line) for e in errors] == [
+        ('SyntaxError', 0),
+        ('ParserError', 3),
+        ('ParserError', 3),
+        ('InternalError', 7),
+        ('ParserError', 8),
+    ]
+    assert errors[-1].message == 'Unexpected end of file, expected ELSE, ENDIF, ELSEIF'
+
+
+def test_recovering_parser_keeps_valid_statements(ast_dump):
+    text = '#: a = "x"\n#: b = )\n#: c = "y"\nContent'
+    tree, errors = parse(text, True)
+
+    assert len(errors) == 1
+    assert ast_dump(tree) == ast_dump(parse('#: a = "x"\n#: c = "y"\nContent', False)[0])
+
+
+def test_default_parser_stops_at_first_error():
+    with pytest.raises(Exception):
+        parse(BROKEN, False)
+
+    with pytest.raises(ParserError):
+        parse('#: if True\nContent', False)
+
+
+def test_check_files(tmpdir):
+    tmpdir = str(tmpdir)
+    os.mkdir(os.path.join(tmpdir, 'sub'))
+
+    paths = []
+    for i in range(0, 6):
+        path = os.path.join(tmpdir, 'sub' if i % 2 else '', 'template_{0}.pytpl'.format(i))
+        with open(path, 'w') as f:
+            f.write(BROKEN if i == 3 else '#: name = ask("Name?")\nHello $name')
+        paths.append(path)
+
+    files = find_templates([tmpdir])
+    assert sorted(files) == sorted(paths)
+
+    results = list(check_files(paths, max_workers=2))
+
+    assert [r['file'] for r in results] == paths
+    assert [r['ok'] for r in results] == [i != 3 for i in range(0, 6)]
+    assert results[3]['errors'][0] == {'line': 1, 'col': 24, 'type': 'SyntaxError', 'message': 'Unterminated string'}
+    assert len(results[3]['errors']) == 5
+
+
+def test_check_missing_file(tmpdir):
+    result = check_file(os.path.join(str(tmpdir), 'missing.pytpl'))
+
+    assert not result['ok']
+    assert result['errors'][0]['type'] == 'FileNotFoundError'
+
+
+def test_check_unexpected_errors(tmpdir, monkeypatch):
+    path = os.path.join(str(tmpdir), 'template.pytpl')
+    with open(path, 'w') as f:
+        f.write('#: a = !x')
+
+    result = check_file(path)
+
+    assert not result['ok']
+    assert result['errors'] == [{'line': 1, 'col': 8, 'type': 'SyntaxError', 'message': "Unrecognized token '!'"}]
+
+    def fail(self):
+        raise AttributeError("'NoneType' object has no attribute 'type'")
+
+    # errors of the parser itself are reported for the file and the other files are still checked
+    monkeypatch.setattr(Parser, 'parse', fail)
+    results = list(check_files([path, path], max_workers=1))
+
+    assert [r['ok'] for r in results] == [False, False]
+    assert results[0]['errors'] == [{'line': 1, 'col': 1, 'type': 'AttributeError',
+                                     'message': "Internal error: 'NoneType' object has no attribute 'type'"}]
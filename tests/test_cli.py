@@ -5,6 +5,7 @@
 # For more information on licensing see LICENSE file
 #
 
+import json
 import os
 import pytest
 
@@ -146,3 +147,72 @@ def test_run_command(tmpdir):
     assert 'Hello World!' in result.output
     assert 'Contentline' in result.output
     assert not header(True) in result.output
+
+
+def test_check_command(pref_instance, tmpdir):
+    tmpdir = str(tmpdir)
+    os.mkdir(os.path.join(tmpdir, 'templates'))
+
+    with open(os.path.join(tmpdir, 'templates', 'good.pytpl'), 'w') as f:
+        f.write('#: name = ask("Name?")\nHello $name')
+
+    with open(os.path.join(tmpdir, 'templates', 'bad.pytpl'), 'w') as f:
+        f.write('#: name = "unterminated\nHello\n#: if name ==\n#: endif')
+
+    runner = CliRunner()
+    runner.invoke(cli, ['storage:add', 'mystorage', os.path.join(tmpdir, 'templates')])
+
+    # text output, every error is reported
+    result = runner.invoke(cli, ['check', '-j', '1', os.path.join(tmpdir, 'templates')])
+
+    assert result.exit_code == 1
+    assert 'bad.pytpl:1:' in result.output
+    assert 'bad.pytpl:4:' in result.output
+    assert 'Checked 2 templates, 1 with errors.' in result.output
+
+    # json output for a storage location
+    result = runner.invoke(cli, ['check', '-j', '1', '--format', 'json', '--storage', 'mystorage'])
+
+    assert result.exit_code == 1
+    data = json.loads(result.output)
+    assert data['checked'] == 2
+    assert data['failed'] == 1
+    assert [len(r['errors']) for r in data['results']] == [2, 0]
+
+    result = runner.invoke(cli, ['check', os.path.join(tmpdir, 'templates', 'good.pytpl')])
+    assert result.exit_code == 0
+
+
+def test_check_command_invalid_token(pref_instance, tmpdir):
+    path = os.path.join(str(tmpdir), 'bang.pytpl')
+    with open(path, 'w') as f:
+        f.write('#: a = !x')
+
+    runner = CliRunner()
+    result = runner.invoke(cli, ['check', path])
+
+    assert result.exit_code == 1
+    assert "bang.pytpl:1:8: SyntaxError: Unrecognized token '!'" in result.output
+    assert 'Checked 1 template, 1 with errors.' in result.output
+
+
+def test_run_fragment_cache(pref_instance, tmpdir):
+    testfile = os.path.join(str(tmpdir), 'cached.pytpl')
+    fragments = os.path.join(pref_instance.get_cache_dir(), 'fragments')
+
+    with open(testfile, 'w') as f:
+        f.write('#: cache "block"\nCached line\n#: endcache')
+
+    # the output of cache blocks is only kept in memory by default
+    runner = CliRunner()
+    result = runner.invoke(cli, ['run', '-p', '--no-header', testfile])
+
+    assert result.exit_code == 0
+    assert 'Cached line' in result.output
+    assert not os.path.exists(fragments)
+
+    result = runner.invoke(cli, ['run', '-p', '--no-header', '--fragment-cache', testfile])
+
+    assert result.exit_code == 0
+    assert 'Cached line' in result.output
+    assert os.listdir(fragments)
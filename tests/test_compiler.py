@@ -0,0 +1,349 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Differential tests: every template is run by the Interpreter and by the compiler backend, both have to produce
+the same output, the same variables and the same errors.
+"""
+
+import collections
+import glob
+import os
+import random
+import pytest
+
+import contemply.cli as cli
+from contemply.compiler import Compiler, CompilingInterpreter
+from contemply.frames import resolve_slots
+from contemply.interpreter import Interpreter
+from contemply.parser import TemplateContext, Parser
+from contemply.tokenizer import ENGINES
+
+SAMPLES = sorted(glob.glob(os.path.join(os.path.dirname(__file__), '..', 'src', 'contemply', 'samples', '*.pytpl')))
+
+TEMPLATES = {
+    'content': [
+        '#: name = "World"',
+        'Hello $name!',
+        '#: items = ["a", "b"]',
+        'First: $items[0]',
+    ],
+    'operators': [
+        '#: a = 7',
+        '#: b = a * 3',
+        '#: c = a / 2',
+        '#: d = a - 10',
+        '#: s = "x" + "y"',
+        '#: if a >= 7',
+        'ge $b $c $d $s',
+        '#: endif',
+        '#: if a <= 6',
+        'never',
+        '#: endif',
+    ],
+    'elseif_all_conditions_run': [
+        '#: x = 5',
+        '#: if x > 1',
+        'first',
+        '#: elseif x > 2',
+        'second',
+        '#: elseif x > 10',
+        'third',
+        '#: else',
+        'else',
+        '#: endif',
+        '#: if x > 10',
+        'a',
+        '#: elseif x > 20',
+        'b',
+        '#: else',
+        'c',
+        '#: endif',
+    ],
+    'while_break': [
+        '#: i = 0',
+        '#: while i < 10',
+        '#: i = i + 1',
+        '#: if i == 4',
+        '#: break',
+        '#: endif',
+        'line $i',
+        '#: endwhile',
+        'after $i',
+    ],
+    'for_break_in_last_iteration': [
+        '#: items = ["a", "b"]',
+        '#: for item in items',
+        '#: if item == "b"',
+        '#: break',
+        '#: endif',
+        'item $item',
+        '#: endfor',
+        'not reached, the flag is still set',
+    ],
+    'for_break_in_while': [
+        '#: n = 0',
+        '#: while n < 3',
+        '#: n = n + 1',
+        '#: items = ["a"]',
+        '#: for item in items',
+        '#: break',
+        '#: endfor',
+        'skipped $n',
+        '#: endwhile',
+        'done $n',
+    ],
+    'break_flag_in_elseif': [
+        '#: items = ["a", "b", "c"]',
+        '#: for item in items',
+        '#: if item != ""',
+        '#: break',
+        '#: elseif item != "x"',
+        'first statement runs $item',
+        'second statement does not',
+        '#: endif',
+        '#: endfor',
+    ],
+    'append': [
+        '#: items = []',
+        '#: items += "a"',
+        '#: items += "b"',
+        '#: for item in items',
+        '$item',
+        '#: endfor',
+    ],
+    'append_to_non_list': [
+        '#: value = "a"',
+        '#: value += "b"',
+    ],
+    'unknown_variable': [
+        'Start',
+        '#: x = missing',
+    ],
+    'unknown_function': [
+        '#: x = nothing("a")',
+    ],
+    'break_outside_loop': [
+        'Start',
+        '#: break',
+    ],
+    'iterate_non_list': [
+        '#: value = "abc"',
+        '#: for c in value',
+        '#: endfor',
+    ],
+    'index_non_list': [
+        '#: value = "abc"',
+        '#: x = value[1]',
+    ],
+    'max_loop_runs': [
+        '#: while True',
+        '#: endwhile',
+    ],
+    'builtins_and_functions': [
+        '#: flag = True',
+        '#: if flag == True',
+        '#: name = uppercase("abc")',
+        '#: n = size([1, 2, 3])',
+        '$name $n',
+        '#: endif',
+        '#: output("out $name")',
+        '#: echo("echo $name")',
+    ],
+    'file_blocks': [
+        'default',
+        '#: >> "first.txt"',
+        'first',
+        '#: <<',
+        '#::',
+        '>> "second.txt"',
+        'x = "y"',
+        '<<',
+        '#::',
+        'default again',
+    ],
+    'stray_endif': [
+        'before',
+        '#: endif',
+        'after',
+    ],
+    'loop_scope': [
+        '#: item = "outer"',
+        '#: outer = ["a", "b"]',
+        '#: inner = [1]',
+        '#: for item in outer',
+        '#: for item in inner',
+        'inner $item',
+        '#: endfor',
+        'loop $item',
+        '#: last = item',
+        '#: endfor',
+        '#: for other in inner',
+        '#: endfor',
+        'after $item $last',
+    ],
+}
+
+
+def parse(text):
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    tree = Parser(ENGINES['classic'](ctx), ctx).parse()
+    return ctx, tree
+
+
+def run(interpreter_class, text):
+    ctx, tree = parse(text)
+    interpreter = interpreter_class(ctx)
+
+    try:
+        interpreter.interpret(tree)
+        error = None
+    except Exception as e:
+        error = '{0}: {1}'.format(type(e).__name__, e)
+
+    return interpreter.get_parsed_template(), dict(ctx.get_all()), error
+
+
+def assert_same(text):
+    expected = run(Interpreter, text)
+    assert run(CompilingInterpreter, text) == expected
+
+    # make sure the template was not interpreted
+    ctx, tree = parse(text)
+    assert CompilingInterpreter(ctx).compile(tree) is not None
+
+    return expected
+
+
+@pytest.mark.parametrize('name', sorted(TEMPLATES.keys()))
+def test_templates(name):
+    assert_same('\n'.join(TEMPLATES[name]))
+
+
+def test_errors_are_reported():
+    assert run(CompilingInterpreter, '\n'.join(TEMPLATES['unknown_variable']))[2] is not None
+    assert 'Maximum loop iterations' in run(CompilingInterpreter, '\n'.join(TEMPLATES['max_loop_runs']))[2]
+
+
+@pytest.fixture()
+def scripted_answers(monkeypatch):
+    asked = collections.Counter()
+
+    def user_input(prompt):
+        asked[prompt] += 1
+
+        if 'Your choice' in prompt:
+            return str(asked[prompt] % 3 + 1)
+
+        # loops asking for more values stop at the first empty answer
+        return 'answer{0}'.format(asked[prompt]) if asked[prompt] < 3 else ''
+
+    monkeypatch.setattr(cli, 'user_input', user_input)
+    monkeypatch.setattr(cli, 'prompt', lambda question, default='Yes': len(question) % 2 == 0)
+
+    return asked
+
+
+@pytest.mark.parametrize('path', SAMPLES, ids=os.path.basename)
+def test_samples(path, scripted_answers, tmpdir, monkeypatch):
+    with open(path, 'r') as f:
+        text = f.read()
+
+    results = []
+    for interpreter_class in (Interpreter, CompilingInterpreter):
+        scripted_answers.clear()
+        cwd = os.path.join(str(tmpdir), interpreter_class.__name__)
+        os.mkdir(cwd)
+        monkeypatch.setattr(os, 'getcwd', lambda: cwd)
+
+        results.append(run(interpreter_class, text))
+
+    assert results[0][2] is None
+    assert results[0] == results[1]
+
+
+def random_template(rnd, depth=0):
+    lines = []
+
+    for i in range(0, rnd.randint(1, 5)):
+        choice = rnd.randint(0, 9 if depth < 3 else 3)
+
+        if choice == 0:
+            lines.append('line $v{0} $items[0]'.format(rnd.randint(0, 2)))
+        elif choice == 1:
+            lines.append('#: v{0} = v{1} + {2}'.format(rnd.randint(0, 2), rnd.randint(0, 2), rnd.randint(0, 3)))
+        elif choice == 2:
+            lines.append('#: items += v{0}'.format(rnd.randint(0, 2)))
+        elif choice == 3:
+            lines.append('#: break')
+        elif choice in (4, 5):
+            lines.append('#: if v{0} {1} {2}'.format(rnd.randint(0, 2), rnd.choice(['<', '>', '==', '!=']),
+                                                      rnd.randint(0, 6)))
+            lines += random_template(rnd, depth + 1)
+
+            for j in range(0, rnd.randint(0, 2)):
+                lines.append('#: elseif v{0} > {1}'.format(rnd.randint(0, 2), rnd.randint(0, 6)))
+                lines += random_template(rnd, depth + 1)
+
+            if rnd.randint(0, 1):
+                lines.append('#: else')
+                lines += random_template(rnd, depth + 1)
+
+            lines.append('#: endif')
+        elif choice in (6, 7):
+            # loops never iterate items, it grows while the template runs
+            lines.append('#: for item in {0}'.format(rnd.choice(['small', 'pair'])))
+            lines.append('item $item')
+            lines += random_template(rnd, depth + 1)
+            lines.append('#: endfor')
+        else:
+            # every nesting level has its own counter, so inner loops do not reset outer ones
+            lines.append('#: guard{0} = 0'.format(depth))
+            lines.append('#: while guard{0} < {1}'.format(depth, rnd.randint(0, 4)))
+            lines.append('#: guard{0} = guard{0} + 1'.format(depth))
+            lines += random_template(rnd, depth + 1)
+            lines.append('#: endwhile')
+
+    return lines
+
+
+@pytest.mark.parametrize('seed', range(0, 200))
+def test_random_templates(seed):
+    rnd = random.Random(seed)
+    lines = ['#: v0 = 0', '#: v1 = 1', '#: v2 = 2', '#: items = [1, 2]', '#: small = [5]', '#: pair = [3, 4]'] + random_template(rnd)
+
+    assert_same('\n'.join(lines))
+
+
+def test_deeply_nested_templates_are_interpreted():
+    text = '\n'.join(['#: if True'] * 200 + ['deep'] + ['#: endif'] * 200)
+    ctx, tree = parse(text)
+
+    assert CompilingInterpreter(ctx).compile(tree) is None
+    assert run(CompilingInterpreter, text) == run(Interpreter, text)
+
+
+def test_generated_source():
+    ctx, tree = parse('\n'.join(TEMPLATES['while_break']))
+    resolve_slots(tree, ['True', 'False', 'None'])
+    source = Compiler(['True', 'False', 'None']).generate(tree)
+
+    assert source.startswith('def template(')
+    assert 'visit(' not in source
+    assert "values[{0}] = ".format(tree.scope.globals['i']) in source
+
+
+def test_frontend_backend(parser_inst):
+    text = '\n'.join(TEMPLATES['for_break_in_while'])
+
+    expected = parser_inst.parse(text)
+    parser_inst.set_backend('compiler')
+    assert parser_inst.parse(text) == expected
+
+    with pytest.raises(ValueError):
+        parser_inst.set_backend('unknown')
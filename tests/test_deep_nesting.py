@@ -0,0 +1,54 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import sys
+import pytest
+from contemply.exceptions import *
+from contemply.interpreter import Interpreter
+
+DEPTH = 3000
+
+
+def nested_template(depth):
+    text = ['#: items = ["x"]']
+
+    for i in range(0, depth):
+        text += ['#: if True', '#: for item in items']
+
+    text.append('deep $item')
+
+    for i in range(0, depth):
+        text += ['#: endfor', '#: endif']
+
+    return text
+
+
+def test_deep_nesting(parser_inst):
+    assert DEPTH * 4 > sys.getrecursionlimit()
+
+    result = parser_inst.parse('\n'.join(nested_template(DEPTH)))[Interpreter.DEFAULT_TARGET]
+    assert result == ['deep x']
+
+
+def test_deep_nesting_while_break(parser_inst):
+    text = ['#: num = 0']
+    text += ['#: while True'] * DEPTH
+    text += ['Run $num', '#: num = num + 1']
+    text += ['#: break', '#: endwhile'] * DEPTH
+
+    result = parser_inst.parse('\n'.join(text))[Interpreter.DEFAULT_TARGET]
+    assert result == ['Run 0']
+    assert parser_inst.get_template_context().get('num') == 1
+
+
+def test_deep_nesting_unclosed(parser_inst):
+    text = nested_template(DEPTH)[:-1]
+
+    with pytest.raises(ParserError) as e:
+        parser_inst.parse('\n'.join(text))
+
+    assert 'Unexpected end of file, expected ELSE, ENDIF, ELSEIF' in str(e.value)
@@ -51,4 +51,27 @@ def test_make_folders_chmod(tmpdir, monkeypatch, parser_inst):
     if platform.system() != 'Windows':
         st = os.stat(checkpath)
         perm = oct(st.st_mode  & 0o777)
-        assert perm == '0o644'
\ No newline at end of file
+        assert perm == '0o644'
+
+def test_loop_variable_in_file_block(tmpdir, monkeypatch):
+    from contemply.frontend import TemplateParser
+
+    tmpdir = str(tmpdir)
+    monkeypatch.setattr(os, 'getcwd', lambda: tmpdir)
+
+    text = [
+        '#: names = ["a", "b"]',
+        '#: for name in names',
+        '#: >> "$name.txt"',
+        'hello $name',
+        '#: <<',
+        '#: endfor',
+    ]
+
+    # the item variable only exists inside the loop, the file name is created while it runs
+    parser = TemplateParser()
+    parser.parse('\n'.join(text))
+
+    for name in ('a', 'b'):
+        with open(os.path.join(tmpdir, name + '.txt')) as f:
+            assert f.read() == 'hello ' + name
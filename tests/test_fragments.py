@@ -0,0 +1,280 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import types
+import pytest
+
+from contemply.ast import CacheBlock
+from contemply.compiler import CompilingInterpreter
+from contemply.exceptions import ParserError
+from contemply.fragments import FragmentCache
+from contemply.frontend import TemplateParser
+from contemply.optimizer import iter_nodes
+from contemply.parser import TemplateContext, Parser
+from contemply.tokenizer import ENGINES
+from contemply.util import pure
+
+ROWS = '\n'.join([
+    '#: names = ["a", "b", "a", "a"]',
+    '#: for name in names',
+    '#: cache "row"',
+    'Row $name',
+    '#: count(name)',
+    '#: for letter in names',
+    '- $letter',
+    '#: endfor',
+    '#: endcache',
+    '#: endfor',
+])
+
+
+@pytest.fixture()
+def counted():
+    module = types.ModuleType('extension')
+    module.calls = []
+
+    # pure for the cache, the calls only show which blocks ran
+    @pure(cacheable=False)
+    def count(args, ctx):
+        module.calls.append(args[0])
+
+    module.count = count
+    return module
+
+
+def test_hits(parser_inst, counted):
+    parser_inst.register_lookup_module(counted)
+    result = parser_inst.parse(ROWS)
+
+    assert result['__default__'] == ['Row a', '- a', '- b', '- a', '- a', 'Row b', '- a', '- b', '- a', '- a'] + \
+        ['Row a', '- a', '- b', '- a', '- a'] * 2
+
+    # the block only ran for the first "a" and for "b"
+    assert counted.calls == ['a', 'b']
+    assert parser_inst.get_fragment_cache().get_stats() == {'hits': 2, 'disk_hits': 0, 'misses': 2, 'skipped': 0,
+                                                            'size': 2, 'hit_rate': 0.5}
+
+    # the cache is kept between templates
+    parser_inst.parse(ROWS)
+    assert counted.calls == ['a', 'b']
+
+
+def test_disabled(parser_inst, counted):
+    parser_inst.register_lookup_module(counted)
+    parser_inst.set_fragment_cache(None)
+    result = parser_inst.parse(ROWS)
+
+    assert len(result['__default__']) == 20
+    assert counted.calls == ['a', 'b', 'a', 'a']
+
+
+def test_keys(parser_inst):
+    result = parser_inst.parse('\n'.join([
+        '#: prefix = "x"',
+        '#: items = ["1", "2"]',
+        '#: cache "first"',
+        '$prefix',
+        '#: endcache',
+        '#: cache "second"',
+        '#: output("$prefix $items")',
+        '#: endcache',
+        '#: prefix = "y"',
+        '#: cache "first"',
+        '$prefix',
+        '#: endcache',
+        '#: items += "3"',
+        '#: cache "second"',
+        '#: output("$prefix $items")',
+        '#: endcache',
+    ]))
+
+    # the values of the variables are part of the key, including the $variables of strings
+    assert result['__default__'] == ['x', "x ['1', '2']", 'y', "y ['1', '2', '3']"]
+    assert parser_inst.get_fragment_cache().get_stats()['hits'] == 0
+
+
+def test_unknown_and_unstable_values(parser_inst):
+    ctx = parser_inst.get_template_context()
+    ctx.set('value', object())
+
+    text = '#: for i in items\n#: cache "block"\n#: if value\nprice: 5$\n#: endif\n#: endcache\n#: endfor'
+    ctx.set('items', [1, 2])
+    parser_inst.parse(text)
+
+    stats = parser_inst.get_fragment_cache().get_stats()
+    assert (stats['hits'], stats['skipped']) == (0, 2)
+
+    # "price" is not a variable, its value is unknown in every run
+    ctx.set('value', True)
+    result = parser_inst.parse(text)
+
+    assert result['__default__'] == ['price: 5$', 'price: 5$']
+    assert parser_inst.get_fragment_cache().get_stats()['hits'] == 1
+
+
+def test_persistent(tmpdir, counted):
+    directory = str(tmpdir.join('fragments'))
+
+    def run(text):
+        parser = TemplateParser()
+        parser.set_output_mode(TemplateParser.OUTPUTMODE_CONSOLE)
+        parser.register_lookup_module(counted)
+        parser.set_fragment_cache(FragmentCache(directory=directory))
+        result = parser.parse(text)
+        return result['__default__'], parser.get_fragment_cache().get_stats()
+
+    first, stats = run(ROWS)
+    assert stats['misses'] == 2
+
+    second, stats = run(ROWS)
+    assert second == first
+    assert (stats['disk_hits'], stats['hits'], stats['misses']) == (2, 2, 0)
+    assert counted.calls == ['a', 'b']
+
+    # a changed block does not use the output of the old block
+    changed, stats = run(ROWS.replace('Row $name', 'Row: $name'))
+    assert changed[0] == 'Row: a'
+    assert stats['misses'] == 2
+
+
+def test_break(parser_inst):
+    result = parser_inst.parse('\n'.join([
+        '#: items = [1, 2, 3]',
+        '#: for i in items',
+        '#: cache "loop"',
+        '#: for j in items',
+        '$i $j',
+        '#: if j == 2',
+        '#: break',
+        '#: endif',
+        '#: endfor',
+        '#: endcache',
+        '#: endfor',
+    ]))
+
+    assert result['__default__'] == ['1 1', '1 2', '2 1', '2 2', '3 1', '3 2']
+
+    with pytest.raises(ParserError, match='Break can not leave cache block "loop"'):
+        parser_inst.parse('#: while True\n#: cache "loop"\n#: break\n#: endcache\n#: endwhile')
+
+
+def test_syntax(parser_inst):
+    # names that start with the keywords are no keywords, for both tokenizer engines
+    for engine in ENGINES:
+        parser_inst.set_tokenizer_engine(engine)
+        assert parser_inst.parse('#: cached = "c"\n#: endcached = "e"\n$cached $endcached')['__default__'] == ['c e']
+
+    with pytest.raises(ParserError, match='Variables can not be assigned in cache block "x"'):
+        parser_inst.parse('#: cache "x"\n#: a = 1\n#: endcache')
+
+    with pytest.raises(ParserError, match='Cache block "x" can not contain file blocks'):
+        parser_inst.parse('#: cache "x"\n#: >> "file.txt"\n#: <<\n#: endcache')
+
+    with pytest.raises(ParserError, match='Unexpected ENDCACHE'):
+        parser_inst.parse('text\n#: endcache')
+
+    with pytest.raises(ParserError, match='Unexpected end of file, expected ENDCACHE'):
+        parser_inst.parse('#: cache "x"\ntext')
+
+
+def test_functions_that_are_not_pure(parser_inst, counted, capsys, monkeypatch):
+    text = '\n'.join([
+        '#: for i in items',
+        '#: cache "block"',
+        '#: echo("side effect")',
+        '#: output(env("CONTEMPLY_TEST"))',
+        '#: endcache',
+        '#: endfor',
+    ])
+    parser_inst.get_template_context().set('items', [1, 1])
+
+    # functions with side effects run every time
+    monkeypatch.setenv('CONTEMPLY_TEST', 'first')
+    assert parser_inst.parse(text)['__default__'] == ['first', 'first']
+    assert capsys.readouterr().out.count('side effect') == 2
+
+    # the result of env() does not only depend on its arguments
+    monkeypatch.setenv('CONTEMPLY_TEST', 'second')
+    assert parser_inst.parse(text)['__default__'] == ['second', 'second']
+
+    stats = parser_inst.get_fragment_cache().get_stats()
+    assert (stats['hits'], stats['misses'], stats['skipped']) == (0, 0, 4)
+
+    # functions of extensions have to be declared pure
+    parser_inst.register_lookup_module(counted)
+    del counted.count.pure
+    parser_inst.parse('#: for i in items\n#: cache "count"\n#: count(i)\n#: endcache\n#: endfor')
+    assert counted.calls == [1, 1]
+
+
+@pytest.mark.parametrize('engine', ENGINES.keys())
+@pytest.mark.parametrize('backend', ['interpreter', 'compiler'])
+def test_names(engine, backend):
+    parser = TemplateParser()
+    parser.set_output_mode(TemplateParser.OUTPUTMODE_CONSOLE)
+    parser.set_tokenizer_engine(engine)
+    parser.set_backend(backend)
+
+    # "cache" and "endcache" only start and end a cache block in front of a key or on their own
+    result = parser.parse('\n'.join([
+        '#: cache = "x"',
+        'value $cache',
+        '#: items = ["a", "b"]',
+        '#: for cache in items',
+        '#: cache "row"',
+        '- $cache',
+        '#: endcache',
+        '#: endfor',
+        '#: endcache = cache + "y"',
+        '#: if endcache == "xy"',
+        '$endcache',
+        '#: endif',
+    ]))
+
+    assert result['__default__'] == ['value x', '- a', '- b', 'xy']
+
+
+@pytest.mark.parametrize('engine', ENGINES.keys())
+def test_reads(engine):
+    ctx = TemplateContext()
+    ctx.set_text('\n'.join([
+        '#: cache "x"',
+        '$a $b[1]',
+        '#: for item in items',
+        '#: -> "$item $c"',
+        '#: endfor',
+        '#: if size(d) > 0',
+        '#: output("$item $e")',
+        '#: endif',
+        '#: endcache',
+    ]))
+    tree = Parser(ENGINES[engine](ctx), ctx).parse()
+    node = next(node for node in iter_nodes(tree) if type(node) is CacheBlock)
+
+    # the item variable of the loop is not read from outside the loop, the one in output() is
+    assert node.reads == ('a', 'b', 'items', 'c', 'd', 'item', 'e')
+    assert node.calls == ('size', 'output')
+
+
+def test_compiled():
+    ctx = TemplateContext()
+    ctx.set_text('#: cache "x"\nline\n#: endcache')
+    tree = Parser(ENGINES['classic'](ctx), ctx).parse()
+    compiled = CompilingInterpreter(ctx).compile(tree)
+
+    assert 'interp._fragment_key(consts[0])' in compiled.source
+
+
+def test_key_names():
+    cache = FragmentCache()
+    first, second = CacheBlock('x', None), CacheBlock('x', None)
+    first.fingerprint = second.fingerprint = 'same'
+    first.reads, second.reads = ('a', 'b'), ('b', 'a')
+
+    # a=1, b=2 and a=2, b=1 never share their output, even if the names were found in a different order
+    assert cache.make_block_key(first, [1, 2]) != cache.make_block_key(second, [2, 1])
+    assert cache.make_block_key(first, [1, 2]) == cache.make_block_key(first, [1, 2])
@@ -0,0 +1,128 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import types
+import pytest
+
+from contemply.exceptions import ParserError
+from contemply.frames import Frame, UNSET, resolve_slots
+from contemply.optimizer import iter_nodes
+from contemply.ast import Variable, Assignment
+from contemply.interpreter import Interpreter
+from contemply.parser import TemplateContext, Parser
+from contemply.tokenizer import ENGINES
+
+
+def parse(text):
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    return Parser(ENGINES['classic'](ctx), ctx).parse()
+
+
+def test_slots():
+    tree = parse('\n'.join([
+        '#: a = 1',
+        '#: for a in items',
+        '#: b = a',
+        '#: endfor',
+        '#: c = a + True',
+    ]))
+    scope = resolve_slots(tree, ['True']).scope
+
+    assert scope.names == ['a', 'a', 'items', 'b', 'c']
+    assert scope.globals == {'a': 0, 'items': 2, 'b': 3, 'c': 4}
+
+    slots = {}
+    for node in iter_nodes(tree):
+        if type(node) is Variable:
+            slots.setdefault(node.name, set()).add(node.slot)
+        elif type(node) is Assignment:
+            slots.setdefault(node.variable, set()).add(node.slot)
+
+    # the loop variable has its own slot, builtins have none
+    assert slots['a'] == {0, 1}
+    assert slots['True'] == {None}
+
+
+def test_frame():
+    tree = resolve_slots(parse('#: a = b\n#: for b in a\n#: endfor'))
+    frame = Frame(tree.scope, lambda name: [1] if name == 'b' else UNSET)
+
+    assert frame.values == [UNSET, [1], UNSET]
+    assert frame.get_globals() == {'b': [1]}
+
+    previous = frame.bind('b', 2)
+    frame.values[2] = 1
+    assert frame.get_visible() == {'b': 1}
+
+    frame.unbind('b', previous)
+    assert frame.get_visible() == {'b': [1]}
+
+
+def test_loop_variables_are_local(parser_inst):
+    result = parser_inst.parse('\n'.join([
+        '#: item = "outer"',
+        '#: items = ["a", "b"]',
+        '#: for item in items',
+        '$item',
+        '#: endfor',
+        '$item',
+        '#: for other in items',
+        '#: endfor',
+    ]))
+
+    assert result['__default__'] == ['a', 'b', 'outer']
+    assert parser_inst.get_template_context().get_all() == {'item': 'outer', 'items': ['a', 'b']}
+
+    with pytest.raises(ParserError, match='Unknown variable: "other"'):
+        parser_inst.parse('#: for other in items\n#: endfor\n$other')
+
+
+def test_variables_are_kept(parser_inst):
+    parser_inst.parse('#: a = 1')
+    parser_inst.parse('#: b = a + 1')
+
+    assert parser_inst.get_template_context().get_all() == {'a': 1, 'b': 2}
+
+
+def test_extensions_see_the_frame(parser_inst):
+    module = types.ModuleType('extension')
+    module.seen = []
+
+    def remember(args, ctx):
+        module.seen.append((ctx.get('item'), ctx.has('count'), dict(ctx.get_all())))
+        ctx.set('count', ctx.get('count') + 1 if ctx.has('count') else 1)
+        ctx.set('item', 'changed')
+
+    module.remember = remember
+    parser_inst.register_lookup_module(module)
+
+    result = parser_inst.parse('\n'.join([
+        '#: items = [1, 2]',
+        '#: for item in items',
+        '#: remember()',
+        '$item $count',
+        '#: endfor',
+    ]))
+
+    assert result['__default__'] == ['changed 1', 'changed 2']
+    assert module.seen == [
+        (1, False, {'items': [1, 2], 'item': 1}),
+        (2, True, {'items': [1, 2], 'item': 2, 'count': 1}),
+    ]
+    assert parser_inst.get_template_context().get_all() == {'items': [1, 2], 'count': 2}
+
+
+def test_templates_run_without_the_frontend():
+    ctx = TemplateContext()
+    ctx.set('names', ['x'])
+    ctx.set_text('#: for name in names\n#: last = name\n#: endfor')
+    tree = Parser(ENGINES['classic'](ctx), ctx).parse()
+    Interpreter(ctx).interpret(tree)
+
+    assert tree.scope is not None
+    assert ctx.get_all() == {'names': ['x'], 'last': 'x'}
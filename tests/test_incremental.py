@@ -0,0 +1,174 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import io
+
+from contemply.incremental import IncrementalParser
+from contemply.langserver import LanguageServer, read_message, write_message
+from contemply.parser import TemplateContext, Parser
+from contemply.tokenizer import ENGINES
+
+TEXT = '\n'.join([
+    '#: name = "World"',
+    'Hello $name',
+    'more content',
+    '#: if name == "World"',
+    '#: greeting = uppercase(name)',
+    '$greeting',
+    '#: endif',
+    '#::',
+    'items = ["a", "b"]',
+    '#::',
+    '#: for item in items',
+    '- $item',
+    '#: endfor',
+])
+
+
+def parse_sequential(text):
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    return Parser(ENGINES['classic'](ctx), ctx).parse()
+
+
+def test_tree_equals_full_parse(ast_dump):
+    parser = IncrementalParser()
+    tree = parser.update(TEXT)
+
+    assert parser.diagnostics == []
+    assert ast_dump(tree) == ast_dump(parse_sequential(TEXT))
+
+
+def test_unchanged_chunks_are_reused(ast_dump):
+    parser = IncrementalParser()
+    parser.update(TEXT)
+    chunks = parser.parsed
+
+    tree = parser.update(TEXT.replace('more content', 'other content'))
+
+    assert parser.parsed == 1
+    assert parser.reused == chunks - 1
+    assert ast_dump(tree) == ast_dump(parse_sequential(TEXT.replace('more content', 'other content')))
+
+    # inserting lines moves chunks, but does not change them
+    parser.update(TEXT)
+    parser.update('New first line\n' + TEXT)
+    assert parser.parsed == 1
+
+
+def test_diagnostics():
+    parser = IncrementalParser()
+    parser.update(TEXT.replace('#: greeting = uppercase(name)', '#: greeting = "unterminated'))
+
+    assert len(parser.diagnostics) == 1
+    assert parser.diagnostics[0].line == 4
+    assert parser.diagnostics[0].kind == 'SyntaxError'
+
+    # errors in other chunks are reported as well
+    parser.update(TEXT.replace('#: endfor', '#: endfor\n#: )'))
+    assert [d.line for d in parser.diagnostics] == [13]
+
+    parser.update(TEXT)
+    assert parser.diagnostics == []
+
+
+def test_symbols():
+    parser = IncrementalParser()
+    parser.update(TEXT)
+
+    assert parser.definition('name') == (0, 3)
+    assert parser.definition('greeting') == (4, 3)
+    assert parser.definition('items') == (8, 0)
+    assert parser.definition('item') == (10, 7)
+    assert parser.word_at(4, 20) == ('uppercase', True)
+    assert parser.word_at(1, 8) == ('name', False)
+
+    # lazy assignments define their variable, "lazy" can still be a name itself
+    parser.update(TEXT + '\n#: lazy answer = ask("Answer?")\n#: lazy = 1')
+    assert parser.definition('answer') == (13, 8)
+    assert parser.definition('lazy') == (14, 3)
+    assert parser.diagnostics == []
+
+
+def request(messages):
+    stream = io.BytesIO()
+    for message in messages:
+        write_message(stream, dict(message, jsonrpc='2.0'))
+
+    stream.seek(0)
+    output = io.BytesIO()
+    code = LanguageServer().serve(stream, output)
+
+    output.seek(0)
+    responses = []
+    while True:
+        message = read_message(output)
+        if message is None:
+            return code, responses
+
+        responses.append(message)
+
+
+def test_langserver():
+    uri = 'file:///demo.pytpl'
+    doc = {'uri': uri}
+
+    code, responses = request([
+        {'id': 1, 'method': 'initialize', 'params': {}},
+        {'method': 'textDocument/didOpen', 'params': {'textDocument': dict(doc, text=TEXT)}},
+        {'method': 'textDocument/didChange',
+         'params': {'textDocument': doc, 'contentChanges': [{'text': TEXT + '\n#: x = "open'}]}},
+        {'id': 2, 'method': 'textDocument/definition',
+         'params': {'textDocument': doc, 'position': {'line': 11, 'character': 4}}},
+        {'id': 3, 'method': 'textDocument/hover',
+         'params': {'textDocument': doc, 'position': {'line': 4, 'character': 16}}},
+        {'id': 4, 'method': 'textDocument/documentSymbol', 'params': {'textDocument': doc}},
+        {'id': 5, 'method': 'unknown/method'},
+        {'id': 6, 'method': 'shutdown'},
+        {'method': 'exit'},
+    ])
+
+    assert code == 0
+    assert responses[0]['result']['capabilities']['textDocumentSync'] == 1
+
+    assert responses[1]['method'] == 'textDocument/publishDiagnostics'
+    assert responses[1]['params']['diagnostics'] == []
+    diagnostics = responses[2]['params']['diagnostics']
+    assert len(diagnostics) == 1
+    assert diagnostics[0]['range']['start'] == {'line': 13, 'character': 12}
+
+    assert responses[3]['result']['range']['start'] == {'line': 10, 'character': 7}
+    assert 'uppercase' in responses[4]['result']['contents']['value']
+    assert [s['name'] for s in responses[5]['result']] == ['name', 'greeting', 'items', 'item', 'x']
+    assert responses[6]['error']['code'] == -32601
+    assert responses[7]['result'] is None
+
+
+def test_langserver_errors():
+    uri = 'file:///demo.pytpl'
+    doc = {'uri': uri}
+
+    code, responses = request([
+        {'method': 'textDocument/didOpen', 'params': {'textDocument': dict(doc, text='#: a = !x')}},
+        # errors in handlers are logged for notifications and returned for requests, the server keeps running
+        {'method': 'textDocument/didChange', 'params': {'textDocument': doc}},
+        {'id': 1, 'method': 'textDocument/hover', 'params': {'textDocument': doc}},
+        {'id': 2, 'method': 'shutdown'},
+        {'method': 'exit'},
+    ])
+
+    assert code == 0
+    assert len(responses) == 3
+
+    diagnostics = responses[0]['params']['diagnostics']
+    assert len(diagnostics) == 1
+    assert "Unrecognized token '!'" in diagnostics[0]['message']
+    assert diagnostics[0]['range']['start'] == {'line': 0, 'character': 7}
+
+    assert responses[1]['id'] == 1
+    assert responses[1]['error']['code'] == -32603
+    assert responses[2] == {'jsonrpc': '2.0', 'id': 2, 'result': None}
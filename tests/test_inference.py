@@ -0,0 +1,172 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import pytest
+
+import contemply.util as util
+from contemply.ast import *
+from contemply.compiler import CompilingInterpreter
+from contemply.exceptions import ParserError
+from contemply.inference import infer_types
+from contemply.interpreter import Interpreter
+from contemply.optimizer import OptimizerContext, iter_nodes
+from contemply.parser import TemplateContext, Parser
+from contemply.tokenizer import ENGINES
+from contemply.samples import function_extension
+
+
+def parse(text):
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    return ctx, Parser(ENGINES['classic'](ctx), ctx).parse()
+
+
+def checked_calls(text, octx=None):
+    ctx, tree = parse(text)
+    infer_types(tree, octx)
+    return [(node.name, node.checked) for node in iter_nodes(tree) if type(node) is Function]
+
+
+@pytest.fixture()
+def checks(monkeypatch):
+    calls = []
+    check = util.Signature.check
+
+    def counting_check(signature, args):
+        calls.append(signature.name)
+        check(signature, args)
+
+    monkeypatch.setattr(util.Signature, 'check', counting_check)
+    return calls
+
+
+def test_literal_arguments():
+    assert checked_calls('#: a = uppercase("a")\n#: b = size([1, 2])\n#: c = replace("a", ["a"], "b")') == [
+        ('uppercase', True), ('size', True), ('replace', True)]
+
+
+def test_variable_types():
+    assert checked_calls('\n'.join([
+        '#: name = ask("Name?")',
+        '#: title = uppercase(name) + "!"',
+        '#: length = size(title) * 2',
+        '#: flag = contains(title, "A")',
+        '#: x = replace(title, name, lowercase(title))',
+    ])) == [('ask', True), ('uppercase', True), ('size', True), ('contains', True), ('replace', True),
+            ('lowercase', True)]
+
+
+def test_unknown_types_keep_the_check():
+    assert checked_calls('\n'.join([
+        # read before the assignment, the value could be left from another template
+        '#: a = uppercase(name)',
+        '#: name = "x"',
+        # assigned values of different types
+        '#: value = "a"',
+        '#: if True',
+        '#: value = 1',
+        '#: endif',
+        '#: b = uppercase(value)',
+        # loop variables and list items
+        '#: items = ["a"]',
+        '#: for item in items',
+        '#: c = uppercase(item)',
+        '#: endfor',
+        '#: d = uppercase(items[0])',
+        # choose() returns an item of any type
+        '#: e = uppercase(choose("?", items))',
+    ])) == [('uppercase', False), ('uppercase', False), ('uppercase', False), ('uppercase', False),
+            ('uppercase', False), ('choose', True)]
+
+
+def test_variables_assigned_from_themselves():
+    assert checked_calls('#: a = "x"\n#: a = a + "y"\n#: b = uppercase(a)') == [('uppercase', True)]
+    assert checked_calls('#: a = a + "y"\n#: b = uppercase(a)') == [('uppercase', False)]
+
+
+def test_extension_functions():
+    octx = OptimizerContext(lookup_modules=[function_extension])
+
+    # the extension function could change any variable
+    assert checked_calls('#: a = "x"\n#: b = my_function()\n#: c = uppercase(a)\n#: d = uppercase("y")', octx) == [
+        ('my_function', True), ('uppercase', False), ('uppercase', True)]
+
+    # builtins of the interpreter
+    assert checked_calls('#: a = size(Yes)', OptimizerContext({'Yes': 'y'})) == [('size', True)]
+
+    with pytest.raises(ParserError):
+        checked_calls('#: a = size(Yes)', OptimizerContext({'Yes': True}))
+
+
+@pytest.mark.parametrize('text', [
+    '#: a = uppercase(1)',
+    '#: a = contains("a")',
+    '#: a = uppercase("a", "b")',
+    '#: a = size(None)',
+    '#: a = 1\n#: b = a + 2\n#: c = uppercase(b)',
+    '#: if False\n#: a = capitalize(True)\n#: endif',
+])
+def test_wrong_calls(text):
+    with pytest.raises(ParserError):
+        infer_types(parse(text)[1])
+
+
+def test_impossible_values_keep_the_check():
+    # the operation always fails, so its error is raised instead
+    assert checked_calls('#: a = "a" - 1\n#: b = uppercase(a)') == [('uppercase', False)]
+
+
+@pytest.mark.parametrize('text', [
+    '#: a = "x"\n#: b = uppercase(a) + lowercase("Y")\n$b',
+    '#: a = replace("abc", ["a", "b"], "-")\n#: b = contains(a, "-")\n$a $b',
+    '#: a = "x"\n#: b = size(a) * 2\n#: c = size([a, b])\n$b $c',
+    '#: a = "x"\n#: while size(a) < 5\n#: a = a + capitalize("y")\n#: endwhile\n$a',
+    '#: a = uppercase(missing)',
+    '#: a = "a" - 1\n#: b = uppercase(a)',
+    '#: items = ["a", 1]\n#: for item in items\n$item\n#: b = uppercase(item)\n#: endfor',
+    '#: a = lowercase(1)',
+])
+@pytest.mark.parametrize('interpreter_class', [Interpreter, CompilingInterpreter])
+def test_same_output(text, interpreter_class):
+    results = []
+
+    for infer in (False, True):
+        ctx, tree = parse(text)
+
+        try:
+            if infer:
+                infer_types(tree)
+
+            interpreter = interpreter_class(ctx)
+            interpreter.interpret(tree)
+            results.append((interpreter.get_parsed_template(), dict(ctx.get_all())))
+        except Exception as e:
+            results.append(type(e).__name__)
+
+    # wrong calls fail before the template runs
+    assert results[0] == results[1] or results[1] == 'ParserError'
+
+
+def test_checked_calls_skip_the_check(parser_inst, checks):
+    result = parser_inst.parse('#: a = "x"\n#: b = uppercase(a)\n#: c = size(b) + size([b])\n$b $c')
+
+    assert result['__default__'] == ['X 2']
+    assert checks == []
+
+
+def test_unchecked_calls_are_checked(parser_inst, checks):
+    with pytest.raises(Exception):
+        parser_inst.parse('#: items = [1]\n#: for item in items\n#: b = uppercase(item)\n#: endfor')
+
+    assert checks == ['uppercase()']
+
+
+def test_wrong_calls_fail_before_the_template_runs(parser_inst, capsys):
+    with pytest.raises(ParserError):
+        parser_inst.parse('#: echo("running")\n#: a = lowercase(1)')
+
+    assert 'running' not in capsys.readouterr().out
@@ -0,0 +1,105 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import pytest
+
+from contemply.ast import ContentLine, OutputExpression
+from contemply.exceptions import ParserError
+from contemply.interpolation import VARIABLE_PATTERN, variable_text, split_variables
+from contemply.parser import TemplateContext
+
+TEXTS = [
+    'no variables',
+    'Hello $name!',
+    '$name',
+    '$name$name',
+    '$$name',
+    '$ name $',
+    'price: 5$',
+    '$items[1] and $items[0]',
+    '$items[1]x',
+    '$text[1] is not a list',
+    '$number.$number',
+    '$name_with_underscores-$name',
+    'tab\t$name\tend',
+    'line\n$name\n',
+]
+
+VALUES = {
+    'name': 'World',
+    'name_with_underscores': 'u',
+    'items': ['a', 'b'],
+    'text': 'abc',
+    'number': 42,
+}
+
+
+def substitute(text, values):
+    # how variables were replaced before the segments
+    return VARIABLE_PATTERN.sub(lambda match: variable_text(values[match.group(1)[1:]], match), text)
+
+
+@pytest.fixture()
+def ctx():
+    ctx = TemplateContext()
+
+    for name, value in VALUES.items():
+        ctx.set(name, value)
+
+    return ctx
+
+
+@pytest.mark.parametrize('text', TEXTS)
+def test_same_as_substitution(ctx, text):
+    assert ctx.process_variables(text) == substitute(text, VALUES)
+
+
+def test_segments():
+    assert split_variables('no variables') is None
+    assert split_variables('price: 5$') is None
+    assert split_variables('Hello $name!') == ('Hello ', ('name', None), '!')
+    assert split_variables('$items[1] $a') == ('', ('items', 1), ' ', ('a', None), '')
+
+    # the index is only part of the variable if it is not followed by a word character
+    assert split_variables('$items[1]x') == ('', ('items', None), '[1]x')
+
+    # the text of dynamic strings is only split once
+    assert split_variables('echo $name') is split_variables('echo $name')
+
+
+def test_nodes_are_split_when_created():
+    line = ContentLine('Hello $name')
+    assert line.segments == ('Hello ', ('name', None), '')
+
+    # the partial evaluation replaces the content
+    line.content = 'Hello World'
+    assert line.segments is None
+
+    assert OutputExpression('$name').segments == ('', ('name', None), '')
+
+
+def test_errors(ctx):
+    with pytest.raises(ParserError, match='Unknown variable: "missing"'):
+        ctx.process_variables('Hello $missing')
+
+    with pytest.raises(IndexError):
+        ctx.process_variables('$items[2]')
+
+
+def test_content_lines(parser_inst):
+    result = parser_inst.parse('\n'.join([
+        '#: names = ["a", "b"]',
+        '#: for name in names',
+        '$name: $names[1]',
+        '#: output("out $name")',
+        '#: endfor',
+        '#::',
+        '-> "$names[0]$names"',
+        '#::',
+    ]))
+
+    assert result['__default__'] == ['a: b', 'out a', 'b: b', 'out b', "a$names"]
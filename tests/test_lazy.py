@@ -0,0 +1,143 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import re
+import types
+import pytest
+
+import contemply.cli as cli
+from contemply.ast import Assignment
+from contemply.compiler import CompilingInterpreter
+from contemply.exceptions import ParserError
+from contemply.optimizer import iter_nodes
+from contemply.parser import TemplateContext, Parser
+from contemply.tokenizer import ENGINES
+
+
+@pytest.fixture()
+def questions(monkeypatch):
+    asked = []
+
+    def user_input(prompt):
+        question = re.sub(r'\x1b\[\d+m', '', prompt).strip().rstrip('?')
+        asked.append(question)
+        return 'answer {0}'.format(question)
+
+    def prompt(question, default='Yes'):
+        asked.append(question.rstrip('?'))
+        return True
+
+    monkeypatch.setattr(cli, 'user_input', user_input)
+    monkeypatch.setattr(cli, 'prompt', prompt)
+    return asked
+
+
+def test_asked_on_first_use(parser_inst, questions):
+    result = parser_inst.parse('\n'.join([
+        '#: lazy first = ask("first?")',
+        '#: lazy second = ask("second?")',
+        '#: lazy unused = ask("unused?")',
+        '#: if False',
+        '$unused',
+        '#: endif',
+        '$second',
+        '$first and $second',
+    ]))
+
+    assert result['__default__'] == ['answer second', 'answer first and answer second']
+    assert questions == ['second', 'first']
+
+
+def test_reads(parser_inst, questions):
+    module = types.ModuleType('extension')
+    module.seen = []
+    module.remember = lambda args, ctx: module.seen.append((ctx.has('name'), sorted(ctx.get_all())))
+    parser_inst.register_lookup_module(module)
+
+    result = parser_inst.parse('\n'.join([
+        '#: lazy name = ask("name?")',
+        '#: lazy names = []',
+        '#: remember()',
+        '#: names += uppercase(name)',
+        '#: remember()',
+        '#: for item in names',
+        '$item',
+        '#: endfor',
+    ]))
+
+    assert result['__default__'] == ['ANSWER NAME']
+    assert questions == ['name']
+
+    # has() and get_all() do not compute lazy variables
+    assert module.seen == [(True, []), (True, ['name', 'names'])]
+
+
+def test_variables_after_the_template(parser_inst, questions):
+    parser_inst.parse('#: used = "old"\n#: unused = "old"')
+    parser_inst.parse('#: lazy used = ask("used?")\n#: lazy unused = ask("unused?")\n$used')
+
+    # a lazy variable that was never read has no value
+    assert parser_inst.get_template_context().get_all() == {'used': 'answer used'}
+    assert questions == ['used']
+
+
+def test_values_are_computed_when_read(parser_inst):
+    result = parser_inst.parse('\n'.join([
+        '#: a = 1',
+        '#: lazy b = a + 1',
+        '#: a = 5',
+        '$b',
+        '#: a = 10',
+        '$b',
+    ]))
+
+    assert result['__default__'] == ['6', '6']
+
+
+def test_syntax(parser_inst):
+    # "lazy" is only a keyword in front of an assignment
+    assert parser_inst.parse('#: lazy = 1\n$lazy')['__default__'] == ['1']
+
+    with pytest.raises(ParserError, match='Expected "=" after "lazy items"'):
+        parser_inst.parse('#: items = []\n#: lazy items += 1')
+
+    with pytest.raises(ParserError, match='lazy variable "count" can not read the variable itself'):
+        parser_inst.parse('#: count = 1\n#: lazy count = count + 1')
+
+
+def test_lazy_prompts(parser_inst, questions):
+    parser_inst.set_lazy(True)
+    text = '\n'.join([
+        '#: name = ask("name?")',
+        '#: unused = ask("unused?")',
+        '#: known = yesno("known?")',
+        '#: prefix = "p"',
+        '#: dynamic = ask(prefix)',
+        '#: if known',
+        '#: other = ask("other?")',
+        '#: endif',
+        '$name',
+    ])
+
+    result = parser_inst.parse(text)
+
+    assert result['__default__'] == ['answer name']
+    assert questions == ['p', 'known', 'other', 'name']
+
+    tree = parser_inst._compile()
+    lazy = [node.variable for node in iter_nodes(tree) if type(node) is Assignment and node.lazy]
+    assert lazy == ['name', 'unused', 'known']
+
+
+def test_compiled():
+    ctx = TemplateContext()
+    ctx.set_text('#: lazy a = uppercase("x")\n#: lazy items = []\n#: items += a\n$a')
+    tree = Parser(ENGINES['classic'](ctx), ctx).parse()
+    compiled = CompilingInterpreter(ctx).compile(tree)
+
+    assert 'values[0] = defer(' in compiled.source
+    assert "load_lazy(0, 'a')" in compiled.source
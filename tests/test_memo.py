@@ -0,0 +1,194 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import types
+import pytest
+
+import contemply.functions
+from contemply.memo import CallCache
+from contemply.optimizer import OptimizerContext
+from contemply.util import pure, signature
+
+
+def counting(result=None):
+    calls = []
+
+    def func(args, ctx):
+        calls.append(list(args))
+        return result if result is not None else repr(args)
+
+    return func, calls
+
+
+def test_hits_and_misses():
+    cache = CallCache(10)
+    func, calls = counting()
+    cached = cache.wrap(func)
+
+    assert cached(['a'], None) == "['a']"
+    assert cached(['a'], None) == "['a']"
+    assert cached(['b', ['c']], None) == "['b', ['c']]"
+    assert cached(['b', ['c']], None) == "['b', ['c']]"
+
+    assert calls == [['a'], ['b', ['c']]]
+    assert cache.get_stats() == {'hits': 2, 'misses': 2, 'size': 2, 'maxsize': 10}
+
+    cache.clear()
+    assert cache.get_stats() == {'hits': 0, 'misses': 0, 'size': 0, 'maxsize': 10}
+
+
+def test_least_recently_used_results_are_evicted():
+    cache = CallCache(2)
+    func, calls = counting()
+    cached = cache.wrap(func)
+
+    for arg in ['a', 'b', 'a', 'c', 'a', 'b']:
+        cached([arg], None)
+
+    # b was evicted by c, a was used again before
+    assert calls == [['a'], ['b'], ['c'], ['b']]
+    assert cache.get_stats()['size'] == 2
+
+
+def test_keys_include_types():
+    cache = CallCache()
+    func, calls = counting()
+    cached = cache.wrap(func)
+
+    for args in ([1], [True], [1.0], [[1]], [(1,)], ['1']):
+        cached(args, None)
+
+    assert len(calls) == 6
+
+
+def test_functions_have_their_own_results():
+    cache = CallCache()
+    first = cache.wrap(lambda args, ctx: 'first')
+    second = cache.wrap(lambda args, ctx: 'second')
+
+    assert (first(['a'], None), second(['a'], None)) == ('first', 'second')
+
+
+def test_uncacheable_calls():
+    cache = CallCache()
+
+    # mutable results could be changed by the template
+    func, calls = counting(result=['list'])
+    cached = cache.wrap(func)
+    cached(['a'], None)
+    cached(['a'], None)
+    assert len(calls) == 2
+
+    # unhashable arguments
+    func, calls = counting()
+    cached = cache.wrap(func)
+    cached([{}], None)
+    cached([{}], None)
+    assert len(calls) == 2
+
+    # errors are raised every time
+    def failing(args, ctx):
+        calls.append(args)
+        raise ValueError()
+
+    cached = cache.wrap(failing)
+    for i in range(0, 2):
+        with pytest.raises(ValueError):
+            cached(['a'], None)
+
+    assert len(calls) == 4
+
+
+def test_target():
+    cache = CallCache()
+    checked = signature('str', returns='str')(lambda args, ctx: args[0].upper())
+    cached = cache.wrap(checked, checked.unchecked)
+
+    assert cached(['a'], None) == 'A'
+    assert cache.get_stats()['misses'] == 1
+
+
+def test_declarations():
+    for name in ('uppercase', 'lowercase', 'capitalize', 'contains', 'replace', 'size'):
+        func = getattr(contemply.functions, name)
+        assert func.pure and not func.cacheable
+        assert OptimizerContext().is_pure(name)
+
+    for name in ('ask', 'choose', 'yesno', 'env', 'echo', 'makeFolders', 'setOutput'):
+        assert not getattr(getattr(contemply.functions, name), 'pure', False)
+        assert not OptimizerContext().is_pure(name)
+
+    @pure
+    @signature('str')
+    def inner(args, ctx):
+        pass
+
+    @signature('str')
+    @pure
+    def outer(args, ctx):
+        pass
+
+    assert inner.pure and inner.cacheable and outer.pure and outer.cacheable
+
+
+@pytest.fixture()
+def extension():
+    module = types.ModuleType('extension')
+    module.calls = []
+
+    @pure
+    @signature('str', returns='str')
+    def normalize(args, ctx):
+        module.calls.append(args[0])
+        return args[0].strip().lower()
+
+    @signature('str', returns='str')
+    def counter(args, ctx):
+        module.calls.append('counter')
+        return str(len(module.calls))
+
+    module.normalize = normalize
+    module.counter = counter
+    return module
+
+
+TEMPLATE = '\n'.join([
+    '#: names = [" A", "b ", " A"]',
+    '#: for name in names',
+    '#: short = normalize(name)',
+    '#: count = counter(name)',
+    '$short',
+    '#: endfor',
+])
+
+
+def test_pure_functions_are_memoized(parser_inst, extension):
+    parser_inst.register_lookup_module(extension)
+
+    assert parser_inst.parse(TEMPLATE)['__default__'] == ['a', 'b', 'a']
+    assert extension.calls == [' A', 'counter', 'b ', 'counter', 'counter']
+
+    # the results are kept for the next template
+    parser_inst.parse(TEMPLATE)
+    assert extension.calls.count(' A') == 1
+    assert extension.calls.count('counter') == 6
+
+    stats = parser_inst.get_call_cache().get_stats()
+    assert (stats['hits'], stats['misses']) == (4, 2)
+
+
+def test_call_cache_size(parser_inst, extension):
+    parser_inst.register_lookup_module(extension)
+    parser_inst.set_call_cache_size(0)
+
+    assert parser_inst.get_call_cache() is None
+    assert parser_inst.parse(TEMPLATE)['__default__'] == ['a', 'b', 'a']
+    assert extension.calls.count(' A') == 2
+
+    parser_inst.set_call_cache_size(1)
+    parser_inst.parse(TEMPLATE)
+    assert extension.calls.count(' A') == 4
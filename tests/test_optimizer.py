@@ -0,0 +1,465 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+"""
+Every template is run with and without the optimizer, both have to produce the same output, the same variables
+and the same errors.
+"""
+
+import random
+import pytest
+
+from contemply.ast import *
+from contemply.compiler import CompilingInterpreter
+from contemply.interpreter import Interpreter
+from contemply.optimizer import Optimizer, OptimizerContext, ConstantFolding, iter_nodes, merge_content_lines
+from contemply.parser import TemplateContext, Parser
+from contemply.tokenizer import ENGINES
+
+TEMPLATES = {
+    'folding': [
+        '#: a = 2 * 3',
+        '#: b = "x" + "y"',
+        '#: c = 7 / 2',
+        '#: d = [1, True, None]',
+        '$a $b $c $d',
+    ],
+    'errors_are_not_folded': [
+        '#: a = 1 / 0',
+    ],
+    'type_errors_are_not_folded': [
+        'before',
+        '#: a = "a" - 1',
+    ],
+    'dead_branches': [
+        '#: if False',
+        'never',
+        '#: elseif 1 > 2',
+        'never',
+        '#: else',
+        'else',
+        '#: endif',
+        '#: if True',
+        'always',
+        '#: else',
+        'never',
+        '#: endif',
+        '#: if 1 == 1',
+        'first',
+        '#: elseif "a" != "b"',
+        'second',
+        '#: endif',
+        '#: while False',
+        'never',
+        '#: endwhile',
+    ],
+    'noops': [
+        '#::',
+        'x = 1',
+        '',
+        'if True',
+        '',
+        '  y = 2',
+        '',
+        'endif',
+        '',
+        '#::',
+        '#:',
+        '#: endif',
+        '$x $y',
+    ],
+    'break_in_dead_branch': [
+        '#: items = ["a", "b"]',
+        '#: for item in items',
+        '#: if True',
+        '#: break',
+        '#: endif',
+        'not reached $item',
+        '#: endfor',
+        'not reached either',
+    ],
+    'break_flag_before_noop': [
+        '#: items = ["a", "b", "c"]',
+        '#: for item in items',
+        '#: if item != ""',
+        '#: break',
+        '#: elseif True',
+        '#:',
+        'does not run, the NoOp is the first statement $item',
+        '#: endif',
+        '#: endfor',
+    ],
+    'break_flag_before_constant_if': [
+        '#: items = ["a", "b"]',
+        '#: for item in items',
+        '#: if item != ""',
+        '#: break',
+        '#: elseif True',
+        '#: if True',
+        'first statement runs $item',
+        '#: endif',
+        'second does not',
+        '#: endif',
+        '#: endfor',
+    ],
+    'break_flag_before_empty_branch': [
+        '#: items = ["a", "b"]',
+        '#: for item in items',
+        '#: if item != ""',
+        '#: break',
+        '#: elseif True',
+        '#: if False',
+        'never',
+        '#: endif',
+        'does not run $item',
+        '#: endif',
+        '#: endfor',
+    ],
+    'break_flag_before_empty_block': [
+        '#: items = ["a", "b"]',
+        '#: for item in items',
+        '#: if item != ""',
+        '#: break',
+        '#: elseif True',
+        '#: if True',
+        '#: endif',
+        'does not run $item',
+        '#: endif',
+        '#: endfor',
+    ],
+    'builtin_used_before_assignment': [
+        '#: True = 5',
+        '#: x = True',
+        '$x',
+    ],
+    'counting_loops': [
+        '#: i = 0',
+        '#: while i < 5',
+        'up $i',
+        '#: i = i + 1',
+        '#: endwhile',
+        '#: n = 3',
+        '#: while i >= n',
+        '#: i = i - 2',
+        'down $i',
+        '#: endwhile',
+        '#: while i <= n',
+        '#: i = i + 1',
+        '#: if i == 3',
+        '#: break',
+        '#: endif',
+        '#: endwhile',
+        'after $i',
+    ],
+    'counting_loop_with_float_counter': [
+        '#: i = 7 / 2',
+        '#: while i < 6',
+        '#: i = i + 1',
+        '$i',
+        '#: endwhile',
+    ],
+    'counting_loop_with_unknown_counter': [
+        '#: while k < 3',
+        '#: k = k + 1',
+        '#: endwhile',
+    ],
+    'counting_loop_max_loop_runs': [
+        '#: i = 0',
+        '#: while i < 20000',
+        '#: i = i + 1',
+        '#: endwhile',
+    ],
+    'counting_loop_wrong_direction': [
+        '#: i = 0',
+        '#: while i < 5',
+        '#: i = i - 1',
+        '#: endwhile',
+    ],
+    'counter_changed_twice': [
+        '#: i = 0',
+        '#: while i < 10',
+        '#: if i == 2',
+        '#: i = i + 5',
+        '#: endif',
+        '#: i = i + 1',
+        '$i',
+        '#: endwhile',
+    ],
+    'invariants': [
+        '#: items = [1, 2, 3]',
+        '#: name = "abc"',
+        '#: i = 0',
+        '#: while i < size(items)',
+        '#: label = uppercase(name) + "-"',
+        '$label$i',
+        '#: i = i + 1',
+        '#: endwhile',
+        '#: for item in items',
+        '#: j = 0',
+        '#: name = name + "d"',
+        '#: while j < size(name) - 3',
+        '$item $j $name',
+        '#: j = j + 1',
+        '#: endwhile',
+        '#: endfor',
+    ],
+    'invariant_list_is_changed': [
+        '#: items = [1]',
+        '#: alias = items',
+        '#: i = 0',
+        '#: while i < size(alias)',
+        '#: items += i',
+        '#: i = i + 1',
+        '#: if i > 5',
+        '#: break',
+        '#: endif',
+        '#: endwhile',
+        '$i',
+    ],
+    'invariant_with_mutable_value': [
+        '#: pair = [1, 2]',
+        '#: i = 0',
+        '#: while i < 3',
+        '#: x = pair + pair',
+        '#: x += i',
+        '$x',
+        '#: i = i + 1',
+        '#: endwhile',
+    ],
+    'invariant_raises': [
+        '#: i = 0',
+        '#: while i < size(5)',
+        '#: i = i + 1',
+        '#: endwhile',
+    ],
+}
+
+
+def parse(text):
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    tree = Parser(ENGINES['classic'](ctx), ctx).parse()
+    return ctx, tree
+
+
+def run(interpreter_class, text, optimize):
+    ctx, tree = parse(text)
+
+    if optimize:
+        tree = merge_content_lines(Optimizer().optimize(tree))
+
+    interpreter = interpreter_class(ctx)
+
+    try:
+        interpreter.interpret(tree)
+        error = None
+    except Exception as e:
+        error = '{0}: {1}'.format(type(e).__name__, e)
+
+    return interpreter.get_parsed_template(), dict(ctx.get_all()), error
+
+
+def assert_same(text):
+    expected = run(Interpreter, text, False)
+
+    assert run(Interpreter, text, True) == expected
+    assert run(CompilingInterpreter, text, True) == expected
+
+    return expected
+
+
+def statements(block):
+    return [child.statement if type(child) is CommandLine else child for child in block.children]
+
+
+@pytest.mark.parametrize('name', sorted(TEMPLATES.keys()))
+def test_templates(name):
+    assert_same('\n'.join(TEMPLATES[name]))
+
+
+def test_constant_folding():
+    ctx, tree = parse('\n'.join(TEMPLATES['folding']))
+    Optimizer().optimize(tree)
+
+    values = [node.value for node in statements(tree.main_block)[0:3]]
+    assert all(type(value) is Constant for value in values)
+    assert [value.value for value in values] == [6, 'xy', 3.5]
+
+    ctx, tree = parse('\n'.join(TEMPLATES['errors_are_not_folded']))
+    Optimizer().optimize(tree)
+    assert type(statements(tree.main_block)[0].value) is SimpleExpression
+
+
+def test_dead_branches_are_removed():
+    ctx, tree = parse('\n'.join(TEMPLATES['dead_branches']))
+    Optimizer().optimize(tree)
+
+    nodes = statements(tree.main_block)
+    assert [type(node) for node in nodes] == [ContentLine, ContentLine, IFBlock]
+    assert [node.content for node in nodes[0:2]] == ['else', 'always']
+    assert nodes[2]._else is None
+
+
+def test_noops_are_removed():
+    ctx, tree = parse('\n'.join(TEMPLATES['noops']))
+    Optimizer().optimize(tree)
+
+    assert [type(node) for node in statements(tree.main_block)] == [Assignment, Assignment, ContentLine]
+
+
+def test_noop_is_kept_if_break_flag_may_be_set():
+    ctx, tree = parse('\n'.join(TEMPLATES['break_flag_before_noop']))
+    Optimizer().optimize(tree)
+
+    ifblock = statements(statements(tree.main_block)[1].block)[0]
+    assert [type(node) for node in statements(ifblock._if[1].block)] == [NoOp, ContentLine]
+
+
+def test_extension_builtins():
+    ctx, tree = parse('#: if Yes\nyes\n#: else\nno\n#: endif')
+    Optimizer().optimize(tree, OptimizerContext({'Yes': True, 'No': False}))
+
+    assert [type(node) for node in statements(tree.main_block)] == [ContentLine]
+
+
+def test_custom_pipeline():
+    ctx, tree = parse('#: if True\nyes\n#: endif')
+    Optimizer([ConstantFolding()]).optimize(tree)
+
+    ifblock = statements(tree.main_block)[0]
+    assert type(ifblock) is IFBlock
+    assert type(ifblock._if[0].condition) is Constant
+
+
+def test_loops():
+    ctx, tree = parse('\n'.join(TEMPLATES['invariants']))
+    Optimizer().optimize(tree)
+
+    nodes = statements(tree.main_block)
+    loop = nodes[3]
+    assert type(loop) is CountingWhile
+    assert (loop.counter, loop.op, loop.step) == ('i', '<', 1)
+    assert type(loop.bound) is Invariant
+    assert len(loop.invariants) == 2
+
+    # name changes in the for loop, so size(name) - 3 belongs to the while loop
+    inner = statements(nodes[4].block)[2]
+    assert type(inner) is CountingWhile
+    assert nodes[4].invariants == [] and len(inner.invariants) == 1
+
+    for name in ('invariant_list_is_changed', 'counter_changed_twice', 'counting_loop_wrong_direction'):
+        ctx, tree = parse('\n'.join(TEMPLATES[name]))
+        Optimizer().optimize(tree)
+
+        assert not any(type(node) in (CountingWhile, Invariant) for node in iter_nodes(tree)), name
+
+
+def test_loops_calling_extension_functions():
+    class Extension:
+        @staticmethod
+        def size(args, ctx):
+            ctx.set('i', 10)
+            return 5
+
+    text = '#: i = 0\n#: while i < size("abc")\n#: i = i + 1\n#: endwhile'
+    ctx, tree = parse(text)
+    Optimizer().optimize(tree, OptimizerContext(lookup_modules=[Extension]))
+
+    assert type(statements(tree.main_block)[1]) is While
+    assert not any(type(node) is Invariant for node in iter_nodes(tree))
+
+
+def test_deeply_nested_templates():
+    text = '\n'.join(['#: if True'] * 2000 + ['deep'] + ['#: endif'] * 2000)
+    assert_same(text)
+
+
+def test_static_lines_are_merged():
+    ctx, tree = parse('\n'.join(['a', 'b', '$x', 'c', '#: x = 1', 'd', 'e', '#::', '-> "f"', '-> "g"', '#::']))
+    merge_content_lines(tree)
+
+    nodes = statements(tree.main_block)
+    # output expressions without variables are static lines as well
+    assert [type(node) for node in nodes] == [TextRun, ContentLine, ContentLine, Assignment, TextRun]
+    assert [nodes[0].lines, nodes[4].lines] == [('a', 'b'), ('d', 'e', 'f', 'g')]
+
+
+def test_first_line_is_kept_if_break_flag_may_be_set():
+    text = '\n'.join(['#: for item in pair', '#: while True', 'a', 'b', 'c', '#: break', '#: endwhile',
+                      'd', 'e', '#: endfor'])
+    ctx, tree = parse(text)
+    merge_content_lines(tree)
+
+    loop = statements(tree.main_block)[0]
+    assert [type(node) for node in statements(loop.block)] == [While, TextRun]
+    assert [type(node) for node in statements(statements(loop.block)[0].block)] == [ContentLine, TextRun, Break]
+
+    assert_same('#: pair = [1, 2]\n' + text)
+
+
+def random_template(rnd, depth=0):
+    lines = []
+    conditions = ['True', 'False', 'None', '1 < 2', '"a" == "b"', 'v0 > 1', 'v1 == 1', 'v2 != v0']
+
+    for i in range(0, rnd.randint(1, 5)):
+        choice = rnd.randint(0, 9 if depth < 3 else 3)
+
+        if choice == 0:
+            lines.append(rnd.choice(['line $v0', '#:', '#: v0 = v0 + 1', '#: v1 = 2 * 3', '#: items += v2',
+                                 '#: x = size(pair) + v1', '#: name = uppercase("ab")', 'static', 'price: 5$']))
+        elif choice == 1:
+            lines.append('#: v{0} = v{1} + {2}'.format(rnd.randint(0, 2), rnd.randint(0, 2), rnd.randint(0, 3)))
+        elif choice == 2:
+            lines.append('line $v{0}'.format(rnd.randint(0, 2)))
+        elif choice == 3:
+            lines.append('#: break')
+        elif choice in (4, 5, 6):
+            lines.append('#: if {0}'.format(rnd.choice(conditions)))
+            lines += random_template(rnd, depth + 1)
+
+            for j in range(0, rnd.randint(0, 2)):
+                lines.append('#: elseif {0}'.format(rnd.choice(conditions)))
+                lines += random_template(rnd, depth + 1)
+
+            if rnd.randint(0, 1):
+                lines.append('#: else')
+                lines += random_template(rnd, depth + 1)
+
+            lines.append('#: endif')
+        elif choice == 7:
+            lines.append('#: for item in pair')
+            lines += random_template(rnd, depth + 1)
+            lines.append('#: endfor')
+        else:
+            lines.append('#: guard{0} = 0'.format(depth))
+            bound = rnd.choice(['< 2', '<= limit', '< size(pair)', '< False'])
+            lines.append('#: while guard{0} {1}'.format(depth, bound))
+            increment = '#: guard{0} = guard{0} + 1'.format(depth)
+            body = random_template(rnd, depth + 1)
+
+            # the counter is changed at the start or at the end of the body
+            position = rnd.choice([0, len(body)])
+            lines += body[:position] + [increment] + body[position:]
+            lines.append('#: endwhile')
+
+    return lines
+
+
+@pytest.mark.parametrize('seed', range(0, 200))
+def test_random_templates(seed):
+    rnd = random.Random(seed)
+    lines = ['#: v0 = 0', '#: v1 = 1', '#: v2 = 2', '#: pair = [3, 4]', '#: items = []', '#: limit = 1'] + random_template(rnd)
+
+    assert_same('\n'.join(lines))
+
+
+def test_frontend_optimizer(parser_inst):
+    text = '\n'.join(TEMPLATES['dead_branches'])
+
+    expected = parser_inst.parse(text)
+    parser_inst.set_optimize(True)
+    assert parser_inst.parse(text) == expected
@@ -0,0 +1,95 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import pytest
+
+from contemply.exceptions import ParserError
+from contemply.parallel import parse_parallel, chunk_bounds
+from contemply.parser import TemplateContext, Parser
+from contemply.scanner import split_file_blocks
+from contemply.tokenizer import ENGINES
+
+
+def parse_sequential(text):
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    return Parser(ENGINES['classic'](ctx), ctx).parse()
+
+
+def scaffold(files):
+    text = []
+    for i in range(0, files):
+        text += [
+            '#: >> "file_{0}.py"'.format(i),
+            '#: name = "item_{0}"'.format(i),
+            '#: if name != ""',
+            '#: >> "nested_{0}.py"'.format(i),
+            'class $name:',
+            '#: endif',
+            '#::',
+            'for item in items',
+            '>> "command_block_{0}.py"'.format(i),
+            'endfor',
+            '#::',
+            '    pass',
+            '#: <<',
+        ]
+
+    return '\n'.join(text)
+
+
+def test_split_file_blocks():
+    text = scaffold(3)
+    starts = split_file_blocks(text)
+
+    assert starts == [0] + [text.index('#: >> "file_{0}.py"'.format(i)) for i in (1, 2)]
+    assert split_file_blocks('Content\n#: if True\n#: >> "a"\n#: endif') == [0]
+
+    # "cache" as a variable name does not start a block
+    text = '#: cache = "x"\n#: >> "a"\n#: cache "k"\n#: endcache\n#: >> "b"'
+    assert split_file_blocks(text) == [0, text.index('#: >> "a"'), text.index('#: >> "b"')]
+
+
+def test_chunk_bounds():
+    assert chunk_bounds([0, 10, 20, 30], 40, 4, min_size=10) == [0, 10, 20, 30]
+    assert chunk_bounds([0, 10, 20, 30], 40, 2, min_size=10) == [0, 20]
+    assert chunk_bounds([0, 10, 20, 30], 40, 4, min_size=100) == [0]
+
+
+@pytest.mark.parametrize('engine', list(ENGINES.keys()))
+def test_parallel_ast_equals_sequential(engine, ast_dump):
+    text = scaffold(40)
+    ctx = TemplateContext()
+    ctx.set_text(text)
+
+    tree = parse_parallel(ctx, engine, max_workers=4, min_chunk_size=1)
+
+    assert ast_dump(tree) == ast_dump(parse_sequential(text))
+
+
+def test_parallel_error_line():
+    text = scaffold(20).split('\n')
+    text.insert(150, '#: if "unclosed')
+    text = '\n'.join(text)
+
+    ctx = TemplateContext()
+    ctx.set_text(text)
+
+    with pytest.raises(ParserError) as e:
+        parse_parallel(ctx, max_workers=4, min_chunk_size=1)
+
+    assert 'line 151' in str(e.value)
+    assert '#: if "unclosed' in str(e.value)
+
+
+def test_frontend_parallel(parser_inst):
+    text = '#: items = ["a", "b"]\n' + scaffold(10) + '\nDone'
+
+    expected = parser_inst.parse(text)
+    parser_inst.set_parallel(True, 2)
+
+    assert parser_inst.parse(text) == expected
@@ -230,3 +230,44 @@ def test_output_jnside_commandblock(parser_inst):
 
     assert result['demo.txt'] == ['Hello World']
     assert result['demo2.txt'] == ['Foo bar']
+
+
+def test_ast_nodes_are_slotted():
+    import inspect
+    from contemply import ast
+    from contemply.tokenizer import Token
+
+    for name, cls in inspect.getmembers(ast, inspect.isclass):
+        if issubclass(cls, ast.AST):
+            assert '__slots__' in cls.__dict__, name
+
+    assert not hasattr(ast.ContentLine('demo'), '__dict__')
+    assert not hasattr(Token('EOF'), '__dict__')
+
+
+def test_interpreter_subclass_overrides():
+    from contemply.parser import TemplateContext, Parser
+    from contemply.tokenizer import ENGINES
+
+    class UppercaseInterpreter(Interpreter):
+        OPERATORS = dict(Interpreter.OPERATORS, **{'+': lambda a, b: '{0}|{1}'.format(a, b)})
+
+        def visit_contentline(self, node):
+            self._add_content_line(node.content.upper())
+
+        def _internal_func_shout(self, args):
+            self._add_content_line(args[0] + '!')
+
+    ctx = TemplateContext()
+    ctx.set_text('#: a = 1 + 2\nhello $a\n#: shout("hey")\n#: output("$a")')
+
+    for interpreter_class, expected in ((UppercaseInterpreter, ['HELLO $A', 'hey!', '1|2']),
+                                        (Interpreter, ['hello 3'])):
+        interpreter = interpreter_class(ctx)
+
+        try:
+            interpreter.interpret(Parser(ENGINES['classic'](ctx), ctx).parse())
+        except ParserError as e:
+            assert 'Unknown function: shout' in str(e)
+
+        assert interpreter.get_parsed_template()[Interpreter.DEFAULT_TARGET] == expected
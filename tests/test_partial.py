@@ -0,0 +1,182 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import os
+import pytest
+
+import contemply.cli as cli
+from contemply.ast import *
+from contemply.compiler import CompilingInterpreter
+from contemply.interpreter import Interpreter
+from contemply.optimizer import iter_nodes
+from contemply.parser import TemplateContext, Parser
+from contemply.partial import specialize, inline_variables
+from contemply.tokenizer import ENGINES
+
+SAMPLES = os.path.join(os.path.dirname(__file__), '..', 'src', 'contemply', 'samples')
+
+SCAFFOLD = '\n'.join([
+    '#: author = ask("Author?")',
+    '#: license = choose("License?", ["MIT", "GPL"])',
+    '#: year = 2019',
+    '#: name = ask("Name?")',
+    '#: title = uppercase(license)',
+    'Copyright $year $author',
+    '#: if license == "MIT"',
+    'MIT License for $name by $author',
+    '#: else',
+    'GPL',
+    '#: endif',
+    '$title$name $author[0]',
+])
+
+ANSWERS = {'Author?': 'Jane', 'License?': '1', 'Name?': 'demo', 'Your choice': '1'}
+
+
+@pytest.fixture()
+def answers(monkeypatch):
+    asked = []
+
+    def user_input(prompt):
+        for question, answer in sorted(ANSWERS.items()):
+            if question in prompt:
+                asked.append(question)
+                return answer
+
+        asked.append(prompt)
+        return ''
+
+    monkeypatch.setattr(cli, 'user_input', user_input)
+    monkeypatch.setattr(cli, 'prompt', lambda question, default='Yes': True)
+    monkeypatch.setattr(os, 'getcwd', lambda: '/nonexistent')
+
+    return asked
+
+
+def parse(text):
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    return ctx, Parser(ENGINES['classic'](ctx), ctx).parse()
+
+
+def run(text, bindings=None, interpreter_class=Interpreter):
+    ctx, tree = parse(text)
+
+    if bindings is not None:
+        specialize(tree, bindings)
+
+    interpreter = interpreter_class(ctx)
+    interpreter.interpret(tree)
+
+    return interpreter.get_parsed_template(), dict(ctx.get_all())
+
+
+def test_specialized_output(answers):
+    expected = run(SCAFFOLD)
+    assert answers == ['Author?', 'Your choice', 'Name?']
+
+    for interpreter_class in (Interpreter, CompilingInterpreter):
+        del answers[:]
+        assert run(SCAFFOLD, {'author': 'Jane', 'license': 'MIT'}, interpreter_class) == expected
+        assert answers == ['Name?']
+
+
+def test_residual_template():
+    ctx, tree = parse(SCAFFOLD)
+    specialize(tree, {'author': 'Jane', 'license': 'MIT'})
+
+    nodes = [node for node in iter_nodes(tree) if type(node) in (ContentLine, IFBlock)]
+    assert [node.content for node in nodes] == [
+        'Copyright 2019 Jane',
+        'MIT License for $name by Jane',
+        # inlining $title would make $name a variable
+        '$title$name $author[0]',
+    ]
+
+    calls = [node.name for node in iter_nodes(tree) if type(node) is Function]
+    assert calls == ['ask']
+
+
+def test_variables_that_change_are_not_inlined(answers):
+    text = '\n'.join([
+        '#: author = ask("Author?")',
+        'first $author',
+        '#: if yesno("Again?")',
+        '#: author = ask("Author?")',
+        '#: endif',
+        'second $author',
+        '#: items = ["a"]',
+        '#: for author in items',
+        '#: endfor',
+    ])
+    ctx, tree = parse(text)
+    specialize(tree, {'author': 'Jane'})
+
+    assert [node.content for node in iter_nodes(tree) if type(node) is ContentLine] == ['first $author',
+                                                                                        'second $author']
+    assert 'Author?' not in answers
+    assert run(text, {'author': 'Jane'})[0] == {'__default__': ['first Jane', 'second Jane']}
+
+
+def test_variables_are_not_inlined_before_their_assignment():
+    ctx, tree = parse('#: if license == "MIT"\nmit\n#: endif\n#: license = "GPL"\n$license')
+    specialize(tree, {'license': 'MIT'})
+
+    nodes = list(iter_nodes(tree))
+    assert IFBlock in [type(node) for node in nodes]
+    assert [node.content for node in nodes if type(node) is ContentLine] == ['mit', 'MIT']
+
+
+def test_list_bindings():
+    assert run('#: deps = ask("Deps?")\n#: deps += "b"\n$deps[0] $deps[1]', {'deps': ['a']})[0] == \
+        {'__default__': ['a b']}
+
+    with pytest.raises(ValueError):
+        specialize(parse('#: x = 1')[1], {'x': {'a': 1}})
+
+
+def test_inline_variables():
+    assert inline_variables('$a $b', {'a': 1}) == '1 $b'
+    assert inline_variables('$a$b', {'b': 1}) == '$a$b'
+    assert inline_variables('$a[1]', {'a': 'x'}) == 'x'
+    assert inline_variables('$a', {'a': 'price in $b'}) == '$a'
+    assert inline_variables('no variables', {'a': 'x'}) == 'no variables'
+
+
+def test_sample(answers, monkeypatch):
+    with open(os.path.join(SAMPLES, 'setup.pytpl'), 'r') as f:
+        text = f.read()
+
+    questions = {'name of your app': 'demo', 'version of your app': '1.0', "author's name": 'Jane',
+                 'email-address': 'jane@example.com', 'homepage url': 'https://example.com', 'keywords': 'demo',
+                 'short description': 'A demo'}
+
+    for question, answer in questions.items():
+        monkeypatch.setitem(ANSWERS, question, answer)
+
+    expected = run(text)
+
+    bindings = {'name': 'demo', 'version': '1.0', 'author': 'Jane', 'email': 'jane@example.com',
+                'url': 'https://example.com', 'keywords': 'demo', 'desc': 'A demo', 'has_readme': True,
+                'status': 'Development Status :: 4 - Beta'}
+
+    del answers[:]
+    assert run(text, bindings) == expected
+
+    # only the dependencies are asked for
+    assert all('dependency' in question for question in answers)
+
+
+def test_frontend_bindings(parser_inst, answers, monkeypatch):
+    parser_inst.set_bindings({'author': 'Jane', 'license': 'MIT'})
+    result = parser_inst.parse(SCAFFOLD)
+
+    assert result['__default__'][0:2] == ['Copyright 2019 Jane', 'MIT License for demo by Jane']
+    assert answers == ['Name?']
+
+    with pytest.raises(ValueError):
+        parser_inst.set_bindings({'author': object()})
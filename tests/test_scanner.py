@@ -0,0 +1,84 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+from contemply.exceptions import ParserError
+from contemply.interpreter import Interpreter
+from contemply.scanner import *
+import io, os, pytest
+
+
+def test_classify_line():
+    assert classify_line('Hello world') == LINE_CONTENT
+    assert classify_line('# Python comment') == LINE_CONTENT
+    assert classify_line('    #: indented') == LINE_CONTENT
+    assert classify_line('') == LINE_CONTENT
+    assert classify_line('#: var = 1') == LINE_COMMAND
+    assert classify_line('#:') == LINE_COMMAND
+    assert classify_line('#::') == LINE_BLOCK_TOGGLE
+    assert classify_line('#% comment') == LINE_COMMENT
+
+
+def test_scan_lines():
+    lines = list(scan_lines('#: a = 1\ncontent\n#::\n'))
+
+    assert lines == [
+        (LINE_COMMAND, '#: a = 1', 0, False),
+        (LINE_CONTENT, 'content', 9, False),
+        (LINE_BLOCK_TOGGLE, '#::', 17, False),
+        (LINE_CONTENT, '', 21, True),
+    ]
+
+
+def test_content_lines_are_kept_verbatim(parser_inst):
+    text = [
+        '#: name = "World"',
+        '    #: not a command',
+        '\tHello $name (#%)',
+        '',
+    ]
+
+    result = parser_inst.parse('\n'.join(text))[Interpreter.DEFAULT_TARGET]
+    assert result == ['    #: not a command', '\tHello World (#%)', '']
+
+
+def test_scan_stream_matches_scan_lines():
+    for text in ['', '\n', 'a\nb', 'a\n#: b = 1\n', '#::\n\n#% c\n#::']:
+        assert list(scan_stream(io.StringIO(text))) == list(scan_lines(text))
+
+
+def test_streaming_parse_file(tmpdir, parser_inst):
+    testfile = os.path.join(str(tmpdir), 'demo.pytpl')
+
+    with open(testfile, 'w') as f:
+        f.write('\n'.join([
+            '#: items = ["a", "b"]',
+            '#: for item in items',
+            'Item $item',
+            '#: endfor',
+            ''
+        ]))
+
+    expected = parser_inst.parse_file(testfile)
+
+    parser_inst.set_streaming(True)
+    assert parser_inst.parse_file(testfile) == expected
+    assert parser_inst.get_template_context().text() == ''
+
+
+def test_streaming_error_line(tmpdir, parser_inst):
+    testfile = os.path.join(str(tmpdir), 'demo.pytpl')
+
+    with open(testfile, 'w') as f:
+        f.write('Hello\n#: a = 1\n#: b = a +* 2\nWorld')
+
+    parser_inst.set_streaming(True)
+
+    with pytest.raises(ParserError) as e:
+        parser_inst.parse_file(testfile)
+
+    assert str(e.value).split('\n')[:2] == ['ParserError in demo.pytpl, line 3, col 12: Unexpected right value: MULT',
+                                            '#: b = a +* 2']
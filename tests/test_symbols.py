@@ -0,0 +1,110 @@
+#
+# Contemply - A code generator that creates boilerplate files from templates
+#
+# Copyright (C) 2019  Sean Mertiens
+# For more information on licensing see LICENSE file
+#
+
+import logging
+import types
+import pytest
+
+import contemply.functions
+from contemply.exceptions import ParserError
+from contemply.interpreter import Interpreter
+from contemply.symbols import FunctionTable
+
+
+def make_module(name, **functions):
+    module = types.ModuleType(name)
+
+    for func_name, value in functions.items():
+        setattr(module, func_name, lambda args, ctx, value=value: value)
+
+    module.not_a_function = 'text'
+    return module
+
+
+def test_precedence():
+    first = make_module('first', shared='first', only_first='only')
+    second = make_module('second', shared='second')
+    table = FunctionTable([contemply.functions, first, second], ['output'])
+
+    assert table.resolve('shared')([], None) == 'second'
+    assert table.resolve('only_first')([], None) == 'only'
+    assert table.resolve('uppercase') is contemply.functions.uppercase
+    assert table.get_module('shared') is second
+    assert table.get_modules() == [contemply.functions, first, second]
+
+    assert table.resolve('not_a_function') is None
+    assert table.resolve('__name__') is None
+    assert table.resolve('missing') is None
+
+
+def test_shadowed():
+    first = make_module('first', uppercase='first', output='first')
+    second = make_module('second', uppercase='second')
+    table = FunctionTable([contemply.functions, first, second], Interpreter.get_internal_functions())
+
+    assert table.get_shadowed() == [
+        ('uppercase', 'contemply.functions', 'first'),
+        ('uppercase', 'first', 'second'),
+        ('output', 'first', '<internal>'),
+    ]
+
+    # the same function imported into another module is not shadowed
+    assert FunctionTable([contemply.functions, make_module('third')]).get_shadowed() == []
+    third = types.ModuleType('third')
+    third.size = contemply.functions.size
+    assert FunctionTable([contemply.functions, third]).get_shadowed() == []
+
+
+def test_register_lookup_modules(parser_inst, caplog):
+    with caplog.at_level(logging.INFO):
+        parser_inst.register_lookup_module(make_module('first', uppercase='first', greet='hi'))
+        parser_inst.register_lookup_module(make_module('second', greet='hello'))
+
+    result = parser_inst.parse('#: a = uppercase("x")\n#: b = greet()\n#: output("x")\n$a $b')
+    assert result['__default__'] == ['x', 'first hello']
+
+    assert parser_inst.get_shadowed_functions() == [('uppercase', 'contemply.functions', 'first'),
+                                                    ('greet', 'first', 'second')]
+    assert caplog.messages == ['Function uppercase() of contemply.functions is shadowed by first',
+                               'Function greet() of first is shadowed by second']
+
+
+def test_calls_are_resolved_once(parser_inst):
+    module = make_module('extension', greet='hi')
+    parser_inst.register_lookup_module(module)
+    parser_inst.parse('#: a = greet()')
+
+    # functions are resolved when the modules are registered
+    module.greet = lambda args, ctx: 'changed'
+    module.late = lambda args, ctx: 'late'
+
+    parser_inst.parse('#: a = greet()')
+    assert parser_inst.get_template_context().get('a') == 'hi'
+
+    with pytest.raises(ParserError, match='Unknown function: late'):
+        parser_inst.parse('#: a = late()')
+
+
+def test_add_function_lookup():
+    from contemply.parser import TemplateContext, Parser
+    from contemply.tokenizer import ENGINES
+
+    ctx = TemplateContext()
+    ctx.set_text('#: a = greet()')
+    tree = Parser(ENGINES['classic'](ctx), ctx).parse()
+
+    interpreter = Interpreter(ctx)
+
+    with pytest.raises(ParserError):
+        interpreter.interpret(tree)
+
+    # the inline caches are cleared with the new symbol table
+    interpreter.add_function_lookup(make_module('extension', greet='hi'))
+    interpreter.interpret(tree)
+
+    assert ctx.get('a') == 'hi'
+    assert interpreter.get_function_table().get_modules()[0] is contemply.functions
@@ -55,3 +55,35 @@ def test_listvar():
     assert ctx.process_variables('$myvar[0]') == 'item 1'
     assert ctx.process_variables('$myvar[1]') == 'item 2'
     assert ctx.process_variables('$myvar') == "['item 1', 'item 2']"
+
+
+def test_line_index():
+    ctx = TemplateContext()
+    ctx.set_text('first\nsecond line\n\nlast')
+
+    assert ctx.line_starts() == [0, 6, 18, 19]
+
+    ctx.set_pos(9)
+    assert ctx.line() == 1
+    assert ctx.line_pos() == 3
+    assert ctx.line_text() == 'second line'
+
+    ctx.set_pos(19)
+    assert ctx.line() == 3
+    assert ctx.line_text() == 'last'
+    assert ctx.line_text(2) == ''
+
+    ctx.set_position(1, 7)
+    assert ctx.pos() == 13
+    assert ctx.line_pos() == 7
+
+
+def test_exception_shows_source_line():
+    ctx = TemplateContext()
+    ctx.set_text('#: a = 1\n#: b = a +* 2')
+    ctx.set_pos(20)
+
+    lines = str(ParserError('Demo', ctx)).split('\n')
+    assert lines[0] == 'ParserError in , line 2, col 12: Demo'
+    assert lines[1] == '#: b = a +* 2'
+    assert lines[2] == '           ^'
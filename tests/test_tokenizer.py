@@ -7,6 +7,7 @@
 
 from contemply.tokenizer import *
 from contemply.parser import TemplateContext
+import pytest
 
 
 def test_token_detection():
@@ -28,3 +29,107 @@ def test_token_detection():
 
     assert actual == expected
 
+
+def _tokenize(engine, text):
+    ctx = TemplateContext()
+    ctx.set_text(text)
+    t = engine(ctx)
+
+    tokens = []
+    token = t.get_next_token()
+
+    while token.type() != EOF:
+        tokens.append((token.type(), token.value()))
+        token = t.get_next_token()
+
+    return tokens
+
+
+def test_regex_engine_same_tokens():
+    lines = [
+        '#: demo = "Hello World"',
+        '#:: ',
+        '#% comment',
+        "if var1 == 'Hello'",
+        'elseif var1 != 10',
+        'else',
+        'endif',
+        'while num <= 5 + 3 - 1',
+        'endwhile',
+        'for item in list',
+        'break',
+        'endfor',
+        'cache "key"',
+        'endcache',
+        'cache = endcache',
+        'items += [1, "two", three]',
+        'res = a * b / c',
+        'test = a >= b',
+        'test = a < b',
+        '>> "demo.txt", True',
+        '-> "Foo $var"',
+        '<<',
+    ]
+    text = '\n'.join(lines)
+
+    assert _tokenize(RegexTokenizer, text) == _tokenize(Tokenizer, text)
+
+
+def test_regex_engine_spans():
+    ctx = TemplateContext()
+    ctx.set_text('#: name = "demo"')
+    t = RegexTokenizer(ctx)
+
+    assert [tok.span() for tok in t.find_all()] == [(0, 2), (3, 7), (8, 9), (10, 16)]
+
+
+def test_regex_engine_peek():
+    ctx = TemplateContext()
+    ctx.set_text('    #: indented\n#: cmd')
+    t = RegexTokenizer(ctx)
+
+    # whitespace is not skipped when peeking, so indented lines are no command lines
+    assert t.get_next_token(True).type() is None
+    t.skip_until('\n')
+    assert t.get_next_token().type() == NEWLINE
+    assert t.get_next_token(True).type() == CMD_LINE_START
+    assert t.get_next_token().type() == CMD_LINE_START
+
+
+def test_regex_engine_whole_word_keywords():
+    assert _tokenize(RegexTokenizer, 'format = iffy') == [(SYMBOL, 'format'), (ASSIGN, '='), (SYMBOL, 'iffy')]
+
+
+def test_regex_engine_errors():
+    with pytest.raises(SyntaxError):
+        _tokenize(RegexTokenizer, '#: var = "unterminated')
+
+    with pytest.raises(SyntaxError):
+        _tokenize(RegexTokenizer, '#: var = $')
+
+
+@pytest.mark.parametrize('engine', ENGINES.values())
+def test_unrecognized_tokens(engine):
+    # a "!" has to be followed by "="
+    with pytest.raises(SyntaxError, match="Unrecognized token '!'"):
+        _tokenize(engine, '#: a = !x')
+
+    assert _tokenize(engine, 'a != b') == [(SYMBOL, 'a'), (COMP_NOT_EQ, '!='), (SYMBOL, 'b')]
+
+
+def test_parser_engines_equivalent(parser_inst):
+    text = [
+        '#: items = ["a", "b"]',
+        '#: for item in items',
+        '#: if item == "a"',
+        'First $item',
+        '#: else',
+        'Other $item',
+        '#: endif',
+        '#: endfor',
+    ]
+
+    expected = parser_inst.parse('\n'.join(text))
+
+    parser_inst.set_tokenizer_engine('regex')
+    assert parser_inst.parse('\n'.join(text)) == expected
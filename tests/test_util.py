@@ -42,3 +42,44 @@ def test_check_function_types():
 
     with pytest.raises(Exception):
         util.check_function_args(['myfunc', 'int', '*bool'], [23, 'True'])
+
+def test_check_function_messages():
+    with pytest.raises(Exception, match=r'myfunc\(\) expects at least 2 arguments.'):
+        util.check_function_args(['myfunc', 'str', 'str'], ['hello'])
+
+    with pytest.raises(Exception, match=r'myfunc\(\) accepts a maximum of 1 arguments'):
+        util.check_function_args(['myfunc', 'str'], ['hello', 'world'])
+
+    with pytest.raises(Exception, match=r'myfunc\(\) expected str, list as argument number 1'):
+        util.check_function_args(['myfunc', 'str', '*str, list'], ['hello', 1])
+
+    with pytest.raises(Exception, match='After an optional argument'):
+        util.check_function_args(['myfunc', '*str', 'str'], ['hello'])
+
+def test_signature():
+    signature = util.get_signature(['myfunc', 'int', '*str, list'])
+
+    assert signature is util.get_signature(['myfunc', 'int', '*str, list'])
+    assert (signature.name, signature.required, signature.labels) == ('myfunc()', 1, ('int', 'str, list'))
+    assert signature.types == (frozenset([int]), frozenset([str, list]))
+
+    signature.check([1])
+    signature.check([1, []])
+
+    with pytest.raises(Exception):
+        signature.check([True])
+
+def test_signature_decorator():
+    @util.signature('str', '*int', returns='str')
+    def repeat(args, ctx):
+        return args[0] * (args[1] if len(args) == 2 else 2)
+
+    assert repeat(['a'], None) == 'aa'
+    assert repeat.__name__ == 'repeat'
+    assert repeat.signature.returns is str
+
+    with pytest.raises(Exception, match=r'repeat\(\) expected int as argument number 1'):
+        repeat(['a', 'b'], None)
+
+    # calls that are known to be correct skip the check
+    assert repeat.unchecked(['a', 3], None) == 'aaa'